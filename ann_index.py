@@ -0,0 +1,350 @@
+"""
+Büyük derlemler için yaklaşık en yakın komşu (ANN) ve sıkıştırılmış vektör indeksleri.
+Kesin (flat, float32) FAISS indeksi her zaman doğruluk kaynağı olarak saklanır; derlem belirli bir boyutu
+geçtiğinde veya açıkça istendiğinde aynı vektör sırasıyla bir arama indeksi de üretilir ve aramalar onun
+üzerinden yapılır. Arama indeksi IVF, HNSW veya IVF-PQ olabilir; vektörleri float16/int8 olarak saklayabilir
+ve öncesinde PCA ile boyut düşürebilir. Kayıplı indekslerde ilk adaylar, mmap ile açılan tam vektörlerle
+yeniden puanlanır (rescoring), böylece bellekte sadece sıkıştırılmış vektörler tutulur.
+Vektör sırası aynı olduğu için docstore eşlemesi iki indeks için de geçerlidir.
+Her üretimde kesin indekse karşı recall@k ölçülüp manifest'e yazılır. Parametre taraması ve
+bellek/örtüşme karşılaştırması için (varsayılan isim alanı; --app-session ile Streamlit oturumu,
+--namespace ile başka bir koleksiyon veya doğrudan bir derlem dizini):
+
+    python ann_index.py --nprobe 4 8 16 32 --ef-search 32 64 128
+    python ann_index.py --app-session --compare
+    python ann_index.py vectordb/corpora/<derlem_anahtarı> --compare
+"""
+import argparse
+import json
+import math
+import os
+import time
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("auto", "flat", "ivf", "hnsw", "ivfpq")
+COMPRESSIONS = (None, "float16", "int8")
+_SQ_CODES = {"float16": "SQfp16", "int8": "SQ8"}
+DEFAULT_INDEX_TYPE = "auto"
+# "auto" seçiminde eşikler (chunk sayısı): altında kesin arama yeterince hızlıdır.
+ANN_MIN_VECTORS = 200_000
+PQ_MIN_VECTORS = 1_000_000
+# Eğitim örneklemi: IVF merkez başına, PQ ise alt kuantizör başına bu kadar vektör ister.
+TRAIN_POINTS_PER_CENTROID = 64
+PQ_MIN_TRAIN_VECTORS = 10_000
+PQ_MAX_SUBQUANTIZERS = 64
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+# Arama parametreleri: nprobe (IVF'de taranan küme sayısı) ve efSearch (HNSW aday listesi) arttıkça
+# recall artar, arama yavaşlar.
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+# Kayıplı indekslerde k*RESCORE_K_FACTOR aday tam vektörlerle yeniden puanlanır.
+DEFAULT_RESCORE_K_FACTOR = 4
+RECALL_K = 10
+RECALL_QUERIES = 200
+# Eğitilmiş boş indeks, derlem eğitimdeki boyutunun bu katına ulaşana kadar yeniden kullanılır.
+RETRAIN_GROWTH_FACTOR = 4
+
+
+def choose_index_type(num_vectors, index_type=DEFAULT_INDEX_TYPE):
+    """index_type "auto" ise derlem boyutuna göre indeks tipini seçer; küçük derlemde PQ yerine IVF kullanılır."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Bilinmeyen indeks tipi: {index_type} (seçenekler: {', '.join(INDEX_TYPES)})")
+    if index_type == "auto":
+        if num_vectors < ANN_MIN_VECTORS:
+            return "flat"
+        return "ivf" if num_vectors < PQ_MIN_VECTORS else "ivfpq"
+    if index_type == "ivfpq" and num_vectors < PQ_MIN_TRAIN_VECTORS:
+        print(f"PQ eğitimi için vektör sayısı yetersiz ({num_vectors}), IVF kullanılacak.")
+        return "ivf"
+    return index_type
+
+
+def _num_lists(num_vectors):
+    # Yaygın kural: ~4*sqrt(N) küme, her kümeye eğitimde en az ~39 nokta düşecek şekilde
+    return int(max(1, min(4 * math.sqrt(num_vectors), num_vectors // 39, 65536)))
+
+
+def _num_subquantizers(dimension):
+    # Alt kuantizör başına en az 4 boyut; daha küçük alt uzaylar sıkıştırma kazandırmadan eğitimi yavaşlatır.
+    limit = max(1, min(PQ_MAX_SUBQUANTIZERS, dimension // 4))
+    return max(m for m in range(1, limit + 1) if dimension % m == 0)
+
+
+def get_vectors(index):
+    """Flat indeksteki tüm vektörleri (indeks sırasıyla) döndürür."""
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype="float32")
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def _train_sample(vectors, size, seed=0):
+    if len(vectors) <= size:
+        return vectors
+    rng = np.random.default_rng(seed)
+    return vectors[np.sort(rng.choice(len(vectors), size, replace=False))]
+
+
+def index_description(num_vectors, dimension, index_type, compression=None, pca_dim=None):
+    """
+    Seçeneklerden faiss.index_factory tanımını üretir (ör. "PCA256,IVF1024,SQ8").
+    Dönüş: (tanım, kayıplı mı); index_type "flat" ve sıkıştırma yoksa (None, False).
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Bilinmeyen sıkıştırma: {compression} (seçenekler: float16, int8)")
+    if pca_dim is not None and not 0 < pca_dim < dimension:
+        raise ValueError(f"PCA boyutu 1 ile {dimension - 1} arasında olmalı: {pca_dim}")
+    if index_type == "flat" and compression is None and pca_dim is None:
+        return None, False
+    target_dimension = pca_dim or dimension
+    storage = _SQ_CODES.get(compression, "Flat")
+    if index_type == "flat":
+        body = storage
+    elif index_type == "ivf":
+        body = f"IVF{_num_lists(num_vectors)},{storage}"
+    elif index_type == "hnsw":
+        body = f"HNSW{HNSW_M},{storage}"
+    else: # ivfpq vektörleri zaten sıkıştırır
+        body = f"IVF{_num_lists(num_vectors)},PQ{_num_subquantizers(target_dimension)}"
+    prefix = f"PCA{pca_dim}," if pca_dim else ""
+    lossy = bool(compression or pca_dim or index_type == "ivfpq")
+    return prefix + body, lossy
+
+
+def _unwrap(index):
+    """IndexRefine ve IndexPreTransform sarmalayıcılarının altındaki asıl indeksi döndürür."""
+    index = faiss.downcast_index(index)
+    while isinstance(index, (faiss.IndexRefine, faiss.IndexPreTransform)):
+        index = faiss.downcast_index(index.base_index if isinstance(index, faiss.IndexRefine) else index.index)
+    return index
+
+
+def create_trained_index(vectors, description):
+    """index_factory tanımından boş, eğitilmiş bir indeks döndürür."""
+    index = faiss.index_factory(vectors.shape[1], description)
+    inner = _unwrap(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        nlist = faiss.extract_index_ivf(index).nlist if "IVF" in description else 1
+        sample_size = nlist * TRAIN_POINTS_PER_CENTROID
+        if "PQ" in description or "PCA" in description or "SQ" in description:
+            sample_size = max(sample_size, PQ_MIN_TRAIN_VECTORS)
+        index.train(_train_sample(vectors, sample_size))
+    return index
+
+
+def set_search_params(index, nprobe=DEFAULT_NPROBE, ef_search=DEFAULT_EF_SEARCH, k_factor=DEFAULT_RESCORE_K_FACTOR):
+    """İndeks tipine uygun arama parametrelerini uygular (flat indekste bir şey yapmaz)."""
+    if isinstance(index, faiss.IndexRefine):
+        index.k_factor = k_factor
+    inner = _unwrap(index)
+    try:
+        faiss.extract_index_ivf(inner).nprobe = nprobe
+    except (RuntimeError, ValueError):
+        pass
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = ef_search
+
+
+def with_rescoring(index, exact_index):
+    """Aramayı, adayları kesin indeksteki tam vektörlerle yeniden puanlayan bir indeksle sarar."""
+    refined = faiss.IndexRefine(index, exact_index)
+    refined.k_factor = DEFAULT_RESCORE_K_FACTOR
+    return refined
+
+
+def index_nbytes(index):
+    """İndeksin serileştirilmiş boyutu (bellekte tutulan vektör verisinin yaklaşık karşılığı)."""
+    return faiss.serialize_index(index).nbytes
+
+
+def measure_recall(exact_index, ann_index, k=RECALL_K, num_queries=RECALL_QUERIES, queries=None):
+    """
+    ANN indeksinin kesin indekse göre recall@k değerini ve sorgu başına ortalama süreleri ölçer.
+    queries verilmezse indeksteki vektörlerden rastgele bir örneklem sorgu olarak kullanılır.
+    """
+    if queries is None:
+        vectors = get_vectors(exact_index)
+        queries = _train_sample(vectors, num_queries, seed=1)
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    if len(queries) == 0:
+        return None
+    k = min(k, exact_index.ntotal)
+    started = time.perf_counter()
+    _, exact_ids = exact_index.search(queries, k)
+    exact_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    _, ann_ids = ann_index.search(queries, k)
+    ann_seconds = time.perf_counter() - started
+    hits = sum(len(set(exact_row) & set(ann_row)) for exact_row, ann_row in zip(exact_ids.tolist(), ann_ids.tolist()))
+    return {
+        "k": k,
+        "queries": len(queries),
+        "recall": hits / (k * len(queries)),
+        "exact_ms": 1000 * exact_seconds / len(queries),
+        "ann_ms": 1000 * ann_seconds / len(queries),
+    }
+
+
+def build_ann_index(exact_index, index_type=DEFAULT_INDEX_TYPE, trained_template=None, compression=None, pca_dim=None):
+    """
+    Kesin indeksteki vektörlerden arama indeksini üretir.
+    compression: None, "float16" veya "int8" (skaler kuantizasyon); pca_dim: PCA ile düşürülecek boyut.
+    trained_template: Önceki üretimden kalan (tanımı aynı) eğitilmiş boş indeks; derlem çok büyümediyse
+    yeniden eğitim yapılmaz.
+    Dönüş: (indeks, eğitilmiş boş şablon veya None, bilgi sözlüğü); arama doğrudan kesin indeksle
+    yapılacaksa (None, None, bilgi).
+    """
+    num_vectors = exact_index.ntotal
+    chosen_type = choose_index_type(num_vectors, index_type)
+    info = {"type": chosen_type, "vectors": num_vectors}
+    if chosen_type == "flat" and compression is None and pca_dim is None or num_vectors == 0:
+        info["type"] = "flat"
+        return None, None, info
+    if pca_dim is not None and num_vectors < pca_dim:
+        print(f"PCA için vektör sayısı yetersiz ({num_vectors} < {pca_dim}), boyut düşürülmeyecek.")
+        pca_dim = None
+    description, lossy = index_description(num_vectors, exact_index.d, chosen_type, compression, pca_dim)
+    info.update(description=description, rescore=lossy, compression=compression, pca_dim=pca_dim)
+
+    vectors = get_vectors(exact_index)
+    started = time.perf_counter()
+    # Küme sayısı derlem boyutuna bağlı olduğu için şablon tanımla değil, seçeneklerle eşleştirilir.
+    info["family"] = f"{chosen_type}/{compression}/{pca_dim}"
+    if trained_template is not None and trained_template.get("family") == info["family"] and \
+            num_vectors <= trained_template["trained_on"] * RETRAIN_GROWTH_FACTOR:
+        template = trained_template["index"]
+        info["trained_on"] = trained_template["trained_on"]
+        # Küme sayısı şablonun eğitildiği vektör sayısından gelir; bilgi yeniden kullanılan yapıyı göstermeli.
+        info["description"] = index_description(info["trained_on"], exact_index.d, chosen_type, compression, pca_dim)[0]
+    else:
+        template = create_trained_index(vectors, description)
+        info["trained_on"] = num_vectors
+    index = faiss.clone_index(template)
+    index.add(vectors)
+    info["build_seconds"] = time.perf_counter() - started
+    info["nbytes"] = index_nbytes(index)
+    info["exact_nbytes"] = index_nbytes(exact_index)
+    set_search_params(index)
+    info["recall"] = measure_recall(exact_index, with_rescoring(index, exact_index) if lossy else index)
+    return index, template, info
+
+
+def _print_recall(label, result):
+    print(f"{label:<24} recall@{result['k']}={result['recall']:.3f}  "
+          f"ann={result['ann_ms']:.2f} ms  exact={result['exact_ms']:.2f} ms")
+
+
+def compare_storage_options(exact_index, queries, k=RECALL_K, pca_dim=None):
+    """
+    Sıkıştırma/indeks seçeneklerini aynı vektörler üzerinde kurar; her biri için bellekte tutulan boyutu ve
+    kesin aramayla sonuç örtüşmesini (yeniden puanlamalı ve puanlamasız) döndürür.
+    """
+    pca_dim = pca_dim or max(1, exact_index.d // 4)
+    options = [
+        ("flat", "float16", None), ("flat", "int8", None), ("flat", "int8", pca_dim),
+        ("ivf", None, None), ("ivf", "int8", None), ("hnsw", "int8", None), ("ivfpq", None, None),
+    ]
+    exact_nbytes = index_nbytes(exact_index)
+    rows = [{"option": "flat float32", "nbytes": exact_nbytes, "saved": 0.0, "recall": 1.0, "rescored_recall": 1.0}]
+    for index_type, compression, option_pca_dim in options:
+        index, _, info = build_ann_index(exact_index, index_type, compression=compression, pca_dim=option_pca_dim)
+        if index is None:
+            continue
+        plain = measure_recall(exact_index, index, k, queries=queries)
+        rescored = measure_recall(exact_index, with_rescoring(index, exact_index), k, queries=queries)
+        rows.append({
+            "option": info["description"],
+            "nbytes": info["nbytes"],
+            "saved": 1 - info["nbytes"] / exact_nbytes,
+            "recall": plain["recall"],
+            "rescored_recall": rescored["recall"],
+            "ms": plain["ann_ms"],
+            "rescored_ms": rescored["ann_ms"],
+        })
+    return rows
+
+
+def _load_question_vectors(path):
+    # Gerçek soru embedding'leri için Ollama gerekir; sadece --questions verildiğinde import edilir.
+    from embedder import get_embeddings
+    with open(path, "r", encoding="utf-8") as f:
+        questions = [line.strip() for line in f if line.strip()]
+    return np.asarray(get_embeddings().embed_documents(questions), dtype="float32")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arama indeksinin kesin indekse göre recall/hız/bellek karşılaştırması")
+    parser.add_argument("db_path", nargs="?", help="Derlem dizini; verilmezse isim alanının güncel derlemi")
+    parser.add_argument("--namespace", help="İsim alanı (varsayılan: API'nin varsayılan isim alanı)")
+    parser.add_argument("--app-session", action="store_true", help="Streamlit uygulamasının en son kullanılan oturumu")
+    parser.add_argument("--type", choices=INDEX_TYPES[1:], help="Mevcut arama indeksi yerine bu tipte yeni indeks kur")
+    parser.add_argument("--compression", choices=COMPRESSIONS[1:])
+    parser.add_argument("--pca-dim", type=int)
+    parser.add_argument("--compare", action="store_true", help="Sıkıştırma seçeneklerinin bellek/örtüşme tablosu")
+    parser.add_argument("--nprobe", type=int, nargs="*", default=[DEFAULT_NPROBE])
+    parser.add_argument("--ef-search", type=int, nargs="*", default=[DEFAULT_EF_SEARCH])
+    parser.add_argument("-k", type=int, default=RECALL_K)
+    parser.add_argument("--queries", type=int, default=RECALL_QUERIES)
+    parser.add_argument("--questions", help="Sorgu olarak kullanılacak sorular (satır başına bir soru)")
+    args = parser.parse_args()
+
+    if not args.db_path:
+        # İsim alanları embedder üzerinden bu modülü import eder; sadece komut satırında gerekir.
+        from namespaces import DEFAULT_NAMESPACE, get_namespace_index, latest_session_namespace
+        namespace = latest_session_namespace() if args.app_session else args.namespace or DEFAULT_NAMESPACE
+        args.db_path = get_namespace_index(namespace) if namespace else None
+        if not args.db_path:
+            print(f"İndeks bulunamadı: {namespace or 'Streamlit oturumu yok'}")
+            return
+    with open(os.path.join(args.db_path, "manifest.json"), "r", encoding="utf-8") as f:
+        storage = json.load(f).get("storage")
+    if not storage:
+        print("İndeks boş.")
+        return
+    exact_index = faiss.read_index(os.path.join(args.db_path, storage["index"]))
+    if args.questions:
+        queries = _load_question_vectors(args.questions)
+    else:
+        queries = _train_sample(get_vectors(exact_index), args.queries, seed=1)
+
+    if args.compare:
+        print(f"{exact_index.ntotal} vektör, {exact_index.d} boyut, {len(queries)} sorgu, k={args.k}")
+        print(f"{'seçenek':<28} {'MB':>8} {'kazanç':>7} {'örtüşme':>8} {'yeniden puanlı':>15}")
+        for row in compare_storage_options(exact_index, queries, args.k, args.pca_dim):
+            print(f"{row['option']:<28} {row['nbytes'] / 2**20:>8.2f} {row['saved']:>7.0%} "
+                  f"{row['recall']:>8.3f} {row['rescored_recall']:>15.3f}")
+        return
+
+    rescore = False
+    if args.type or args.compression or args.pca_dim:
+        ann_index, _, info = build_ann_index(exact_index, args.type or "flat", compression=args.compression, pca_dim=args.pca_dim)
+        rescore = info.get("rescore", False)
+        if ann_index is not None:
+            print(f"{info['description']} indeksi {info['build_seconds']:.1f} sn'de kuruldu, "
+                  f"{info['nbytes'] / 2**20:.1f} MB (kesin: {info['exact_nbytes'] / 2**20:.1f} MB).")
+    elif storage.get("ann"):
+        ann_index = faiss.read_index(os.path.join(args.db_path, storage["ann"]["file"]))
+        rescore = storage["ann"].get("rescore", False)
+    else:
+        ann_index = None
+    if ann_index is None:
+        print(f"{exact_index.ntotal} vektör, kesin (flat) indeks kullanılıyor.")
+        return
+    if rescore:
+        ann_index = with_rescoring(ann_index, exact_index)
+
+    is_hnsw = isinstance(_unwrap(ann_index), faiss.IndexHNSW)
+    for value in (args.ef_search if is_hnsw else args.nprobe):
+        if is_hnsw:
+            set_search_params(ann_index, ef_search=value)
+        else:
+            set_search_params(ann_index, nprobe=value)
+        _print_recall(f"{'efSearch' if is_hnsw else 'nprobe'}={value}", measure_recall(exact_index, ann_index, args.k, queries=queries))
+
+
+if __name__ == "__main__":
+    main()
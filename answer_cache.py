@@ -0,0 +1,122 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL_SECONDS = 6 * 60 * 60
+# Kosinüs benzerliği eşiği; bunun üzerindeki soru embedding'leri aynı soru (farklı ifade) kabul edilir.
+# Benzerlik araması sadece embeddings verildiğinde yapılır (bkz. resources.ANSWER_CACHE_SEMANTIC_MATCH).
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+
+def normalize_question(question):
+    """Büyük/küçük harf, noktalama ve boşluk farklarını yok sayan normal biçim."""
+    text = unicodedata.normalize("NFKC", question).casefold()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class AnswerCache:
+    """
+    Tekrarlanan ve benzer sorular için cevap önbelleği.
+    Anahtar (indeks sürümü, rol, dil, normalize edilmiş soru) şeklindedir; tam eşleşme yoksa aynı
+    indeks/rol/dil için saklanan soru embedding'leriyle benzerlik araması yapılır, böylece farklı
+    ifade edilmiş aynı sorular da önbellekten cevaplanır.
+    Girdiler boyut sınırına göre (en az kullanılan önce) ve TTL süresine göre çıkarılır.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD, embeddings=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.embeddings = embeddings # None ise sadece tam (normalize) eşleşme yapılır
+        self._entries = OrderedDict() # anahtar -> girdi sözlüğü
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def _make_key(index_version, role, language_code, question):
+        return (index_version, role, language_code, normalize_question(question))
+
+    def _is_expired(self, entry, now):
+        return self.ttl_seconds is not None and now - entry["created_at"] > self.ttl_seconds
+
+    def _evict(self, now):
+        for key in [key for key, entry in self._entries.items() if self._is_expired(entry, now)]:
+            del self._entries[key]
+            self.stats["evictions"] += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _embed(self, question):
+        if self.embeddings is None:
+            return None
+        try:
+            vector = np.asarray(self.embeddings.embed_query(normalize_question(question)), dtype="float32")
+        except Exception as e:
+            print(f"Soru embedding'i alınamadı, sadece tam eşleşme kullanılacak: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def get(self, index_version, role, language_code, question):
+        """
+        Önbellekteki cevabı {"answer": ..., "sources": [...], "question": ...} olarak döndürür; yoksa None.
+        Dönen sözlükteki "match" alanı "exact" veya "semantic" olur.
+        """
+        key = self._make_key(index_version, role, language_code, question)
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return dict(entry, match="exact")
+            has_candidates = any(k[:3] == key[:3] and e["vector"] is not None for k, e in self._entries.items())
+
+        # Embedding isteği kilit dışında yapılır; diğer oturumlar beklemez.
+        query_vector = self._embed(question) if has_candidates else None
+        with self._lock:
+            best_key, best_score = None, -1.0
+            if query_vector is not None:
+                for candidate_key, candidate in self._entries.items():
+                    if candidate_key[:3] != key[:3] or candidate["vector"] is None:
+                        continue
+                    score = float(np.dot(query_vector, candidate["vector"]))
+                    if score > best_score:
+                        best_key, best_score = candidate_key, score
+            if best_key is not None and best_score >= self.similarity_threshold:
+                self._entries.move_to_end(best_key)
+                self.stats["semantic_hits"] += 1
+                return dict(self._entries[best_key], match="semantic", similarity=best_score)
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, index_version, role, language_code, question, answer, sources):
+        """Bir soru-cevap çiftini önbelleğe ekler."""
+        key = self._make_key(index_version, role, language_code, question)
+        vector = self._embed(question)
+        with self._lock:
+            self._entries[key] = {
+                "question": question,
+                "answer": answer,
+                "sources": list(sources),
+                "vector": vector,
+                "created_at": time.time(),
+            }
+            self._entries.move_to_end(key)
+            self._evict(time.time())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
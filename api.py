@@ -0,0 +1,347 @@
+"""
+Streamlit arayüzünden bağımsız, asenkron HTTP API (FastAPI).
+Belge yükleme, soru sorma (isteğe bağlı akışla), özet, anahtar kelime ve sayfa önizleme uç noktaları mevcut
+pdf_handler, embedder ve chatbot fonksiyonlarını kullanır. Model istemcileri, embedding servisi ve vectorstore
+resources üzerinden süreç içinde paylaşılır ve başlangıçta ısıtılır.
+
+Her istek bir isim alanında (namespace: oturum, kullanıcı veya koleksiyon; varsayılan "default") çalışır;
+isim alanlarının indeksleri birbirinden bağımsızdır (bkz. namespaces).
+Birden fazla worker süreci aynı indeksleri kullanabilir:
+    uvicorn api:app --host 0.0.0.0 --port 8000 --workers 4 --timeout-worker-healthcheck 120
+    python api.py --workers 4
+Okuyucular indeksi mmap ile açar ve isim alanı yeni bir derleme geçtiğinde onu açar; yazarlar (yükleme)
+embedder.index_write_lock ile sıraya girer. Eş zamanlılık sınırları (LLM zamanlayıcısı dahil, bkz. llm_scheduler)
+worker başınadır; LLM sırası dolduğunda istek 503 ile reddedilir.
+"""
+import argparse
+import asyncio
+import json
+import os
+import uuid
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from background_jobs import NUM_KEYWORDS
+from chatbot import extract_keywords_from_documents, stream_answer, summarize_documents
+from embedder import EMBEDDING_MODEL, get_embeddings
+from ingestion_cache import IngestionCache, compute_file_hash, documents_to_records, make_cache_key, make_corpus_key
+from ingestion_pipeline import IngestionPipeline
+from llm_scheduler import PRIORITY_INTERACTIVE, PRIORITY_REFINE, SchedulerBusyError, scheduler
+from pdf_handler import FULL_ZOOM, THUMBNAIL_ZOOM, get_chunk_settings, get_pdf_page_image_bytes
+from namespaces import (DEFAULT_NAMESPACE, assign_documents, document_file_path, get_namespace_index,
+                        get_namespace_vectorstore, read_namespace, relabel_sources, save_document_file,
+                        validate_namespace)
+from resources import LLM_MODEL, get_answer_cache, get_index_signature, get_llm, get_vectorstore
+
+# Worker başına eş zamanlı istek sınırları; LLM çağrıları llm_scheduler'daki model başına sınıra tabidir.
+INGEST_CONCURRENCY = 1
+RENDER_CONCURRENCY = 4
+# Sırada bekleyebilecek en fazla istek; aşılırsa 503 döner (istemci daha sonra tekrar dener).
+MAX_WAITING_REQUESTS = 32
+# Worker'lar LangChain, FAISS ve PyMuPDF'i yüklerken uvicorn'un varsayılan (5 sn) sağlık kontrolü süresi aşılabiliyor.
+WORKER_HEALTHCHECK_TIMEOUT = 120
+
+
+class ConcurrencyLimiter:
+    """Bir istek türü için eş zamanlı çalışan ve sırada bekleyen istek sayısını sınırlar."""
+
+    def __init__(self, name, max_concurrent, max_waiting=MAX_WAITING_REQUESTS):
+        self.name = name
+        self.max_waiting = max_waiting
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.waiting = 0
+
+    def check(self):
+        """Sıra doluysa 503 ile reddeder (akış cevapları başlamadan önce çağrılır)."""
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            raise HTTPException(status_code=503, detail=f"Sunucu meşgul ({self.name}), lütfen daha sonra tekrar deneyin.")
+
+    async def acquire(self):
+        self.check()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+    def release(self):
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+ingest_limiter = ConcurrencyLimiter("ingest", INGEST_CONCURRENCY)
+render_limiter = ConcurrencyLimiter("render", RENDER_CONCURRENCY)
+ingestion_cache = IngestionCache()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # İlk isteğin bağlantı ve indeks açma maliyetini ödememesi için paylaşılan kaynaklar önceden hazırlanır.
+    await run_in_threadpool(get_llm)
+    await run_in_threadpool(get_embeddings)
+    await run_in_threadpool(get_namespace_vectorstore, DEFAULT_NAMESPACE)
+    yield
+
+
+app = FastAPI(title="PDF Chatbot API", lifespan=lifespan)
+
+
+@app.exception_handler(SchedulerBusyError)
+async def scheduler_busy(request, exc):
+    return JSONResponse(status_code=503, content={"detail": f"Sunucu meşgul ({exc}), lütfen daha sonra tekrar deneyin."})
+
+
+class AskRequest(BaseModel):
+    question: str
+    role: str
+    language: str = "tr"
+    stream: bool = False
+    namespace: str = DEFAULT_NAMESPACE
+
+
+class DocumentsRequest(BaseModel):
+    role: str
+    language: str = "tr"
+    documents: Optional[List[str]] = None # Belge kimlikleri; verilmezse indeksteki tüm belgeler
+    stream: bool = False
+    num_keywords: int = NUM_KEYWORDS
+    namespace: str = DEFAULT_NAMESPACE
+
+
+def _check_namespace(namespace):
+    try:
+        return validate_namespace(namespace)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _load_document_chunks(namespace, document_ids):
+    """İsim alanındaki belgelerin chunk'larını ingestion önbelleğinden okur (PDF yeniden işlenmez)."""
+    indexed = read_namespace(namespace)["documents"]
+    document_ids = document_ids or list(indexed)
+    chunks = []
+    for doc_id in document_ids:
+        if doc_id not in indexed:
+            raise HTTPException(status_code=404, detail=f"Belge isim alanında yok: {doc_id}")
+        chunks.extend(ingestion_cache.load_chunks(doc_id, indexed[doc_id]))
+    if not chunks:
+        raise HTTPException(status_code=404, detail="İşlenecek belge içeriği bulunamadı.")
+    return document_ids, chunks
+
+
+def _ndjson(event):
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+
+async def _scheduled_stream(make_iter, owner):
+    """
+    make_iter'in döndürdüğü (bloklayan) iterator'ı thread havuzunda tüketerek aktarır. Model çağrıları
+    LLM zamanlayıcısında owner adına sıraya girer; istemci bağlantıyı keserse sıradaki çağrılar iptal edilir
+    ve çalışan akış bir sonraki token'da durur.
+    """
+    try:
+        token_iter = await run_in_threadpool(make_iter)
+        async for token in iterate_in_threadpool(token_iter):
+            yield token
+    finally:
+        scheduler.cancel(owner)
+
+
+def _raise_for_failed_call(status):
+    """
+    Model çağrısı başarısız olduysa (bkz. chatbot._stream_llm status) hata metni 200 ile dönmez:
+    LLM sırası doluysa 503, diğer hatalarda 500.
+    """
+    error = status.get("error")
+    if isinstance(error, SchedulerBusyError):
+        raise error
+    if error is not None:
+        raise HTTPException(status_code=500, detail=f"Model çağrısı başarısız oldu: {error}")
+
+
+def _index_documents(namespace, results, pipeline_files):
+    """Başarıyla işlenen dosyaları isim alanına ekler; dosya başına durum listesi döndürür."""
+    report = []
+    documents = {}
+    loaders = {}
+    for file_path, file_name, file_key in pipeline_files:
+        result = results.get(file_key)
+        if result is None or isinstance(result, Exception):
+            report.append({"source": file_name, "document_id": file_key, "error": str(result or "işlenemedi")})
+            continue
+        meta, chunks, vectors, from_cache = result
+        if chunks:
+            documents[file_key] = file_name
+            loaders[file_key] = lambda c=chunks, v=vectors: (c, v)
+        report.append({
+            "source": file_name, "document_id": file_key, "total_pages": meta["total_pages"],
+            "chunks": len(chunks), "from_cache": from_cache,
+        })
+    if documents:
+        assign_documents(namespace, documents, loaders, cache=ingestion_cache, merge=True)
+    return report
+
+
+@app.post("/ingest")
+async def ingest(files: List[UploadFile] = File(...), namespace: str = Form(DEFAULT_NAMESPACE)):
+    """PDF'leri işler ve isim alanına ekler. Aynı içerik daha önce işlendiyse önbellekten gelir."""
+    namespace = _check_namespace(namespace)
+    pipeline_files = []
+    for upload in files:
+        file_bytes = await upload.read()
+        file_name = os.path.basename(upload.filename or "belge.pdf")
+        file_key = make_cache_key(compute_file_hash(file_bytes), get_chunk_settings(), EMBEDDING_MODEL)
+        file_path = await run_in_threadpool(save_document_file, file_key, file_bytes)
+        pipeline_files.append((file_path, file_name, file_key))
+
+    async with ingest_limiter.slot():
+        results = await run_in_threadpool(IngestionPipeline(ingestion_cache).run, pipeline_files)
+        report = await run_in_threadpool(_index_documents, namespace, results, pipeline_files)
+    return {"namespace": namespace, "documents": report}
+
+
+@app.get("/documents")
+async def list_documents(namespace: str = DEFAULT_NAMESPACE):
+    documents = (await run_in_threadpool(read_namespace, _check_namespace(namespace)))["documents"]
+    return {
+        "namespace": namespace,
+        "documents": [{"document_id": doc_id, "source": source} for doc_id, source in documents.items()],
+    }
+
+
+@app.post("/ask")
+async def ask(request: AskRequest):
+    """
+    Soruyu indeks üzerinde cevaplar. stream=True ise cevap NDJSON olarak akar:
+    önce {"sources": [...]}, sonra {"token": "..."} satırları, en son {"done": true, "context": {...}}.
+    """
+    namespace = _check_namespace(request.namespace)
+    index_path = await run_in_threadpool(get_namespace_index, namespace)
+    vectorstore = await run_in_threadpool(get_vectorstore, index_path) if index_path else None
+    if vectorstore is None:
+        raise HTTPException(status_code=404, detail="İsim alanı boş; önce belge yükleyin.")
+    # Derlem, aynı belgeleri başka adlarla yükleyen isim alanlarıyla paylaşılabilir; kaynaklar bu isim alanının adlarıyla döner.
+    namespace_documents = (await run_in_threadpool(read_namespace, namespace))["documents"]
+    cache_args = ((index_path, await run_in_threadpool(get_index_signature, index_path)), request.role, request.language, request.question)
+    cached_answer = await run_in_threadpool(get_answer_cache().get, *cache_args)
+    if cached_answer:
+        sources = documents_to_records(relabel_sources(cached_answer["sources"], namespace_documents))
+        if request.stream:
+            events = iter([_ndjson({"sources": sources, "from_cache": True}), _ndjson({"token": cached_answer["answer"]}), _ndjson({"done": True})])
+            return StreamingResponse(events, media_type="application/x-ndjson")
+        return {"answer": cached_answer["answer"], "sources": sources, "from_cache": True}
+
+    # Retrieval burada yapılır; model çağrısı token akışı tüketildikçe ilerler ve LLM zamanlayıcısında sıraya girer.
+    scheduler.check(LLM_MODEL, PRIORITY_INTERACTIVE)
+    owner = uuid.uuid4().hex
+    context_report = {}
+    status = {} # Sadece eksiksiz üretilen cevaplar önbelleğe yazılır (bkz. chatbot._stream_llm)
+    source_documents, tokens = await run_in_threadpool(
+        stream_answer, vectorstore, request.question, request.role, request.language, context_report, owner, status
+    )
+    sources = documents_to_records(relabel_sources(source_documents, namespace_documents))
+    if not request.stream:
+        answer = await run_in_threadpool(lambda: "".join(tokens))
+        _raise_for_failed_call(status)
+        if answer and status.get("completed"):
+            await run_in_threadpool(get_answer_cache().put, *cache_args, answer, source_documents)
+        return {"answer": answer, "sources": sources, "from_cache": False, "context": context_report}
+
+    def events():
+        yield _ndjson({"sources": sources, "from_cache": False})
+        answer_parts = []
+        for token in tokens:
+            answer_parts.append(token)
+            yield _ndjson({"token": token})
+        answer = "".join(answer_parts)
+        if answer and status.get("completed"):
+            get_answer_cache().put(*cache_args, answer, source_documents)
+        yield _ndjson({"done": True, "context": context_report})
+
+    return StreamingResponse(_scheduled_stream(events, owner), media_type="application/x-ndjson")
+
+
+@app.post("/summarize")
+async def summarize(request: DocumentsRequest):
+    """Belgelerin (varsayılan: tümü) özetini döndürür; stream=True ise düz metin olarak akar."""
+    _, chunks = await run_in_threadpool(_load_document_chunks, _check_namespace(request.namespace), request.documents)
+    scheduler.check(LLM_MODEL, PRIORITY_REFINE)
+    owner = uuid.uuid4().hex
+    if not request.stream:
+        status = {}
+        summary = await run_in_threadpool(
+            lambda: summarize_documents(chunks, request.role, request.language, owner=owner, status=status)
+        )
+        _raise_for_failed_call(status)
+        return {"summary": summary}
+    # Uzun belgelerde bölüm özetleri akış başlamadan üretilir; bağlantı kesilirse bekleyen bölüm özetleri de iptal edilir.
+    make_tokens = lambda: summarize_documents(chunks, request.role, request.language, stream=True, owner=owner)
+    return StreamingResponse(_scheduled_stream(make_tokens, owner), media_type="text/plain; charset=utf-8")
+
+
+@app.post("/keywords")
+async def keywords(request: DocumentsRequest):
+    """
+    Belgelerin anahtar kelimeleri; sonuç derlem + rol + dil + anahtar kelime sayısı için önbelleğe yazılır
+    (varsayılan sayı arayüzle ortak).
+    """
+    document_ids, chunks = await run_in_threadpool(_load_document_chunks, _check_namespace(request.namespace), request.documents)
+    corpus_key = make_corpus_key(document_ids, request.role, request.language)
+    artifact_name = "keywords" if request.num_keywords == NUM_KEYWORDS else f"keywords_{request.num_keywords}"
+    extracted_keywords = await run_in_threadpool(ingestion_cache.load_artifact, corpus_key, artifact_name)
+    if extracted_keywords is None:
+        scheduler.check(LLM_MODEL, PRIORITY_REFINE)
+        extracted_keywords = await run_in_threadpool(
+            lambda: extract_keywords_from_documents(chunks, request.role, request.language, request.num_keywords,
+                                                    priority=PRIORITY_REFINE)
+        )
+        if extracted_keywords: # Hatalı (boş) sonuçlar önbelleğe yazılmaz
+            await run_in_threadpool(ingestion_cache.save_artifact, corpus_key, artifact_name, extracted_keywords)
+    return {"keywords": extracted_keywords}
+
+
+@app.get("/documents/{document_id}/pages/{page}/preview")
+async def preview(document_id: str, page: int, full: bool = False, namespace: str = DEFAULT_NAMESPACE):
+    """Belgenin bir sayfasının PNG önizlemesi (1'den başlayan sayfa numarası). full=True tam çözünürlük."""
+    namespace = _check_namespace(namespace)
+    meta = await run_in_threadpool(ingestion_cache.load_meta, document_id)
+    if meta is None or document_id not in (await run_in_threadpool(read_namespace, namespace))["documents"]:
+        raise HTTPException(status_code=404, detail=f"Belge bulunamadı: {document_id}")
+    if not 1 <= page <= meta["total_pages"]:
+        raise HTTPException(status_code=404, detail=f"Geçersiz sayfa: {page} (1-{meta['total_pages']})")
+    async with render_limiter.slot():
+        image_bytes = await run_in_threadpool(
+            get_pdf_page_image_bytes, document_file_path(document_id), page - 1,
+            zoom=FULL_ZOOM if full else THUMBNAIL_ZOOM, cache_key=document_id,
+        )
+    if not image_bytes:
+        raise HTTPException(status_code=500, detail="Önizleme oluşturulamadı.")
+    return Response(content=image_bytes, media_type="image/png")
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="PDF Chatbot HTTP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="Aynı indeksi paylaşan worker süreç sayısı")
+    args = parser.parse_args()
+    uvicorn.run("api:app", host=args.host, port=args.port, workers=args.workers,
+                timeout_worker_healthcheck=WORKER_HEALTHCHECK_TIMEOUT)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,89 @@
 import streamlit as st
-import os
-from pdf_handler import extract_pages_from_pdf, chunk_pages, get_pdf_page_image_bytes
-import fitz
-from embedder import embed_and_store, load_vectorstore
-from chatbot import get_qa_chain, generate_suggested_questions, summarize_documents, extract_keywords_from_documents, generate_concept_map_data, extract_timeline_from_documents
+import uuid
+from pdf_handler import get_chunk_settings, get_highlight_rects, get_pdf_page_image_bytes, page_prerenderer, THUMBNAIL_ZOOM, FULL_ZOOM
+from embedder import EMBEDDING_MODEL
+from resources import get_vectorstore, get_index_signature, get_answer_cache
+from namespaces import SESSION_NAMESPACE_PREFIX, assign_documents, get_namespace_index, read_namespace, relabel_sources, save_document_file
+from ingestion_cache import IngestionCache, compute_file_hash, make_cache_key, make_corpus_key
+from ingestion_pipeline import IngestionPipeline
+from context_assembler import BASELINE_CONTEXT_CHUNKS, context_usage
+from llm_scheduler import scheduler
+from background_jobs import artifact_job_key, job_registry, load_or_schedule_corpus_artifacts
+from speculative_answers import speculative_answers
+from chatbot import stream_answer, refine_answer, summarize_documents, generate_concept_map_data, extract_mermaid_code, extract_timeline_from_documents
 import json
 import pandas as pd # Grafik için Pandas ekleyelim
 from collections import defaultdict # Chunk sayısını saymak için
 
 st.set_page_config(page_title="PDF Chatbot", layout="wide")
 
+def render_stream(token_stream):
+    """Token akışını geldikçe ekrana yazar ve tamamlanan metni döndürür."""
+    placeholder = st.empty()
+    collected_text = ""
+    for token in token_stream:
+        collected_text += token
+        placeholder.markdown(collected_text + "▌")
+    placeholder.markdown(collected_text)
+    return collected_text
+
+# Görüntülenen sayfanın her iki yanında arka planda hazırlanacak sayfa sayısı
+PREVIEW_PREFETCH_PAGES = 2
+# Arka planda üretilen örnek soru / anahtar kelimelerin hazır olup olmadığının kontrol aralığı (saniye)
+ARTIFACT_POLL_SECONDS = 2
+
+@st.fragment(run_every=ARTIFACT_POLL_SECONDS)
+def wait_for_background_artifacts(job_keys):
+    """Arka plan işleri bitene kadar bilgi gösterir; bitince sonuçların görünmesi için sayfayı yeniler."""
+    if not any(job_registry.is_running(key) for key in job_keys):
+        st.rerun()
+    st.caption("⏳ Örnek sorular ve anahtar kelimeler arka planda hazırlanıyor; bu sırada soru sorabilirsiniz.")
+
+def get_page_highlights(pdf_name, preview_data, page_display):
+    """
+    Bir sayfada vurgulanacak kaynak metinleri ve (kelime konumları biliniyorsa) vurgu dikdörtgenlerini döndürür.
+    Dikdörtgenler çıkarma sırasında kaydedilen kelime kutularından hesaplanır; konumu bilinmeyen
+    (eski) chunk'lar için dikdörtgen None döner ve sayfada metin aramasına geri dönülür.
+    """
+    texts = []
+    spans = []
+    for src_doc in st.session_state.source_documents:
+        if src_doc.metadata.get('source') == pdf_name and src_doc.metadata.get('page') == page_display:
+            texts.append(src_doc.page_content)
+            if "start_index" in src_doc.metadata:
+                start_index = src_doc.metadata["start_index"]
+                spans.append((start_index, start_index + len(src_doc.page_content)))
+    rects = None
+    if spans and len(spans) == len(texts):
+        page_words = ingestion_cache.load_page_geometry(preview_data['file_key']).get(page_display, [])
+        rects = get_highlight_rects(page_words, spans) or None
+    return texts, rects
+
+def prerender_preview_pages(pdf_name, preview_data, page_numbers, zoom=THUMBNAIL_ZOOM):
+    """Verilen sayfaları (1'den başlar) vurgularıyla birlikte arka planda render önbelleğine hazırlar."""
+    for page_display in page_numbers:
+        if not 1 <= page_display <= preview_data['total_pages']:
+            continue
+        texts, rects = get_page_highlights(pdf_name, preview_data, page_display)
+        page_prerenderer.schedule(
+            preview_data['path'], preview_data['file_key'], page_display - 1, zoom=zoom,
+            highlight_rects=rects, highlight_texts=None if rects else texts,
+        )
+
+def prerender_cited_pages(source_docs, zoom=THUMBNAIL_ZOOM):
+    """Cevapta kaynak gösterilen sayfaları, kullanıcı onlara gitmeden önce hazırlar."""
+    pages_by_pdf = defaultdict(set)
+    for src_doc in source_docs:
+        pdf_name = src_doc.metadata.get('source')
+        if pdf_name in st.session_state.pdf_previews and isinstance(src_doc.metadata.get('page'), int):
+            pages_by_pdf[pdf_name].add(src_doc.metadata['page'])
+    for pdf_name, pages in pages_by_pdf.items():
+        prerender_preview_pages(pdf_name, st.session_state.pdf_previews[pdf_name], sorted(pages), zoom)
+
+def jump_to_preview_page(pdf_name, page_display):
+    # Widget değeri sadece callback içinde (widget yeniden oluşturulmadan önce) değiştirilebilir
+    st.session_state[f"preview_page_num_{pdf_name}"] = page_display
+
 # Session state'i başlat
 if 'pdf_previews' not in st.session_state:
     st.session_state.pdf_previews = {}
@@ -37,6 +111,16 @@ if 'timeline_data' not in st.session_state:
     st.session_state.timeline_data = ""
 if 'page_chunk_counts' not in st.session_state: # Bilgi yoğunluğu için session state
     st.session_state.page_chunk_counts = {}
+if 'namespace' not in st.session_state: # Her oturumun kendi indeksi; aynı belgeleri yükleyen oturumlar indeksi paylaşır
+    st.session_state.namespace = SESSION_NAMESPACE_PREFIX + uuid.uuid4().hex
+if 'corpus_signature' not in st.session_state: # İşlenmiş dosyaların (ad, önbellek anahtarı) listesi
+    st.session_state.corpus_signature = None
+if 'session_chunks' not in st.session_state:
+    st.session_state.session_chunks = []
+if 'artifacts_key' not in st.session_state: # Gösterilen örnek soru/anahtar kelimelerin anahtarı
+    st.session_state.artifacts_key = None
+if 'prefetched_key' not in st.session_state: # Örnek soruları önceden cevaplanan (indeks, rol, dil, sorular)
+    st.session_state.prefetched_key = None
 
 
 st.title("📄 PDF Destekli Rol-Tabanlı Chatbot")
@@ -69,84 +153,175 @@ available_languages = {"Türkçe": "tr", "English": "en"}
 selected_language_label = st.selectbox("🌐 Cevap Dili Seç", list(available_languages.keys()))
 selected_language_code = available_languages[selected_language_label]
 
+prefetch_suggestions = st.sidebar.checkbox(
+    "⚡ Örnek soruları önceden cevapla", value=False,
+    help="Örnek sorular hazır olunca model boştayken cevaplanır; bir öneriye tıkladığınızda cevap beklemeden gelir. "
+         "Tıklanmayan cevaplar için ek model çağrısı yapılır.",
+)
+
 
 # PDF yükleme
 uploaded_files = st.file_uploader("📤 PDF Yükle (Birden fazla dosya seçebilirsiniz)", type=["pdf"], accept_multiple_files=True)
-processed_pdf_paths = []
 all_chunks_for_session = [] # Bu session'daki tüm chunk'ları saklamak için
+pending_artifact_jobs = [] # Sonucu henüz hazır olmayan arka plan işlerinin anahtarları
+ingestion_cache = IngestionCache()
 
 if uploaded_files:
-    # Yeni yükleme olduğunda bazı session state'leri sıfırla
-    st.session_state.pdf_previews = {}
-    st.session_state.suggested_questions = []
-    st.session_state.document_summary = ""
-    st.session_state.extracted_keywords = []
-    st.session_state.concept_map_data = ""
-    st.session_state.timeline_data = ""
-    st.session_state.page_chunk_counts = {} # Bilgi yoğunluğunu da sıfırla
-    st.session_state.last_answer = ""
-    st.session_state.refined_answer = ""
-    st.session_state.source_documents = []
-
-    current_file_chunks = []
-    data_dir = "data"
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir)
-
+    # Dosyalar adlarına göre değil içeriklerine göre tanınır; chunk ve embedding ayarları da anahtara dahildir.
+    file_entries = []
     for uploaded_file in uploaded_files:
-        file_path = os.path.join(data_dir, uploaded_file.name)
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.read())
-        processed_pdf_paths.append(file_path)
+        file_bytes = uploaded_file.getvalue()
+        file_key = make_cache_key(compute_file_hash(file_bytes), get_chunk_settings(), EMBEDDING_MODEL)
+        file_entries.append((uploaded_file.name, file_key, file_bytes))
+    corpus_signature = tuple((name, key) for name, key, _ in file_entries)
+
+    # Streamlit her etkileşimde betiği yeniden çalıştırır; yüklenen dosyalar değişmediyse hiçbir şey yeniden işlenmez.
+    if st.session_state.corpus_signature != corpus_signature:
+        # Önceki belgeler için sırada bekleyen model çağrıları artık gereksiz; paylaşılan arka plan işleri
+        # sadece başka bir oturum beklemiyorsa iptal edilir.
+        scheduler.cancel(st.session_state.namespace)
+        job_registry.detach(st.session_state.namespace)
+        speculative_answers.detach(st.session_state.namespace)
+        # Yeni yükleme olduğunda bazı session state'leri sıfırla
+        st.session_state.pdf_previews = {}
+        st.session_state.suggested_questions = []
+        st.session_state.document_summary = ""
+        st.session_state.extracted_keywords = []
+        st.session_state.concept_map_data = ""
+        st.session_state.timeline_data = ""
+        st.session_state.page_chunk_counts = {} # Bilgi yoğunluğunu da sıfırla
+        st.session_state.last_answer = ""
+        st.session_state.refined_answer = ""
+        st.session_state.source_documents = []
+        st.session_state.session_chunks = []
+        st.session_state.artifacts_key = None
+
+        current_file_chunks = []
+        index_loaders = {} # {dosya_anahtarı: () -> (chunks, vectors)}
+        index_sources = {}
+        pipeline_files = []
+        for file_name, file_key, file_bytes in file_entries:
+            # Dosyalar içerik anahtarıyla saklanır; başka bir oturumun aynı adlı dosyası üzerine yazılmaz.
+            file_path = save_document_file(file_key, file_bytes)
+            pipeline_files.append((file_path, file_name, file_key))
+
+        # Çıkarma, chunk'lama ve embedding aşamaları eş zamanlı çalışır; her aşamanın ilerlemesi ayrı gösterilir.
+        progress_placeholder = st.empty()
+        def show_ingestion_progress(progress):
+            stages = progress["stages"]
+            with progress_placeholder.container():
+                st.caption(f"⚙️ İşlenen dosya: {progress['files_done']}/{progress['files_total']}")
+                total_pages = max(progress["total_pages"], 1)
+                st.progress(min(stages["extract"]["items"] / total_pages, 1.0),
+                            text=f"📄 Metin çıkarma: {stages['extract']['items']} sayfa ({stages['extract']['per_sec']:.1f} sayfa/sn)")
+                st.progress(1.0 if stages["chunk"]["done"] else min(stages["extract"]["items"] / total_pages, 1.0),
+                            text=f"✂️ Chunk'lama: {stages['chunk']['items']} chunk ({stages['chunk']['per_sec']:.1f} chunk/sn)")
+                st.progress(min(stages["embed"]["items"] / max(stages["chunk"]["items"], 1), 1.0),
+                            text=f"🧬 Embedding: {stages['embed']['items']}/{stages['chunk']['items']} chunk ({stages['embed']['per_sec']:.1f} chunk/sn)")
 
         try:
-            doc = fitz.open(file_path)
-            st.session_state.pdf_previews[uploaded_file.name] = {
-                "total_pages": doc.page_count,
+            pipeline_results = IngestionPipeline(ingestion_cache).run(pipeline_files, on_progress=show_ingestion_progress)
+        except Exception as e:
+            st.error(f"PDF'ler işlenirken hata oluştu: {e}")
+            pipeline_results = {}
+
+        for file_path, file_name, file_key in pipeline_files:
+            result = pipeline_results.get(file_key)
+            if result is None:
+                continue
+            if isinstance(result, Exception):
+                st.error(f"{file_name} işlenemedi: {result}")
+                continue
+            meta, chunks_from_file, vectors_from_file, from_cache = result
+
+            st.session_state.pdf_previews[file_name] = {
+                "total_pages": meta["total_pages"],
                 "current_page_display": 1,
-                "path": file_path
+                "path": file_path,
+                "file_key": file_key
             }
-            doc.close()
-        except Exception as e:
-            st.error(f"{uploaded_file.name} için sayfa sayısı alınamadı: {e}")
-            continue
-
-        pages_data = extract_pages_from_pdf(file_path)
-        if pages_data:
-            chunks_from_file = chunk_pages(pages_data)
-            current_file_chunks.extend(chunks_from_file)
-            st.write(f"📄 {uploaded_file.name} ({st.session_state.pdf_previews.get(uploaded_file.name, {}).get('total_pages', 'N/A')} sayfa) işlendi ({len(chunks_from_file)} chunk).")
+            if chunks_from_file:
+                current_file_chunks.extend(chunks_from_file)
+                index_loaders[file_key] = lambda c=chunks_from_file, v=vectors_from_file: (c, v)
+                index_sources[file_key] = file_name
+                if from_cache:
+                    cache_note = " (önbellekten)"
+                elif meta.get("embedding_stats", {}).get("embedded"):
+                    cache_note = f" (embedding: {meta['embedding_stats']['embedded_per_sec']:.1f} chunk/sn)"
+                else:
+                    cache_note = ""
+                st.write(f"📄 {file_name} ({meta['total_pages']} sayfa) işlendi ({len(chunks_from_file)} chunk){cache_note}.")
+            else:
+                st.write(f"⚠️ {file_name} dosyasından metin çıkarılamadı veya dosya boş.")
+
+        if current_file_chunks:
+            # Bilgi yoğunluğu hesaplaması
+            page_counts = defaultdict(lambda: defaultdict(int))
+            for chunk in current_file_chunks:
+                source = chunk.metadata.get("source", "Bilinmeyen Kaynak")
+                page = chunk.metadata.get("page", 0) # Sayfa no yoksa 0 varsayalım
+                if page > 0: # Geçerli sayfa numarası varsa say
+                    page_counts[source][page] += 1
+            st.session_state.page_chunk_counts = {k: dict(v) for k, v in page_counts.items()} # defaultdict'u dict'e çevir
+
+            # Oturumun isim alanı bu belge kümesine atanır. Derlem indeksi önceki derlemden artımlı kurulur
+            # (sadece yeni dosyaların önbellekteki vektörleri eklenir); aynı kümeyi başka bir oturum zaten
+            # kurduysa hiçbir şey yeniden kurulmaz. Embedding modeli burada çağrılmaz.
+            added_ids, removed_ids = assign_documents(st.session_state.namespace, index_sources, index_loaders)
+            st.success(f"✅ Tüm PDF'ler işlendi ve veritabanı güncellendi! ({len(added_ids)} dosya eklendi, {len(removed_ids)} dosya çıkarıldı)")
         else:
-            st.write(f"⚠️ {uploaded_file.name} dosyasından metin çıkarılamadı veya dosya boş.")
+            st.warning("⚠️ Yüklenen PDF'lerden metin çıkarılamadı veya PDF'ler boş.")
+
+        st.session_state.session_chunks = current_file_chunks
+        st.session_state.corpus_signature = corpus_signature
 
-    all_chunks_for_session = current_file_chunks
+    all_chunks_for_session = st.session_state.session_chunks
 
     if all_chunks_for_session:
-        # Bilgi yoğunluğu hesaplaması
-        page_counts = defaultdict(lambda: defaultdict(int))
-        for chunk in all_chunks_for_session:
-            source = chunk.metadata.get("source", "Bilinmeyen Kaynak")
-            page = chunk.metadata.get("page", 0) # Sayfa no yoksa 0 varsayalım
-            if page > 0: # Geçerli sayfa numarası varsa say
-                page_counts[source][page] += 1
-        st.session_state.page_chunk_counts = {k: dict(v) for k, v in page_counts.items()} # defaultdict'u dict'e çevir
-
-        # Embedding ve diğer işlemler
-        if not os.path.exists("vectordb"):
-            os.makedirs("vectordb")
-        embed_and_store(all_chunks_for_session)
-        st.success("✅ Tüm PDF'ler işlendi ve veritabanı oluşturuldu/güncellendi!")
-
-        with st.spinner("🤔 Örnek sorular ve anahtar kelimeler hazırlanıyor..."):
-            st.session_state.suggested_questions = generate_suggested_questions(all_chunks_for_session, final_selected_role, selected_language_code, num_questions=3)
-            st.session_state.extracted_keywords = extract_keywords_from_documents(all_chunks_for_session, final_selected_role, selected_language_code, num_keywords=10)
+        # Örnek sorular ve anahtar kelimeler derlem + rol + dil için bir kez, arka planda üretilir ve diskte saklanır;
+        # soru alanı beklemeden kullanılabilir, sonuçlar hazır olduklarında görünür.
+        artifacts_key = make_corpus_key([key for _, key, _ in file_entries], final_selected_role, selected_language_code)
+        schedule_artifacts = st.session_state.artifacts_key != artifacts_key
+        if schedule_artifacts:
+            # İşler anahtar başına oturumda bir kez başlatılır; başarısız olan iş her yeniden çalıştırmada tekrarlanmaz.
+            st.session_state.suggested_questions = []
+            st.session_state.extracted_keywords = []
+            st.session_state.artifacts_key = artifacts_key
+        if not (st.session_state.suggested_questions and st.session_state.extracted_keywords):
+            artifacts = load_or_schedule_corpus_artifacts(
+                ingestion_cache, artifacts_key, all_chunks_for_session, final_selected_role, selected_language_code,
+                waiter=st.session_state.namespace, schedule=schedule_artifacts,
+            )
+            st.session_state.suggested_questions = artifacts["suggested_questions"] or []
+            st.session_state.extracted_keywords = artifacts["keywords"] or []
+            pending_artifact_jobs = [artifact_job_key(artifacts_key, name) for name, value in artifacts.items()
+                                     if value is None and job_registry.is_running(artifact_job_key(artifacts_key, name))]
+
+        # İsteğe bağlı: örnek sorular boşta önceden cevaplanır (bkz. speculative_answers)
+        if prefetch_suggestions and st.session_state.suggested_questions:
+            index_path = get_namespace_index(st.session_state.namespace)
+            vectorstore = get_vectorstore(index_path) if index_path else None
+            if vectorstore:
+                index_version = (index_path, get_index_signature(index_path))
+                prefetched_key = (index_version, final_selected_role, selected_language_code, tuple(st.session_state.suggested_questions))
+                if st.session_state.prefetched_key != prefetched_key:
+                    speculative_answers.schedule(vectorstore, index_version, st.session_state.suggested_questions, final_selected_role,
+                                                 selected_language_code, waiter=st.session_state.namespace)
+                    st.session_state.prefetched_key = prefetched_key
     else:
-        st.warning("⚠️ Yüklenen PDF'lerden metin çıkarılamadı veya PDF'ler boş.")
         st.session_state.suggested_questions = []
         st.session_state.extracted_keywords = []
         st.session_state.concept_map_data = ""
         st.session_state.timeline_data = ""
         st.session_state.page_chunk_counts = {}
+else:
+    # Dosyalar kaldırıldıysa, aynı dosyalar tekrar yüklendiğinde önizleme ve state yeniden kurulsun.
+    if st.session_state.corpus_signature is not None:
+        scheduler.cancel(st.session_state.namespace)
+        job_registry.detach(st.session_state.namespace)
+        speculative_answers.detach(st.session_state.namespace)
+    st.session_state.corpus_signature = None
+    st.session_state.artifacts_key = None
 
 
 # PDF Önizleme Alanı
@@ -166,18 +341,43 @@ if st.session_state.pdf_previews:
                 st.session_state.pdf_previews[pdf_name]['current_page_display'] = page_to_show_user
                 page_num_fitz = page_to_show_user - 1
 
-                texts_to_highlight_on_page = []
-                if st.session_state.source_documents:
-                    for src_doc in st.session_state.source_documents:
-                        if src_doc.metadata.get('source') == pdf_name and \
-                           src_doc.metadata.get('page') == page_to_show_user:
-                            texts_to_highlight_on_page.append(src_doc.page_content)
-
-                img_bytes = get_pdf_page_image_bytes(preview_data['path'], page_num_fitz, texts_to_highlight_on_page)
-                if img_bytes:
-                    st.image(img_bytes, caption=f"{pdf_name} - Sayfa {page_to_show_user}{' (vurgulandı)' if texts_to_highlight_on_page else ''}", use_column_width=True)
-                else:
-                    st.warning(f"{pdf_name} - Sayfa {page_to_show_user} için önizleme oluşturulamadı.")
+                full_resolution = st.checkbox("🔍 Tam çözünürlük", key=f"preview_full_{pdf_name}")
+                zoom = FULL_ZOOM if full_resolution else THUMBNAIL_ZOOM
+
+                texts_to_highlight_on_page, highlight_rects = get_page_highlights(pdf_name, preview_data, page_to_show_user)
+                image_placeholder = st.empty()
+                caption = f"{pdf_name} - Sayfa {page_to_show_user}{' (vurgulandı)' if texts_to_highlight_on_page else ''}"
+                render_zooms = [THUMBNAIL_ZOOM, FULL_ZOOM] if full_resolution else [THUMBNAIL_ZOOM]
+                img_bytes = None
+                for render_zoom in render_zooms: # Tam çözünürlük hazırlanırken küçük önizleme gösterilir
+                    img_bytes = get_pdf_page_image_bytes(
+                        preview_data['path'], page_num_fitz,
+                        highlight_texts=None if highlight_rects else texts_to_highlight_on_page,
+                        highlight_rects=highlight_rects,
+                        zoom=render_zoom,
+                        cache_key=preview_data['file_key'],
+                    )
+                    if img_bytes:
+                        image_placeholder.image(img_bytes, caption=caption, use_column_width=True)
+                if not img_bytes:
+                    image_placeholder.warning(f"{pdf_name} - Sayfa {page_to_show_user} için önizleme oluşturulamadı.")
+
+                # Komşu ve kaynak gösterilen sayfalar arka planda hazırlanır; sayfa değiştirmek anında olur.
+                cited_pages = sorted({
+                    src_doc.metadata['page'] for src_doc in st.session_state.source_documents
+                    if src_doc.metadata.get('source') == pdf_name and isinstance(src_doc.metadata.get('page'), int)
+                })
+                neighbor_pages = [page_to_show_user + offset for offset in range(1, PREVIEW_PREFETCH_PAGES + 1)]
+                neighbor_pages += [page_to_show_user - offset for offset in range(1, PREVIEW_PREFETCH_PAGES + 1)]
+                prerender_preview_pages(pdf_name, preview_data, neighbor_pages + cited_pages, zoom)
+                if cited_pages:
+                    st.caption("📚 Kaynak gösterilen sayfalar:")
+                    jump_columns = st.columns(min(len(cited_pages), 8))
+                    for i, cited_page in enumerate(cited_pages):
+                        jump_columns[i % len(jump_columns)].button(
+                            f"Sayfa {cited_page}", key=f"jump_{pdf_name}_{cited_page}",
+                            on_click=jump_to_preview_page, args=(pdf_name, cited_page),
+                        )
             else:
                 st.info(f"{pdf_name} içeriği boş veya okunamadı.")
 
@@ -207,6 +407,8 @@ if uploaded_files and all_chunks_for_session:
             st.sidebar.caption(kw)
 
     # Örnek Sorular
+    if pending_artifact_jobs:
+        wait_for_background_artifacts(pending_artifact_jobs)
     if st.session_state.suggested_questions:
         st.markdown("---")
         st.subheader("💡 Örnek Sorular")
@@ -217,37 +419,59 @@ if uploaded_files and all_chunks_for_session:
                 with cols[i % num_suggestion_cols]:
                     if st.button(sq, key=f"suggested_q_{i}", use_container_width=True):
                         st.session_state.current_question_input = sq
-                        st.experimental_rerun()
+                        st.session_state.main_question_input_field = sq # Soru kutusu aşağıda oluşturulduğu için değeri burada verilebilir
+                        # Önceden cevaplama açıksa öneri doğrudan cevaplanır (hazırsa beklemeden)
+                        st.session_state.ask_suggested_question = prefetch_suggestions
+                        st.rerun()
 
     # Soru Giriş Alanı
-    question = st.text_input("❓ Soru Sor", value=st.session_state.current_question_input, key="main_question_input_field")
+    if "main_question_input_field" not in st.session_state:
+        st.session_state.main_question_input_field = st.session_state.current_question_input
+    question = st.text_input("❓ Soru Sor", key="main_question_input_field")
     if st.session_state.main_question_input_field != st.session_state.current_question_input:
         st.session_state.current_question_input = st.session_state.main_question_input_field
-        st.experimental_rerun()
+        st.rerun()
 
     # Aksiyon Butonları
+    # Model çıktıları token token üretilir; butonlar sadece akışı başlatır, akış aşağıdaki çıktı alanında gösterilir.
+    answer_stream = None # (kaynak belgeler, token akışı)
+    answer_from_cache = False
+    answer_cache_args = None
+    context_report = {} # Cevap için hazırlanan bağlamın token istatistikleri
+    answer_status = {} # Cevap akışının sonucu; sadece eksiksiz üretilen cevaplar önbelleğe yazılır
+    summary_stream = None
+    concept_map_stream = None
+    timeline_stream = None
+    refine_stream = None
+
     action_cols = st.columns(4)
     with action_cols[0]: # Yanıtla Butonu
-        if st.button("💬 Yanıtla", use_container_width=True) and st.session_state.current_question_input:
+        ask_clicked = st.button("💬 Yanıtla", use_container_width=True) or st.session_state.pop("ask_suggested_question", False)
+        if ask_clicked and st.session_state.current_question_input:
             st.session_state.last_question = st.session_state.current_question_input
+            st.session_state.last_answer = ""
             st.session_state.refined_answer = ""
             st.session_state.document_summary = ""
             st.session_state.concept_map_data = ""
             st.session_state.timeline_data = ""
-            vectorstore = load_vectorstore()
+            index_path = get_namespace_index(st.session_state.namespace)
+            vectorstore = get_vectorstore(index_path) if index_path else None # Bellekte tutulur; aynı derlemi kullanan oturumlarla paylaşılır
             if vectorstore:
-                with st.spinner("Yanıt hazırlanıyor..."):
-                    qa_chain = get_qa_chain(vectorstore, final_selected_role, selected_language_code)
-                    input_data = {"query": st.session_state.current_question_input}
-                    response_data = qa_chain.invoke(input_data)
-                    current_answer = response_data["result"]
-                    current_sources = response_data.get("source_documents", [])
-                    st.session_state.last_answer = current_answer
-                    st.session_state.source_documents = current_sources
-                    st.session_state.conversation_history.append({
-                        "question": st.session_state.current_question_input, "answer": current_answer, "sources": current_sources,
-                        "role": final_selected_role, "language": selected_language_label, "refined_answer": ""
-                    })
+                # Aynı (veya çok benzer) soru bu indeks, rol ve dil için daha önce sorulduysa cevap önbellekten gelir.
+                answer_cache_args = ((index_path, get_index_signature(index_path)), final_selected_role, selected_language_code, st.session_state.current_question_input)
+                cached_answer = get_answer_cache().get(*answer_cache_args)
+                if not cached_answer:
+                    # Önceden cevaplanmış bir öneriyse cevap normal önbelleğe taşınır
+                    cached_answer = speculative_answers.take(*answer_cache_args)
+                    if cached_answer:
+                        get_answer_cache().put(*answer_cache_args, cached_answer["answer"], cached_answer["sources"])
+                if cached_answer:
+                    answer_from_cache = True
+                    answer_stream = (cached_answer["sources"], iter([cached_answer["answer"]]))
+                else:
+                    with st.spinner("İlgili bölümler aranıyor..."):
+                        answer_stream = stream_answer(vectorstore, st.session_state.current_question_input, final_selected_role, selected_language_code,
+                                                      context_report=context_report, owner=st.session_state.namespace, status=answer_status)
             else:
                 st.error("❌ Vektör veritabanı yüklenemedi. Lütfen PDF yükleyip işleyin.")
                 st.session_state.last_answer = ""
@@ -260,13 +484,12 @@ if uploaded_files and all_chunks_for_session:
             st.session_state.source_documents = []
             st.session_state.concept_map_data = ""
             st.session_state.timeline_data = ""
+            st.session_state.document_summary = ""
             if all_chunks_for_session:
-                with st.spinner("📚 Belgeler özetleniyor... Bu işlem biraz zaman alabilir."):
-                    summary = summarize_documents(all_chunks_for_session, final_selected_role, selected_language_code)
-                    st.session_state.document_summary = summary
+                with st.spinner("📚 Belge bölümleri özetleniyor... Bu işlem biraz zaman alabilir."):
+                    summary_stream = summarize_documents(all_chunks_for_session, final_selected_role, selected_language_code, stream=True, owner=st.session_state.namespace)
             else:
                 st.warning("⚠️ Özetlenecek belge bulunamadı. Lütfen önce PDF yükleyin.")
-                st.session_state.document_summary = ""
 
     with action_cols[2]: # Konsept Haritası Butonu
         if st.button("🧠 Konsept Haritası", use_container_width=True):
@@ -275,13 +498,11 @@ if uploaded_files and all_chunks_for_session:
             st.session_state.source_documents = []
             st.session_state.document_summary = ""
             st.session_state.timeline_data = ""
+            st.session_state.concept_map_data = ""
             if all_chunks_for_session:
-                with st.spinner("🗺️ Konsept haritası oluşturuluyor..."):
-                    map_data = generate_concept_map_data(all_chunks_for_session, final_selected_role, selected_language_code)
-                    st.session_state.concept_map_data = map_data
+                concept_map_stream = generate_concept_map_data(all_chunks_for_session, final_selected_role, selected_language_code, stream=True, owner=st.session_state.namespace)
             else:
                 st.warning("⚠️ Konsept haritası için belge bulunamadı. Lütfen önce PDF yükleyin.")
-                st.session_state.concept_map_data = ""
 
     with action_cols[3]: # Zaman Çizelgesi Butonu
         if st.button("⏳ Zaman Çizelgesi", use_container_width=True):
@@ -290,26 +511,36 @@ if uploaded_files and all_chunks_for_session:
             st.session_state.source_documents = []
             st.session_state.document_summary = ""
             st.session_state.concept_map_data = ""
+            st.session_state.timeline_data = ""
             if all_chunks_for_session:
-                with st.spinner("📅 Zaman çizelgesi çıkarılıyor..."):
-                    timeline = extract_timeline_from_documents(all_chunks_for_session, final_selected_role, selected_language_code)
-                    st.session_state.timeline_data = timeline
+                timeline_stream = extract_timeline_from_documents(all_chunks_for_session, final_selected_role, selected_language_code, stream=True, owner=st.session_state.namespace)
             else:
                 st.warning("⚠️ Zaman çizelgesi için belge bulunamadı. Lütfen önce PDF yükleyin.")
-                st.session_state.timeline_data = ""
 
 
     # Çıktı Alanları
     st.markdown("---") # Ayırıcı
 
     # Belge Özeti Gösterimi
-    if st.session_state.document_summary:
+    if summary_stream is not None:
+        st.markdown("### 📜 Belge Özeti")
+        st.session_state.document_summary = render_stream(summary_stream)
+    elif st.session_state.document_summary:
         st.markdown("### 📜 Belge Özeti")
         st.write(st.session_state.document_summary)
 
     # Konsept Haritası Gösterimi
-    if st.session_state.concept_map_data:
+    if concept_map_stream is not None:
         st.markdown("### 🗺️ Konsept Haritası")
+        # Ham çıktı akarken gösterilir, bitince Mermaid bloğu ayıklanıp aşağıdaki gösterime geçilir.
+        raw_map_placeholder = st.empty()
+        with raw_map_placeholder.container():
+            raw_map_text = render_stream(concept_map_stream)
+        raw_map_placeholder.empty()
+        st.session_state.concept_map_data = extract_mermaid_code(raw_map_text)
+    if st.session_state.concept_map_data:
+        if concept_map_stream is None:
+            st.markdown("### 🗺️ Konsept Haritası")
         if "```mermaid" in st.session_state.concept_map_data:
             st.markdown(st.session_state.concept_map_data)
         else:
@@ -317,41 +548,66 @@ if uploaded_files and all_chunks_for_session:
             st.code(st.session_state.concept_map_data)
 
     # Zaman Çizelgesi Gösterimi
-    if st.session_state.timeline_data:
+    if timeline_stream is not None:
+        st.markdown("### 📅 Zaman Çizelgesi")
+        st.session_state.timeline_data = render_stream(timeline_stream)
+    elif st.session_state.timeline_data:
         st.markdown("### 📅 Zaman Çizelgesi")
         st.markdown(st.session_state.timeline_data)
 
 
     # Cevap ve İlgili İşlemler Gösterimi
-    if st.session_state.last_answer:
+    if answer_stream is not None:
+        st.markdown("### 💡 Güncel Cevap")
+        current_sources, answer_tokens = answer_stream
+        # Derlem aynı belgeleri başka adlarla yükleyen oturumlarla paylaşılabilir; kaynaklar bu oturumdaki adlarla gösterilir.
+        current_sources = relabel_sources(current_sources, read_namespace(st.session_state.namespace)["documents"])
+        st.session_state.source_documents = current_sources
+        prerender_cited_pages(current_sources)
+        current_answer = render_stream(answer_tokens)
+        if answer_from_cache:
+            st.caption("⚡ Bu cevap önbellekten getirildi.")
+        else:
+            if context_report:
+                st.caption(
+                    f"🧩 Bağlam: {context_report['context_tokens']} token "
+                    f"(ilk {BASELINE_CONTEXT_CHUNKS} chunk'ın ham haline göre {context_report['saved_tokens']} token tasarruf; "
+                    f"{context_report['merged']} birleştirme, "
+                    f"{context_report['duplicates_dropped']} tekrar atıldı)"
+                )
+            if current_answer and answer_status.get("completed"): # Hata mesajları ve yarım cevaplar önbelleğe yazılmaz
+                get_answer_cache().put(*answer_cache_args, current_answer, current_sources)
+        st.session_state.last_answer = current_answer
+        st.session_state.conversation_history.append({
+            "question": st.session_state.last_question, "answer": current_answer, "sources": current_sources,
+            "role": final_selected_role, "language": selected_language_label, "refined_answer": ""
+        })
+    elif st.session_state.last_answer:
         st.markdown("### 💡 Güncel Cevap")
         st.write(st.session_state.last_answer)
 
+    if st.session_state.last_answer:
         col_refine1, col_refine2 = st.columns(2)
         with col_refine1:
             if st.button("🔁 Cevabı Detaylandır"):
-                from chatbot import refine_answer
                 if st.session_state.last_question and st.session_state.last_answer:
-                    with st.spinner("Cevap detaylandırılıyor..."):
-                        refined_text = refine_answer(st.session_state.last_question, st.session_state.last_answer, "detaylandır", final_selected_role, selected_language_code)
-                        st.session_state.refined_answer = refined_text
-                        if st.session_state.conversation_history:
-                            st.session_state.conversation_history[-1]["refined_answer"] = refined_text
+                    refine_stream = refine_answer(st.session_state.last_question, st.session_state.last_answer, "detaylandır", final_selected_role, selected_language_code, stream=True, owner=st.session_state.namespace)
                 else:
                     st.warning("Detaylandırmak için önce bir cevap alınmalı.")
         with col_refine2:
             if st.button("🔀 Cevabı Sadeleştir"):
-                from chatbot import refine_answer
                 if st.session_state.last_question and st.session_state.last_answer:
-                     with st.spinner("Cevap sadeleştiriliyor..."):
-                        refined_text = refine_answer(st.session_state.last_question, st.session_state.last_answer, "sadeleştir", final_selected_role, selected_language_code)
-                        st.session_state.refined_answer = refined_text
-                        if st.session_state.conversation_history:
-                            st.session_state.conversation_history[-1]["refined_answer"] = refined_text
+                    refine_stream = refine_answer(st.session_state.last_question, st.session_state.last_answer, "sadeleştir", final_selected_role, selected_language_code, stream=True, owner=st.session_state.namespace)
                 else:
                     st.warning("Sadeleştirmek için önce bir cevap alınmalı.")
 
-        if st.session_state.refined_answer:
+        if refine_stream is not None:
+            st.markdown("#### ✨ Güncel Düzenlenmiş Cevap:")
+            refined_text = render_stream(refine_stream)
+            st.session_state.refined_answer = refined_text
+            if st.session_state.conversation_history:
+                st.session_state.conversation_history[-1]["refined_answer"] = refined_text
+        elif st.session_state.refined_answer:
             st.markdown("#### ✨ Güncel Düzenlenmiş Cevap:")
             st.write(st.session_state.refined_answer)
 
@@ -361,10 +617,36 @@ if uploaded_files and all_chunks_for_session:
             for doc in st.session_state.source_documents:
                 source_name = doc.metadata.get("source", "Bilinmeyen Kaynak")
                 page_number = doc.metadata.get("page", "Bilinmeyen Sayfa")
+                if doc.metadata.get("pages"): # Tekilleştirilmiş chunk birden fazla sayfada geçiyor
+                    page_number = ", ".join(map(str, doc.metadata["pages"]))
                 references.add(f"- {source_name} (Sayfa: {page_number})")
             for ref in sorted(list(references)):
                 st.markdown(ref)
 
+# Cevap önbelleği istatistikleri (Kenar Çubuğunda)
+answer_cache_stats = get_answer_cache().stats
+if any(answer_cache_stats.values()):
+    st.sidebar.caption(
+        f"⚡ Cevap önbelleği: {answer_cache_stats['hits']} tam + {answer_cache_stats['semantic_hits']} benzer isabet, "
+        f"{answer_cache_stats['misses']} ıskalama"
+    )
+
+speculative_stats = speculative_answers.stats
+if prefetch_suggestions and speculative_stats["generated"]:
+    st.sidebar.caption(
+        f"⚡ Önceden cevaplanan sorular: {speculative_stats['generated']} üretildi, {speculative_stats['used']} kullanıldı, "
+        f"{speculative_stats['discarded']} kullanılmadan atıldı"
+    )
+
+context_totals = context_usage.snapshot()
+if context_totals["queries"]:
+    st.sidebar.caption(
+        f"🧩 Bağlam: {context_totals['queries']} sorguda ilk {BASELINE_CONTEXT_CHUNKS} chunk'ın ham haline göre toplam "
+        f"{context_totals['saved_tokens']} prompt token'ı tasarruf edildi ({context_totals['context_tokens']} / {context_totals['baseline_tokens']})"
+    )
+
+st.sidebar.caption(f"🗂️ Koleksiyon: `{st.session_state.namespace}` (batch_qa.py --namespace ile kullanılabilir)")
+
 # Konuşma Geçmişi (Kenar Çubuğunda)
 st.sidebar.title("📜 Konuşma Geçmişi")
 if not st.session_state.conversation_history:
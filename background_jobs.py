@@ -0,0 +1,127 @@
+"""
+Arayüzü bekletmeden arka planda çalışan işler. Yükleme ve indeksleme biter bitmez soru alanı kullanılabilir;
+örnek sorular ve anahtar kelimeler gibi derlem çıktıları arka planda (LLM zamanlayıcısında "background"
+önceliğiyle) üretilip ingestion önbelleğine yazılır ve hazır olduklarında arayüzde görünür.
+Aynı anahtarlı bir iş zaten çalışıyorsa yeniden başlatılmaz; aynı belgeleri yükleyen oturumlar işi paylaşır.
+Paylaşılan işin LLM çağrıları bir oturum adına değil işin kendi sahibi adına yapılır; bir oturum belgelerini
+değiştirince (detach) iş sadece bekleyen başka oturum kalmadıysa iptal edilir.
+"""
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from chatbot import extract_keywords_from_documents, generate_suggested_questions
+from llm_scheduler import scheduler
+
+# Aynı anda çalışan arka plan işi sayısı; model çağrılarının sınırı ayrıca llm_scheduler'dadır.
+BACKGROUND_WORKERS = 2
+# Yükleme sonrası üretilen derlem çıktıları (ingestion önbelleğindeki artifact adları)
+CORPUS_ARTIFACTS = ("suggested_questions", "keywords")
+NUM_SUGGESTED_QUESTIONS = 3
+NUM_KEYWORDS = 10
+
+
+class _Job:
+    """Çalışan / sıradaki bir iş: Future, LLM zamanlayıcısındaki sahibi ve sonucu bekleyen oturumlar."""
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.waiters = set()
+        self.future = None
+
+
+class JobRegistry:
+    """Anahtar başına en fazla bir çalışan iş tutan, thread havuzu üzerindeki iş kaydı."""
+
+    def __init__(self, max_workers=BACKGROUND_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="background-job")
+        self._jobs = {} # anahtar -> _Job (sadece çalışan / sıradaki işler)
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+
+    def submit(self, key, fn, *args, waiter=None, **kwargs):
+        """
+        İşi başlatır; aynı anahtarlı iş zaten çalışıyorsa onun Future'ını döndürür.
+        fn, owner anahtar kelime argümanıyla çağrılır; LLM çağrılarını bu sahiple yapmalıdır (oturumun sahibiyle değil).
+        waiter: Sonucu bekleyen oturum; detach(waiter) ile ayrılır.
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                job = _Job(owner=f"job:{next(self._sequence)}")
+                job.future = self._executor.submit(self._run, key, job, fn, *args, owner=job.owner, **kwargs)
+                self._jobs[key] = job
+            if waiter is not None:
+                job.waiters.add(waiter)
+            return job.future
+
+    def _run(self, key, job, fn, *args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            print(f"Arka plan işi başarısız ({key}): {e}")
+            return None
+        finally:
+            with self._lock:
+                if self._jobs.get(key) is job: # İptal edildiyse aynı anahtarla yeni bir iş başlamış olabilir
+                    del self._jobs[key]
+
+    def detach(self, waiter):
+        """
+        waiter'ı beklediği işlerden çıkarır. Bekleyeni kalmayan işlerin LLM çağrıları iptal edilir ve kayıttan
+        çıkarılır; aynı anahtar tekrar istenirse yeni iş başlar. Bekleyeni hiç olmamış işlere dokunulmaz.
+        Dönüş: iptal edilen iş sayısı.
+        """
+        abandoned = []
+        with self._lock:
+            for key, job in list(self._jobs.items()):
+                if waiter in job.waiters:
+                    job.waiters.discard(waiter)
+                    if not job.waiters:
+                        del self._jobs[key]
+                        abandoned.append(job)
+        for job in abandoned:
+            job.future.cancel()
+            scheduler.cancel(job.owner)
+        return len(abandoned)
+
+    def is_running(self, key):
+        with self._lock:
+            return key in self._jobs
+
+
+job_registry = JobRegistry()
+
+
+def _generate_corpus_artifact(cache, artifacts_key, name, document_chunks, role, language_code, owner):
+    if name == "suggested_questions":
+        value = generate_suggested_questions(document_chunks, role, language_code, num_questions=NUM_SUGGESTED_QUESTIONS, owner=owner)
+    else:
+        # Anahtar kelimeler derlem notlarından çıkarıldığı için özet, konsept haritası ve zaman çizelgesi
+        # sonradan istendiğinde notlar hazır olur.
+        value = extract_keywords_from_documents(document_chunks, role, language_code, num_keywords=NUM_KEYWORDS, owner=owner)
+    if value: # Hatalı (boş) sonuçlar önbelleğe yazılmaz
+        cache.save_artifact(artifacts_key, name, value)
+    return value
+
+
+def artifact_job_key(artifacts_key, name):
+    return f"{artifacts_key}:{name}"
+
+
+def load_or_schedule_corpus_artifacts(cache, artifacts_key, document_chunks, role, language_code, waiter=None,
+                                      names=CORPUS_ARTIFACTS, schedule=True):
+    """
+    Derlem çıktılarını önbellekten okur; olmayanlar için (schedule=True ise) arka plan işi başlatır.
+    waiter: Sonucu bekleyen oturum (bkz. JobRegistry.detach).
+    Dönüş: {ad: değer veya None (henüz hazır değil)}.
+    """
+    artifacts = {}
+    for name in names:
+        artifacts[name] = cache.load_artifact(artifacts_key, name)
+        if artifacts[name] is None and schedule:
+            job_registry.submit(
+                artifact_job_key(artifacts_key, name), _generate_corpus_artifact,
+                cache, artifacts_key, name, document_chunks, role, language_code, waiter=waiter,
+            )
+    return artifacts
@@ -0,0 +1,234 @@
+"""
+Arayüz olmadan toplu soru-cevap.
+Sorular bir dosyadan okunur, mevcut indeks üzerinde (get_qa_chain ile aynı retrieval, bağlam bütçesi ve rol/dil
+prompt'larıyla) sınırlı sayıda eş zamanlı çağrıyla cevaplanır; her cevap kaynaklarıyla birlikte JSONL çıktısına
+geldiği anda yazılır. Retrieval RETRIEVAL_BATCH_SIZE'lık pencereler halinde toplu yapılır (tek embedding isteği ve
+tek FAISS araması). Yarıda kalan bir çalıştırma aynı komutla devam ettirilir: çıktıda cevabı olan sorular atlanır.
+
+Sorular varsayılan olarak API'nin varsayılan isim alanındaki belgeler üzerinde cevaplanır; Streamlit uygulamasında
+yüklenen belgeler için --app-session (en son kullanılan oturum) veya --namespace <kenar çubuğundaki koleksiyon adı>.
+
+Kullanım:
+    python batch_qa.py sorular.txt cevaplar.jsonl --app-session --role "Avukat ⚖️" --language tr --concurrency 4
+    python batch_qa.py sorular.jsonl cevaplar.jsonl --namespace sozlesmeler   # satır başına {"id", "question", "role", "language"}
+"""
+import argparse
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+
+from chatbot import answer_from_context, retrieve_contexts
+from embedder import load_vectorstore
+from namespaces import DEFAULT_NAMESPACE, get_namespace_index, latest_session_namespace, read_namespace, relabel_sources
+
+# Ollama sunucusunun paralellik ayarına (OLLAMA_NUM_PARALLEL) göre ayarlanabilir.
+DEFAULT_CONCURRENCY = 2
+# Tek seferde embed edilip aranan soru sayısı
+RETRIEVAL_BATCH_SIZE = 32
+LATENCY_PERCENTILES = (50, 90, 99)
+
+
+def make_question_id(question, role, language_code):
+    return hashlib.sha1(f"{role}\n{language_code}\n{question.strip()}".encode("utf-8")).hexdigest()[:16]
+
+
+def read_questions(path, role, language_code):
+    """
+    Düz metin (satır başına bir soru) veya JSONL (satır başına {"question", isteğe bağlı "id", "role", "language"}).
+    Dönüş: [{"id", "question", "role", "language"}, ...]; boş satırlar ve "#" ile başlayan satırlar atlanır.
+    """
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if path.endswith(".jsonl"):
+                record = json.loads(line)
+            else:
+                record = {"question": line}
+            item = {
+                "question": record["question"],
+                "role": record.get("role") or role,
+                "language": record.get("language") or language_code,
+            }
+            item["id"] = str(record.get("id") or make_question_id(item["question"], item["role"], item["language"]))
+            questions.append(item)
+    return questions
+
+
+def read_completed_ids(output_path):
+    """Önceki çalıştırmalarda cevaplanmış soruların kimlikleri. Yarım yazılmış son satır yok sayılır."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r+", encoding="utf-8") as f:
+        lines = f.readlines()
+        if lines and not lines[-1].endswith("\n"):
+            f.write("\n") # Yeni cevaplar yarım satırın devamına eklenmesin
+        for line in lines:
+            try:
+                completed.add(json.loads(line)["id"])
+            except (ValueError, KeyError):
+                continue
+    return completed
+
+
+def _serialize_sources(source_documents):
+    return [
+        {
+            "source": doc.metadata.get("source"),
+            "page": doc.metadata.get("page"),
+            "pages": doc.metadata.get("pages"),
+            "content": doc.page_content,
+        }
+        for doc in source_documents
+    ]
+
+
+class BatchRunner:
+    """Soruları ortak vectorstore üzerinde, retrieval'ı pencereler halinde toplu yaparak eş zamanlı cevaplar."""
+
+    def __init__(self, vectorstore, output_path, concurrency=DEFAULT_CONCURRENCY, retrieval_batch_size=RETRIEVAL_BATCH_SIZE,
+                 namespace_documents=None):
+        self.vectorstore = vectorstore
+        self.namespace_documents = namespace_documents or {}
+        self.output_path = output_path
+        self.concurrency = concurrency
+        self.retrieval_batch_size = max(1, retrieval_batch_size)
+        self.latencies = []
+        self.failures = 0
+        self._write_lock = threading.Lock()
+
+    def _answer(self, item, source_documents, retrieval_seconds):
+        started = time.perf_counter()
+        answer = answer_from_context(source_documents, item["question"], item["role"], item["language"])
+        # Gecikme: cevap üretimi + pencerenin retrieval süresinden soru başına düşen pay
+        latency = time.perf_counter() - started + retrieval_seconds
+        return dict(
+            item,
+            answer=answer,
+            sources=_serialize_sources(relabel_sources(source_documents, self.namespace_documents)),
+            latency_seconds=round(latency, 3),
+        )
+
+    def _submit_window(self, executor, window):
+        started = time.perf_counter()
+        contexts = retrieve_contexts(self.vectorstore, [item["question"] for item in window])
+        retrieval_seconds = (time.perf_counter() - started) / len(window)
+        return {
+            executor.submit(self._answer, item, source_documents, retrieval_seconds): item
+            for item, (source_documents, _) in zip(window, contexts)
+        }
+
+    def _write_result(self, output, item, on_result, future):
+        """Biten bir cevabı çıktıya ekler; future'ın done callback'i olarak worker thread'inde çalışır."""
+        if future.cancelled():
+            return
+        try:
+            record = future.result()
+        except Exception as e:
+            print(f"Soru cevaplanırken hata ({item['id']}): {e}")
+            with self._write_lock:
+                self.failures += 1
+            return
+        with self._write_lock:
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            self.latencies.append(record["latency_seconds"])
+            if on_result:
+                on_result(record)
+
+    def run(self, questions, on_result=None):
+        """
+        Cevaplar tamamlandıkları anda (sonraki pencerelerin retrieval'ı sürerken de) çıktı dosyasına eklenir ve
+        her satır hemen diske yazılır. Hata veren sorular yazılmaz; bir sonraki çalıştırmada yeniden denenir.
+        Dönüş: rapor sözlüğü (bkz. report)
+        """
+        started = time.perf_counter()
+        with open(self.output_path, "a", encoding="utf-8") as output, \
+                ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = []
+            try:
+                # Pencereler retrieval bitince kuyruğa eklenir; model çağrıları bu sırada önceki pencereyle devam eder.
+                for start in range(0, len(questions), self.retrieval_batch_size):
+                    for future, item in self._submit_window(executor, questions[start:start + self.retrieval_batch_size]).items():
+                        future.add_done_callback(functools.partial(self._write_result, output, item, on_result))
+                        futures.append(future)
+                wait(futures)
+            except KeyboardInterrupt:
+                # Sıradaki sorular iptal edilir. Çalışan çağrılar iptal edilemez; executor kapanırken beklenir ve
+                # cevapları yazılır. Yazılmış cevaplar bir sonraki çalıştırmada atlanır.
+                for future in futures:
+                    future.cancel()
+                print("Durduruldu; kalan sorular aynı komutla devam ettirilebilir.")
+        return self.report(time.perf_counter() - started)
+
+    def report(self, elapsed_seconds):
+        report = {
+            "answered": len(self.latencies),
+            "failed": self.failures,
+            "elapsed_seconds": round(elapsed_seconds, 2),
+            "questions_per_second": round(len(self.latencies) / elapsed_seconds, 3) if elapsed_seconds > 0 else 0.0,
+        }
+        if self.latencies:
+            for percentile, value in zip(LATENCY_PERCENTILES, np.percentile(self.latencies, LATENCY_PERCENTILES)):
+                report[f"p{percentile}_seconds"] = round(float(value), 3)
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dosyadaki soruları indeks üzerinde toplu olarak cevaplar (JSONL çıktı)")
+    parser.add_argument("questions", help="Sorular: .txt (satır başına bir soru) veya .jsonl")
+    parser.add_argument("output", help="Cevapların yazılacağı JSONL dosyası (varsa devam edilir)")
+    parser.add_argument("--namespace", default=DEFAULT_NAMESPACE, help="Soruların sorulacağı isim alanı (ör. API'deki koleksiyon)")
+    parser.add_argument("--app-session", action="store_true", help="Streamlit uygulamasının en son kullanılan oturumundaki belgeler")
+    parser.add_argument("--db-path", help="İsim alanı yerine doğrudan bir derlem dizini (vectordb/corpora/<anahtar>)")
+    parser.add_argument("--role", help="Soruda rol belirtilmemişse kullanılacak rol (varsayılan: roles.json'daki ilk rol)")
+    parser.add_argument("--language", default="tr", choices=["tr", "en"])
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--no-resume", action="store_true", help="Çıktıdaki cevapları yok say ve tüm soruları yeniden cevapla")
+    args = parser.parse_args()
+
+    role = args.role
+    if not role:
+        with open("roles.json", "r", encoding="utf-8") as f:
+            role = json.load(f)[0]
+
+    namespace = latest_session_namespace() if args.app_session else args.namespace
+    db_path = args.db_path or (get_namespace_index(namespace) if namespace else None)
+    vectorstore = load_vectorstore(db_path) if db_path else None
+    if vectorstore is None:
+        print(f"İndeks bulunamadı veya boş: {args.db_path or namespace or 'Streamlit oturumu yok'}")
+        return
+    # Kaynaklar isim alanındaki dosya adlarıyla yazılır (derlem başka adlarla yükleyenlerle paylaşılabilir)
+    namespace_documents = {} if args.db_path else read_namespace(namespace)["documents"]
+
+    questions = read_questions(args.questions, role, args.language)
+    if args.no_resume and os.path.exists(args.output):
+        os.remove(args.output)
+    completed = read_completed_ids(args.output)
+    # Aynı soru dosyada birden fazla geçiyorsa bir kez cevaplanır.
+    pending = list({item["id"]: item for item in questions if item["id"] not in completed}.values())
+    unique_count = len({item["id"] for item in questions})
+    print(f"{unique_count} soru, {unique_count - len(pending)} tanesi zaten cevaplanmış, {len(pending)} soru cevaplanacak "
+          f"(eş zamanlı: {args.concurrency}).")
+    if not pending:
+        return
+
+    runner = BatchRunner(vectorstore, args.output, args.concurrency, namespace_documents=namespace_documents)
+    total = len(pending)
+    report = runner.run(pending, on_result=lambda record: print(f"[{len(runner.latencies)}/{total}] {record['latency_seconds']:.1f} sn  {record['question'][:60]}"))
+    latency_text = ", ".join(f"p{p}={report[f'p{p}_seconds']:.2f} sn" for p in LATENCY_PERCENTILES if f"p{p}_seconds" in report)
+    print(f"{report['answered']} cevap, {report['failed']} hata, {report['elapsed_seconds']:.1f} sn, "
+          f"{report['questions_per_second']:.2f} soru/sn. Gecikme: {latency_text or '-'}")
+
+
+if __name__ == "__main__":
+    main()
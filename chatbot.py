@@ -1,28 +1,100 @@
-from langchain.chains import RetrievalQA
-from langchain_ollama import OllamaLLM
-from prompts import get_prompt_template
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 
-def get_qa_chain(vectorstore, role, language_code="tr"): # language_code parametresi eklendi
-    llm = OllamaLLM(model="qwen2.5:latest")
-    prompt = get_prompt_template(role, language_code) # language_code prompt'a iletildi
+from langchain.chains import RetrievalQA
+from hybrid_retriever import batch_retrieve, get_retriever
+from context_assembler import CONTEXT_CANDIDATES, BudgetedRetriever, assemble_context
+from corpus_analysis import NOTES_MAX_WORKERS, aggregate_keywords, aggregate_relations, aggregate_timeline, analyze_corpus, group_texts
+from ingestion_cache import IngestionCache
+from llm_scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_REFINE, RequestCancelledError
+from resources import LLM_MODEL, get_llm, get_prompt
+
+def get_qa_chain(vectorstore, role, language_code="tr", priority=PRIORITY_INTERACTIVE, owner=None): # language_code parametresi eklendi
+    llm = get_llm(priority=priority, owner=owner)
+    prompt = get_prompt(role, language_code) # language_code prompt'a iletildi
     qa_chain = RetrievalQA.from_chain_type(
         llm=llm,
         chain_type="stuff",
-        retriever=vectorstore.as_retriever(),
+        # BM25 + vektör araması (RRF); bağlam token bütçesine göre birleştirilip kırpılır
+        retriever=BudgetedRetriever(retriever=get_retriever(vectorstore, k=CONTEXT_CANDIDATES)),
         chain_type_kwargs={"prompt": prompt},
         return_source_documents=True  # Kaynak belgeleri döndürmeyi etkinleştir
     )
     return qa_chain
 
-def refine_answer(original_question, original_answer, refinement_type, role, language_code="tr"): # language_code parametresi eklendi
+def _format_context(documents):
+    # "stuff" zincirinin varsayılan birleştirme biçimiyle aynı: chunk içerikleri boş satırla ayrılır.
+    return "\n\n".join(doc.page_content for doc in documents)
+
+def stream_answer(vectorstore, question, role, language_code="tr", context_report=None, owner=None, status=None):
+    """
+    get_qa_chain ile aynı prompt, retriever ve bağlam bütçesini kullanarak cevabı token token üretir.
+    Dönüş: (kaynak_belgeler, token_akışı). Kaynaklar (bağlama giren parçalar) akış başlamadan önce hazırdır;
+    token akışı tüketildikçe model çağrısı ilerler.
+    context_report: Verilirse bağlamın token istatistikleriyle (bkz. assemble_context) güncellenir.
+    owner: Verilirse model çağrısı llm_scheduler'da bu sahip adına sıraya girer ve onunla iptal edilebilir.
+    status: Verilirse akış bitince güncellenir (bkz. _stream_llm). Hata metni de akışa eklendiği için cevap
+    sadece status["completed"] doğruysa önbelleğe yazılmalıdır.
+    """
+    llm = get_llm(priority=PRIORITY_INTERACTIVE, owner=owner)
+    prompt = get_prompt(role, language_code)
+    source_documents, context_stats = assemble_context(get_retriever(vectorstore, k=CONTEXT_CANDIDATES).invoke(question))
+    if context_report is not None:
+        context_report.update(context_stats)
+    prompt_text = prompt.format(context=_format_context(source_documents), question=question)
+    return source_documents, _stream_llm(llm, prompt_text, "Cevap üretilirken bir sorun oluştu.", "Cevap üretilirken hata", status)
+
+def retrieve_contexts(vectorstore, questions):
+    """
+    stream_answer'daki retrieval ve bağlam bütçesinin çok sorulu karşılığı: sorular tek embedding isteği ve
+    tek FAISS aramasıyla aranır (bkz. hybrid_retriever.batch_retrieve).
+    Dönüş: her soru için (kaynak_belgeler, bağlam_istatistikleri).
+    """
+    return [assemble_context(documents) for documents in batch_retrieve(vectorstore, questions, k=CONTEXT_CANDIDATES)]
+
+def answer_from_context(source_documents, question, role, language_code="tr", priority=PRIORITY_INTERACTIVE, owner=None):
+    """
+    retrieve_contexts ile hazırlanan kaynaklarla cevabı tek seferde üretir (get_qa_chain ile aynı prompt).
+    Hata olursa istisna fırlatır; çağıran hatayı sayabilir veya tekrar deneyebilir.
+    """
+    prompt_text = get_prompt(role, language_code).format(context=_format_context(source_documents), question=question)
+    return get_llm(priority=priority, owner=owner).invoke(prompt_text)
+
+def _stream_llm(llm, prompt_text, error_message, error_log_prefix, status=None):
+    """
+    llm.stream çıktısını token token aktarır. Hata olursa, invoke kullanan yollarla tutarlı olması için
+    hatayı yazdırır ve kullanıcıya gösterilecek mesajı akışın sonuna ekler.
+    status: Verilirse akış sonunda doldurulur: model cevabı eksiksiz bittiyse {"completed": True}, hata olursa
+    {"completed": False, "error": istisna}, iptal edilirse {"completed": False, "cancelled": True}.
+    Akış yarıda bırakılırsa "completed" False kalır.
+    """
+    if status is None:
+        status = {}
+    status["completed"] = False
+    try:
+        for token in llm.stream(prompt_text):
+            yield token
+    except RequestCancelledError:
+        status["cancelled"] = True
+        return # İsteyen taraf ayrıldı; gösterilecek kimse yok
+    except Exception as e:
+        print(f"{error_log_prefix}: {e}")
+        status["error"] = e
+        yield error_message
+        return
+    status["completed"] = True
+
+def refine_answer(original_question, original_answer, refinement_type, role, language_code="tr", stream=False, owner=None): # language_code parametresi eklendi
     """
     Verilen bir cevabı detaylandırır veya sadeleştirir.
     original_question: Kullanıcının ilk sorduğu soru.
     original_answer: LLM'in verdiği ilk cevap.
     refinement_type: "detaylandır" veya "sadeleştir".
     role: Mevcut aktif rol.
+    stream: True ise metin yerine token akışı (iterator) döndürülür.
+    owner: LLM zamanlayıcısında çağrının iptal sahibi (bkz. llm_scheduler).
     """
-    llm = OllamaLLM(model="qwen2.5:latest")
+    llm = get_llm(priority=PRIORITY_REFINE, owner=owner)
     
     # İyileştirme türüne göre prompt oluştur
     if refinement_type == "detaylandır":
@@ -30,7 +102,7 @@ def refine_answer(original_question, original_answer, refinement_type, role, lan
     elif refinement_type == "sadeleştir":
         refinement_instruction = "Yukarıdaki cevabı daha basit bir dille, herkesin anlayabileceği şekilde yeniden ifade et."
     else:
-        return "Geçersiz iyileştirme türü."
+        return iter(["Geçersiz iyileştirme türü."]) if stream else "Geçersiz iyileştirme türü."
 
     # Rol bilgisini de prompt'a dahil edebiliriz, böylece iyileştirme rolün tonuna uygun olur.
     
@@ -51,6 +123,9 @@ GÖREV: {refinement_instruction}
 Sadece düzenlenmiş cevabı verin.
 """
 
+    if stream:
+        return _stream_llm(llm, prompt_text, "Cevap iyileştirilirken bir sorun oluştu.", "Cevap iyileştirilirken hata oluştu")
+
     # LangChain'in LLMChain'ini veya doğrudan llm.invoke'u kullanabiliriz.
     # Burada basitlik için doğrudan invoke kullanalım.
     try:
@@ -62,15 +137,16 @@ Sadece düzenlenmiş cevabı verin.
         print(f"Cevap iyileştirilirken hata oluştu: {e}")
         return "Cevap iyileştirilirken bir sorun oluştu."
 
-def generate_suggested_questions(document_chunks, role, language_code="tr", num_questions=3):
+def generate_suggested_questions(document_chunks, role, language_code="tr", num_questions=3, priority=PRIORITY_BACKGROUND, owner=None):
     """
     Yüklenen belgelere dayanarak örnek sorular üretir.
     document_chunks: LangChain Document nesnelerinin listesi.
     role: Mevcut aktif rol (soruların role uygun olması için).
     language_code: Soruların üretileceği dil.
     num_questions: Üretilecek soru sayısı.
+    priority, owner: LLM zamanlayıcısındaki öncelik sınıfı ve iptal sahibi (bkz. llm_scheduler).
     """
-    llm = OllamaLLM(model="qwen2.5:latest")
+    llm = get_llm(priority=priority, owner=owner)
 
     # LLM'e verilecek bağlamı oluştur (örneğin ilk birkaç chunk'ın birleşimi)
     # Çok fazla chunk vermek token limitini aşabilir, bu yüzden dikkatli olmalıyız.
@@ -116,32 +192,100 @@ def generate_suggested_questions(document_chunks, role, language_code="tr", num_
         print(f"Soru önerileri üretilirken hata: {e}")
         return []
 
-def summarize_documents(document_chunks, role, language_code="tr"):
+# Map-reduce özet ayarları
+SUMMARY_CHAR_LIMIT = 10000 # Son (reduce) prompt'una girecek maksimum metin uzunluğu
+SUMMARY_GROUP_CHAR_LIMIT = 6000 # Üst seviye (özetlerin özeti) adımında tek çağrıda birleştirilecek metin uzunluğu
+SUMMARY_MAX_WORKERS = NOTES_MAX_WORKERS # Eş zamanlı map çağrısı sayısı (Ollama sunucusunun paralellik ayarına göre)
+
+def _summarize_group(llm, group_text, cache):
+    """
+    Bir chunk grubunu rol ve dilden bağımsız olarak özetler. Sonuç grup metninin hash'iyle önbelleğe yazılır;
+    rol veya dil değiştiğinde sadece reduce adımı yeniden çalışır.
+    """
+    key = hashlib.sha256(f"{LLM_MODEL}\0{group_text}".encode("utf-8")).hexdigest()
+    cached = cache.load_note("map_summary", key)
+    if cached is not None:
+        return cached
+    prompt_text = f"""Aşağıdaki metnin ana noktalarını, önemli isimleri, sayıları ve tarihleri koruyarak kısa ve nesnel bir şekilde özetle.
+Özeti metnin kendi dilinde yaz. Giriş cümlesi veya yorum ekleme.
+
+Metin:
+---
+{group_text.strip()}
+---
+"""
+    try:
+        summary = llm.invoke(prompt_text).strip()
+    except Exception as e:
+        print(f"Bölüm özeti üretilirken hata: {e}")
+        return None
+    if summary:
+        cache.save_note("map_summary", key, summary)
+    return summary
+
+def map_document_summaries(document_chunks, max_workers=SUMMARY_MAX_WORKERS, group_char_limit=SUMMARY_GROUP_CHAR_LIMIT, reduce_char_limit=SUMMARY_CHAR_LIMIT,
+                           priority=PRIORITY_REFINE, owner=None):
+    """
+    Map-reduce özetin map adımı. İlk seviyede derlem analizinin (corpus_analysis) chunk grubu notlarındaki
+    özetler kullanılır; böylece anahtar kelime, konsept haritası ve zaman çizelgesiyle aynı tek geçiş paylaşılır.
+    Özetlerin toplamı hâlâ reduce_char_limit'ten uzunsa özetler gruplanıp eş zamanlı olarak yeniden özetlenir.
+    Dönüş: (metinler, özetlendi_mi). Metinlerin toplamı reduce adımına sığar.
+    """
+    texts = [chunk_doc.page_content for chunk_doc in document_chunks if chunk_doc.page_content.strip()]
+    if sum(len(text) + 2 for text in texts) <= reduce_char_limit:
+        return texts, False # Tüm içerik tek prompt'a sığıyor, map adımına gerek yok
+
+    texts = [notes["summary"] for notes in analyze_corpus(document_chunks, max_workers=max_workers, priority=priority, owner=owner) if notes["summary"]]
+    llm = get_llm(priority=priority, owner=owner)
+    cache = IngestionCache()
+    while sum(len(text) + 2 for text in texts) > reduce_char_limit:
+        groups = group_texts(texts, group_char_limit)
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(groups)))) as executor:
+            summaries = [summary for summary in executor.map(lambda group: _summarize_group(llm, group, cache), groups) if summary]
+        if not summaries or len(summaries) >= len(texts):
+            # Özetler kısalmıyorsa (ör. tek ve çok uzun bir özet) döngüye girmemek için mevcut sonuçla devam et
+            texts = summaries or texts
+            break
+        texts = summaries
+    return texts, True
+
+def summarize_documents(document_chunks, role, language_code="tr", stream=False, mode="map_reduce", max_workers=SUMMARY_MAX_WORKERS,
+                        priority=PRIORITY_REFINE, owner=None, status=None):
     """
     Yüklenen belgelerin tamamından bir özet üretir.
     document_chunks: LangChain Document nesnelerinin listesi.
     role: Mevcut aktif rol (özetin role uygun olması için).
     language_code: Özetin üretileceği dil.
+    stream: True ise metin yerine token akışı (iterator) döndürülür.
+    mode: "map_reduce" (varsayılan) tüm belgeyi bölüm bölüm özetleyip birleştirir;
+          "truncate" sadece ilk SUMMARY_CHAR_LIMIT karakteri özetler.
+    max_workers: map_reduce modunda eş zamanlı bölüm özeti sayısı.
+    priority, owner: LLM zamanlayıcısındaki öncelik sınıfı ve iptal sahibi (bkz. llm_scheduler).
+    status: Verilirse son özet çağrısının sonucuyla doldurulur (bkz. _stream_llm); hata olduğunda dönen metin
+    hata mesajıdır.
     """
-    llm = OllamaLLM(model="qwen2.5:latest")
+    llm = get_llm(priority=priority, owner=owner)
 
-    # Tüm chunk'ların metinlerini birleştir. Token limitine dikkat et!
-    # Eğer metin çok uzunsa, ya sadece belirli bir kısmını özetle ya da
-    # haritalama-azaltma (map-reduce) gibi daha karmaşık bir özetleme stratejisi kullan.
-    # Şimdilik basit bir birleştirme ve karakter limiti uygulayalım.
     full_text = ""
-    char_limit_for_summary = 10000 # Özetleme için LLM'e gönderilecek maks karakter (ayarlanabilir)
-    
-    for chunk_doc in document_chunks:
-        if len(full_text) + len(chunk_doc.page_content) < char_limit_for_summary:
-            full_text += chunk_doc.page_content + "\n\n"
+    if mode == "map_reduce":
+        # Uzun belgelerde bölüm özetleri (map) paralel üretilir, son özet (reduce) bunlardan çıkarılır.
+        texts, was_mapped = map_document_summaries(document_chunks, max_workers=max_workers, priority=priority, owner=owner)
+        if was_mapped:
+            full_text = "\n\n".join(f"[Bölüm {i + 1} özeti]\n{text}" for i, text in enumerate(texts))[:SUMMARY_CHAR_LIMIT]
         else:
-            # Eğer limiti aşıyorsak, metnin sonuna bir not ekleyebiliriz.
-            full_text += "\n\n[İçeriğin bir kısmı token limiti nedeniyle kesilmiştir.]"
-            break
+            full_text = "\n\n".join(texts)
+    else:
+        # Basit birleştirme ve karakter limiti; limiti aşan kısım özetlenmez.
+        for chunk_doc in document_chunks:
+            if len(full_text) + len(chunk_doc.page_content) < SUMMARY_CHAR_LIMIT:
+                full_text += chunk_doc.page_content + "\n\n"
+            else:
+                # Eğer limiti aşıyorsak, metnin sonuna bir not ekleyebiliriz.
+                full_text += "\n\n[İçeriğin bir kısmı token limiti nedeniyle kesilmiştir.]"
+                break
     
     if not full_text.strip():
-        return "Özetlenecek içerik bulunamadı."
+        return iter(["Özetlenecek içerik bulunamadı."]) if stream else "Özetlenecek içerik bulunamadı."
 
     # Dil talimatını oluştur
     summary_language_instruction = ""
@@ -168,22 +312,66 @@ Metin:
 Lütfen yukarıdaki metnin ana noktalarını içeren, iyi yapılandırılmış bir özet sunun.
 """
 
+    if stream:
+        return _stream_llm(llm, prompt_text, "Belge özeti üretilirken bir sorun oluştu.", "Belge özeti üretilirken hata", status)
+
     try:
         response = llm.invoke(prompt_text)
+        if status is not None:
+            status["completed"] = True
         return response # Yanıtın doğrudan özeti içerdiğini varsayıyoruz.
     except Exception as e:
         print(f"Belge özeti üretilirken hata: {e}")
+        if status is not None:
+            status.update(completed=False, error=e)
         return "Belge özeti üretilirken bir sorun oluştu."
 
-def extract_keywords_from_documents(document_chunks, role, language_code="tr", num_keywords=10):
+# Notlardan toplanan aday terim sayısı = istenen anahtar kelime sayısı x bu katsayı
+KEYWORD_CANDIDATE_FACTOR = 3
+
+def _select_keywords(llm, candidates, role, language_code, num_keywords):
+    """Aday terimlerden role en uygun num_keywords tanesini istenen dilde seçtirir. Hata olursa boş liste."""
+    if language_code == "en":
+        instruction = f"""You are acting as a '{role}'. The following terms were extracted from the documents, most frequent first.
+Choose the {num_keywords} most important keywords for your role and write them in English (translate if needed)."""
+        output_format_instruction = "List the keywords as a single comma-separated string. Add nothing else."
+    else:
+        instruction = f"""Bir '{role}' olarak davranıyorsun. Aşağıdaki terimler belgelerden çıkarıldı (en sık geçenler önce).
+Bu rol için en önemli {num_keywords} anahtar kelimeyi seç ve Türkçe yaz (gerekirse çevir)."""
+        output_format_instruction = "Anahtar kelimeleri virgülle ayırarak tek bir satırda listele. Başka hiçbir şey ekleme."
+    prompt_text = f"""{instruction}
+
+Terimler: {", ".join(candidates)}
+
+{output_format_instruction}
+"""
+    try:
+        response = llm.invoke(prompt_text)
+        keywords = [kw.strip() for kw in response.split(',') if kw.strip()]
+        return keywords[:num_keywords]
+    except Exception as e:
+        print(f"Anahtar kelime çıkarılırken hata: {e}")
+        return []
+
+def extract_keywords_from_documents(document_chunks, role, language_code="tr", num_keywords=10, mode="notes",
+                                    priority=PRIORITY_BACKGROUND, owner=None):
     """
     Yüklenen belgelerden anahtar kelimeleri çıkarır.
     document_chunks: LangChain Document nesnelerinin listesi.
     role: Mevcut aktif rol.
     language_code: Anahtar kelimelerin çıkarılacağı ve listeleneceği dil.
     num_keywords: Çıkarılacak maksimum anahtar kelime sayısı.
+    mode: "notes" (varsayılan) tüm derlemin bölüm notlarında en sık geçen terimleri aday olarak toplar; model
+          bunlardan role en uygun olanları seçip istenen dile çevirir (metin yerine kısa bir terim listesi gönderilir).
+          "prompt" metnin başını tek bir prompt ile modele gönderir.
+    priority, owner: LLM zamanlayıcısındaki öncelik sınıfı ve iptal sahibi (bkz. llm_scheduler).
     """
-    llm = OllamaLLM(model="qwen2.5:latest")
+    llm = get_llm(priority=priority, owner=owner)
+
+    if mode == "notes":
+        candidates = aggregate_keywords(analyze_corpus(document_chunks, priority=priority, owner=owner), num_keywords * KEYWORD_CANDIDATE_FACTOR)
+        if candidates:
+            return _select_keywords(llm, candidates, role, language_code, num_keywords)
 
     full_text = ""
     # Özetleme için kullandığımız karakter limitini burada da kullanabiliriz.
@@ -231,23 +419,35 @@ Metin:
         print(f"Anahtar kelime çıkarılırken hata: {e}")
         return []
 
-def generate_concept_map_data(document_chunks, role, language_code="tr"):
+def generate_concept_map_data(document_chunks, role, language_code="tr", stream=False, mode="notes", priority=PRIORITY_REFINE, owner=None):
     """
     Yüklenen belgelerden metin tabanlı bir konsept haritası (Mermaid.js formatında) üretir.
+    stream: True ise ham model çıktısı token akışı olarak döndürülür; akış bitince
+    extract_mermaid_code ile Mermaid bloğu ayıklanmalıdır.
+    mode: "notes" (varsayılan) model metin yerine tüm derlemin bölüm notlarındaki en sık kavram ilişkilerini alır;
+          ilişki bulunamazsa veya "prompt" seçilirse metnin başı gönderilir. Harita her iki durumda da rol ve dile göre kurulur.
+    priority, owner: LLM zamanlayıcısındaki öncelik sınıfı ve iptal sahibi (bkz. llm_scheduler).
     """
-    llm = OllamaLLM(model="qwen2.5:latest")
+    llm = get_llm(priority=priority, owner=owner)
 
-    # Anahtar kelime çıkarmada olduğu gibi metnin bir kısmını alalım
     full_text = ""
-    char_limit_for_map = 7000 # Konsept haritası için biraz daha fazla metin gerekebilir
-    for chunk_doc in document_chunks:
-        if len(full_text) + len(chunk_doc.page_content) < char_limit_for_map:
-            full_text += chunk_doc.page_content + "\n\n"
-        else:
-            break
+    text_heading = "Metin:"
+    if mode == "notes":
+        relations = aggregate_relations(analyze_corpus(document_chunks, priority=priority, owner=owner))
+        full_text = "\n".join(f"{source} --{relation}--> {target}" for source, relation, target in relations)
+        text_heading = "Belgelerden çıkarılan kavram ilişkileri (kaynak --ilişki--> hedef), en sık geçenler önce:"
+
+    if not full_text:
+        # Anahtar kelime çıkarmada olduğu gibi metnin bir kısmını alalım
+        char_limit_for_map = 7000 # Konsept haritası için biraz daha fazla metin gerekebilir
+        for chunk_doc in document_chunks:
+            if len(full_text) + len(chunk_doc.page_content) < char_limit_for_map:
+                full_text += chunk_doc.page_content + "\n\n"
+            else:
+                break
     
     if not full_text.strip():
-        return "Konsept haritası için içerik bulunamadı."
+        return iter(["Konsept haritası için içerik bulunamadı."]) if stream else "Konsept haritası için içerik bulunamadı."
 
     # Dil ve rol talimatları
     role_instruction = f"Bir '{role}' olarak, aşağıdaki metindeki ana kavramları ve aralarındaki ilişkileri analiz et."
@@ -274,7 +474,7 @@ graph TD
 {task_instruction}
 Dil Tercihi (kavram etiketleri için mümkünse): {language_preference}.
 
-Metin:
+{text_heading}
 ---
 {full_text.strip()}
 ---
@@ -283,40 +483,71 @@ Metin:
 Lütfen SADECE Mermaid.js kod bloğunu (` ```mermaid ... ``` `) yanıt olarak ver. Başka hiçbir açıklama veya metin ekleme.
 """
 
+    if stream:
+        return _stream_llm(llm, prompt_text, "Konsept haritası üretilirken bir sorun oluştu.", "Konsept haritası üretilirken hata")
+
     try:
         response = llm.invoke(prompt_text)
-        # Modelin doğrudan ```mermaid ... ``` bloğunu döndürdüğünü varsayıyoruz.
-        # Eğer değilse, bu bloğu ayıklamak için ek işlem gerekebilir.
-        if "```mermaid" in response and "```" in response.split("```mermaid")[1]:
-            mermaid_code = "```mermaid" + response.split("```mermaid")[1].split("```")[0] + "```"
-            return mermaid_code.strip()
-        else: # Basit bir fallback veya hata
-            print(f"Model beklenen Mermaid formatında yanıt vermedi: {response}")
-            # Belki de sadece metin tabanlı bir hiyerarşi istemek daha güvenli olabilir.
-            # Şimdilik bu şekilde bırakalım.
-            return "Konsept haritası üretilemedi (beklenen formatta değil)." 
-            
+        return extract_mermaid_code(response)
     except Exception as e:
         print(f"Konsept haritası üretilirken hata: {e}")
         return "Konsept haritası üretilirken bir sorun oluştu."
 
-def extract_timeline_from_documents(document_chunks, role, language_code="tr"):
+def extract_mermaid_code(response):
+    """Model çıktısından ```mermaid ... ``` bloğunu ayıklar; bulunamazsa kullanıcıya gösterilecek mesajı döndürür."""
+    # Modelin doğrudan ```mermaid ... ``` bloğunu döndürdüğünü varsayıyoruz.
+    # Eğer değilse, bu bloğu ayıklamak için ek işlem gerekebilir.
+    if "```mermaid" in response and "```" in response.split("```mermaid")[1]:
+        mermaid_code = "```mermaid" + response.split("```mermaid")[1].split("```")[0] + "```"
+        return mermaid_code.strip()
+    else: # Basit bir fallback veya hata
+        print(f"Model beklenen Mermaid formatında yanıt vermedi: {response}")
+        # Belki de sadece metin tabanlı bir hiyerarşi istemek daha güvenli olabilir.
+        # Şimdilik bu şekilde bırakalım.
+        return "Konsept haritası üretilemedi (beklenen formatta değil)."
+
+def extract_timeline_from_documents(document_chunks, role, language_code="tr", stream=False, mode="notes", priority=PRIORITY_REFINE, owner=None):
     """
     Yüklenen belgelerden tarihsel olayları çıkarıp bir zaman çizelgesi oluşturur.
+    stream: True ise metin yerine token akışı (iterator) döndürülür.
+    mode: "notes" (varsayılan) model metin yerine tüm derlemin bölüm notlarındaki tarihli olayların kronolojik
+          listesini alır ve rol ve dile göre düzenler; notlarda hiç tarihli olay yoksa model çağrılmaz.
+          Notlar çıkarılamazsa veya "prompt" seçilirse metnin başı gönderilir.
+    priority, owner: LLM zamanlayıcısındaki öncelik sınıfı ve iptal sahibi (bkz. llm_scheduler).
     """
-    llm = OllamaLLM(model="qwen2.5:latest")
-
-    # Metnin tamamını veya önemli bir kısmını alalım
     full_text = ""
-    char_limit_for_timeline = 8000 # Zaman çizelgesi için daha fazla bağlam gerekebilir
-    for chunk_doc in document_chunks:
-        if len(full_text) + len(chunk_doc.page_content) < char_limit_for_timeline:
-            full_text += chunk_doc.page_content + "\n\n"
-        else:
-            break
-    
+    text_heading = "Metin:"
+    source_instruction = ""
+    if mode == "notes":
+        notes_list = analyze_corpus(document_chunks, priority=priority, owner=owner)
+        if notes_list:
+            timeline_lines = aggregate_timeline(notes_list)
+            if not timeline_lines:
+                if language_code == "en":
+                    timeline = "No clear timeline was found in the documents."
+                else:
+                    timeline = "Belgede belirgin bir zaman çizelgesi bulunamadı."
+                return iter([timeline]) if stream else timeline
+            full_text = "\n".join(timeline_lines)
+            text_heading = "Belgelerden çıkarılan tarihli olaylar (kronolojik sırada, belgenin kendi dilinde):"
+            if language_code == "en":
+                source_instruction = "The events are already in chronological order. Keep the dates as they are, translate the descriptions and focus them on what matters for your role.\n"
+            else:
+                source_instruction = "Olaylar zaten kronolojik sırada. Tarihleri olduğu gibi koru; açıklamaları istenen dile çevir ve bu rol için önemli noktalara odakla.\n"
+
+    llm = get_llm(priority=priority, owner=owner)
+
+    if not full_text:
+        # Metnin tamamını veya önemli bir kısmını alalım
+        char_limit_for_timeline = 8000 # Zaman çizelgesi için daha fazla bağlam gerekebilir
+        for chunk_doc in document_chunks:
+            if len(full_text) + len(chunk_doc.page_content) < char_limit_for_timeline:
+                full_text += chunk_doc.page_content + "\n\n"
+            else:
+                break
+
     if not full_text.strip():
-        return "Zaman çizelgesi için içerik bulunamadı."
+        return iter(["Zaman çizelgesi için içerik bulunamadı."]) if stream else "Zaman çizelgesi için içerik bulunamadı."
 
     # Dil ve rol talimatları
     role_instruction = f"Bir '{role}' olarak, aşağıdaki metindeki tarihleri ve bu tarihlerle ilişkili önemli olayları veya bilgileri analiz et."
@@ -330,9 +561,9 @@ def extract_timeline_from_documents(document_chunks, role, language_code="tr"):
     
     prompt_text = f"""{role_instruction}
 {task_instruction}
-Dil Tercihi: {language_preference}.
+{source_instruction}Dil Tercihi: {language_preference}.
 
-Metin:
+{text_heading}
 ---
 {full_text.strip()}
 ---
@@ -340,6 +571,9 @@ Metin:
 Lütfen bulunan olayları kronolojik sıraya göre, her biri yeni bir satırda olacak şekilde listele. Eğer metinde belirgin tarihler yoksa, "Belgede belirgin bir zaman çizelgesi bulunamadı." yanıtını ver.
 """
 
+    if stream:
+        return _stream_llm(llm, prompt_text, "Zaman çizelgesi çıkarılırken bir sorun oluştu.", "Zaman çizelgesi çıkarılırken hata")
+
     try:
         response = llm.invoke(prompt_text)
         # Yanıtın doğrudan markdown listesi veya ilgili mesaj olduğunu varsayıyoruz.
@@ -0,0 +1,183 @@
+"""
+Chunk'lama ile embedding arasındaki tekilleştirme aşaması.
+- Sayfa süslemeleri: sayfaların üst/alt satırlarında tekrar eden başlık, altbilgi ve sayfa numaraları
+  (rakamlar yok sayılarak) sayfalar arasında sayılır; süsleme kabul edilen satırlar chunk'ların başından ve
+  sonundan kırpılır, sadece süslemeden oluşan chunk'lar atılır.
+- Neredeyse aynı chunk'lar: kelime shingle'larının MinHash imzaları LSH bantlarıyla karşılaştırılır; tekrar
+  eden yasal uyarı, sorumluluk reddi gibi chunk'lar tek bir chunk'ta toplanır ve geçtiği sayfalar
+  metadata["pages"] listesinde tutulur.
+Tekilleştirme dosya bazındadır; dosya başına önbellek girdileri böylece birbirinden bağımsız kalır.
+"""
+import re
+import zlib
+from collections import Counter
+
+import numpy as np
+
+# Bir sayfanın üstünden ve altından süsleme adayı sayılan satır sayısı
+FURNITURE_EDGE_LINES = 2
+# Süsleme sayılmak için bir satırın en az bu kadar sayfada ve görülen sayfaların bu oranında geçmesi gerekir
+FURNITURE_MIN_PAGES = 3
+FURNITURE_MIN_RATIO = 0.5
+# Süslemeler öğrenilene kadar bekletilen sayfa sayısı (ilk sayfaların chunk'ları da kırpılabilsin diye)
+FURNITURE_WARMUP_PAGES = 8
+
+SHINGLE_SIZE = 5
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16 # her bant MINHASH_PERMUTATIONS / LSH_BANDS satır
+NEAR_DUPLICATE_THRESHOLD = 0.9
+# Ayarlar değişirse artırın; önbellekteki chunk'lar yeniden üretilir.
+DEDUP_VERSION = 1
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240601) # İmzalar süreçler arasında aynı olsun diye sabit tohum
+_PERMUTATION_A = _rng.integers(1, _MERSENNE_PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_PERMUTATION_B = _rng.integers(0, _MERSENNE_PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_WORD_PATTERN = re.compile(r"\w+")
+_DIGITS = re.compile(r"\d+")
+
+
+def get_dedup_settings():
+    """Önbellek anahtarında kullanılmak üzere tekilleştirme ayarları."""
+    return {
+        "version": DEDUP_VERSION,
+        "furniture": [FURNITURE_EDGE_LINES, FURNITURE_MIN_PAGES, FURNITURE_MIN_RATIO],
+        "minhash": [SHINGLE_SIZE, MINHASH_PERMUTATIONS, LSH_BANDS, NEAR_DUPLICATE_THRESHOLD],
+    }
+
+
+def _normalize_line(line):
+    # Sayfa numarası gibi değişen rakamlar yok sayılır: "Sayfa 3 / 12" ve "Sayfa 4 / 12" aynı satırdır.
+    return _DIGITS.sub("#", " ".join(line.split()).casefold())
+
+
+def minhash_signature(text):
+    """Metnin kelime shingle'larından MinHash imzası (MINHASH_PERMUTATIONS uzunluğunda uint64 dizi)."""
+    words = _WORD_PATTERN.findall(text.casefold())
+    if len(words) <= SHINGLE_SIZE:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    permuted = (hashes[:, None] * _PERMUTATION_A[None, :] + _PERMUTATION_B[None, :]) % _MERSENNE_PRIME
+    return permuted.min(axis=0)
+
+
+class ChunkDeduplicator:
+    """
+    Bir dosyanın sayfalarını ve chunk'larını sırayla alır, süslemeleri kırpar ve tekrar eden chunk'ları toplar.
+    add_page, yayınlanmaya hazır chunk'ları döndürür; dosya bitince flush çağrılmalıdır.
+    Tekrar bulunduğunda daha önce yayınlanmış chunk'ın metadata["pages"] listesi güncellenir; aşağı akıştaki
+    aşamalar chunk'ları dosya bitene kadar sakladığı için güncel liste önbelleğe ve indekse yazılır.
+    """
+
+    def __init__(self):
+        self.pages_seen = 0
+        self._edge_line_pages = {} # normalize satır -> geçtiği sayfa sayısı
+        self._pending = [] # süslemeler öğrenilene kadar bekleyen chunk'lar
+        self._kept = [] # [(Document, imza)]
+        self._buckets = {} # (bant, bant değerleri) -> [_kept indeksleri]
+        self.stats = {"chunks_in": 0, "chunks_out": 0, "furniture_trimmed": 0, "furniture_dropped": 0, "near_duplicates": 0}
+
+    # --- Sayfa süslemeleri ---
+
+    def _observe_page(self, page_text):
+        self.pages_seen += 1
+        lines = [_normalize_line(line) for line in page_text.splitlines() if line.strip()]
+        if len(lines) <= 2 * FURNITURE_EDGE_LINES:
+            return # Kısa sayfalarda kenar satırları içeriğin kendisidir; süsleme tam sayfalardan öğrenilir.
+        line_counts = Counter(lines)
+        edge_lines = lines[:FURNITURE_EDGE_LINES] + lines[-FURNITURE_EDGE_LINES:]
+        for normalized in set(edge_lines):
+            # Sayfa içinde tekrar eden kalıp satırlar (ör. tablo satırları, madde listeleri) süsleme değildir.
+            if line_counts[normalized] == 1:
+                self._edge_line_pages[normalized] = self._edge_line_pages.get(normalized, 0) + 1
+
+    def _is_furniture(self, line):
+        count = self._edge_line_pages.get(_normalize_line(line), 0)
+        return count >= FURNITURE_MIN_PAGES and count >= FURNITURE_MIN_RATIO * self.pages_seen
+
+    def _trim_furniture(self, chunk):
+        """Chunk'ın başındaki ve sonundaki süsleme satırlarını kırpar; geriye metin kalmazsa None döner."""
+        text = chunk.page_content
+        lines = text.splitlines(keepends=True)
+        start, end = 0, len(lines)
+        while start < end and (not lines[start].strip() or self._is_furniture(lines[start])):
+            start += 1
+        while end > start and (not lines[end - 1].strip() or self._is_furniture(lines[end - 1])):
+            end -= 1
+        if start == end:
+            return None
+        if start == 0 and end == len(lines):
+            return chunk
+        prefix_length = sum(len(line) for line in lines[:start])
+        trimmed = "".join(lines[start:end]).rstrip()
+        leading = len(trimmed) - len(trimmed.lstrip())
+        chunk.page_content = trimmed.lstrip()
+        if "start_index" in chunk.metadata:
+            chunk.metadata["start_index"] += prefix_length + leading
+        self.stats["furniture_trimmed"] += 1
+        return chunk
+
+    # --- Neredeyse aynı chunk'lar ---
+
+    def _find_duplicate(self, signature):
+        rows = MINHASH_PERMUTATIONS // LSH_BANDS
+        candidates = set()
+        band_keys = []
+        for band in range(LSH_BANDS):
+            key = (band, signature[band * rows:(band + 1) * rows].tobytes())
+            band_keys.append(key)
+            candidates.update(self._buckets.get(key, ()))
+        for index in sorted(candidates):
+            if np.mean(self._kept[index][1] == signature) >= NEAR_DUPLICATE_THRESHOLD:
+                return index, band_keys
+        return None, band_keys
+
+    def _process(self, chunk):
+        chunk = self._trim_furniture(chunk)
+        if chunk is None:
+            self.stats["furniture_dropped"] += 1
+            return None
+        signature = minhash_signature(chunk.page_content)
+        duplicate_index, band_keys = self._find_duplicate(signature)
+        if duplicate_index is not None:
+            kept_chunk = self._kept[duplicate_index][0]
+            pages = kept_chunk.metadata.setdefault("pages", [kept_chunk.metadata.get("page")])
+            if chunk.metadata.get("page") not in pages:
+                pages.append(chunk.metadata.get("page"))
+            self.stats["near_duplicates"] += 1
+            return None
+        for key in band_keys:
+            self._buckets.setdefault(key, []).append(len(self._kept))
+        self._kept.append((chunk, signature))
+        self.stats["chunks_out"] += 1
+        return chunk
+
+    # --- Akış ---
+
+    def add_page(self, page_data, page_chunks):
+        """Bir sayfanın chunk'larını ekler ve yayınlanmaya hazır chunk'ları döndürür."""
+        self._observe_page(page_data["page_content"])
+        self.stats["chunks_in"] += len(page_chunks)
+        self._pending.extend(page_chunks)
+        if self.pages_seen < FURNITURE_WARMUP_PAGES:
+            return []
+        return self.flush()
+
+    def flush(self):
+        """Bekleyen chunk'ları işleyip döndürür (dosya sonunda çağrılır)."""
+        ready = [chunk for chunk in map(self._process, self._pending) if chunk is not None]
+        self._pending = []
+        return ready
+
+
+def deduplicate_page_chunks(pages_iter, chunk_fn, deduplicator=None):
+    """
+    Sayfaları chunk_fn ile (ör. pdf_handler.chunk_pages) chunk'layıp tekilleştirilmiş chunk'ları üretir.
+    İstatistikler için deduplicator dışarıdan verilebilir.
+    """
+    deduplicator = deduplicator or ChunkDeduplicator()
+    for page_data in pages_iter:
+        yield from deduplicator.add_page(page_data, chunk_fn([page_data]))
+    yield from deduplicator.flush()
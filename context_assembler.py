@@ -0,0 +1,227 @@
+"""
+"stuff" zincirine giden bağlamın token bütçesiyle hazırlanması.
+Retriever'ın döndürdüğü chunk'lar olduğu gibi art arda eklenmez:
+- aynı sayfadan örtüşen veya bitişik chunk'lar (start_index ile) tek parçada birleştirilir, örtüşen metin bir kez yer alır,
+- neredeyse aynı içerikli parçalar (ör. tekrar eden üst bilgi, farklı sayfalardaki aynı paragraf) atılır,
+- kalan parçalar alaka sırasıyla, ayarlanabilir token bütçesi dolana kadar eklenir.
+CPU üzerindeki Ollama'da prefill süresi prompt uzunluğuyla arttığı için tasarruf edilen token sayısı raporlanır.
+Tasarruf, önceki bağlamla (ilk BASELINE_CONTEXT_CHUNKS chunk'ın olduğu gibi eklenmesi) karşılaştırılır; bütçe
+daha fazla aday chunk'tan doldurulduğu için bu değer negatif de olabilir.
+"""
+import math
+import re
+import threading
+from typing import Any
+
+from langchain.docstore.document import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from hybrid_retriever import RETRIEVAL_K
+
+CONTEXT_TOKEN_BUDGET = 1024
+# Bütçeyi alaka sırasıyla doldurmak için retriever'dan istenen aday chunk sayısı
+CONTEXT_CANDIDATES = 6
+# Tasarrufun ölçüldüğü eski bağlam: retriever'ın (k=4) ilk chunk'ları, birleştirme ve bütçe olmadan
+BASELINE_CONTEXT_CHUNKS = RETRIEVAL_K
+# Bütçe dolduğunda bir parçanın kırpılarak eklenmesi için kalan en az token sayısı
+MIN_PARTIAL_TOKENS = 64
+# Aynı sayfadaki iki chunk arasında bu kadar karakterden az boşluk varsa bitişik sayılır (ayırıcı boşluklar)
+MERGE_GAP_CHARS = 2
+NEAR_DUPLICATE_SIMILARITY = 0.85
+SHINGLE_SIZE = 3
+
+_WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def estimate_tokens(text):
+    """
+    Yerel tokenizer olmadan kaba token sayısı tahmini: kelimeler ~4 karakterlik parçalara, noktalama işaretleri
+    birer token'a sayılır. Qwen tokenizer'ıyla karşılaştırılıp ayarlanmamıştır; bütçe ve tasarruf değerleri yaklaşıktır.
+    """
+    return sum(max(1, math.ceil(len(piece) / 4)) for piece in _WORD_PATTERN.findall(text))
+
+
+def _shingles(text):
+    words = _WORD_PATTERN.findall(text.casefold())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _containment(shingles, other_shingles):
+    """shingles kümesinin ne kadarının diğer parçada da bulunduğu (daha büyük bir parçanın içinde kalan tekrarlar da yakalanır)."""
+    if not shingles or not other_shingles:
+        return 0.0
+    return len(shingles & other_shingles) / len(shingles)
+
+
+def _span(doc):
+    start = doc.metadata.get("start_index")
+    if start is None:
+        return None
+    return start, start + len(doc.page_content)
+
+
+def merge_page_chunks(documents):
+    """
+    Aynı kaynak ve sayfadan örtüşen/bitişik chunk'ları birleştirir. Birleşik parça, grubundaki en alakalı
+    chunk'ın sırasını alır. Dönüş: (parçalar, birleştirilen chunk sayısı)
+    """
+    pieces = [] # [sıra, Document, span]
+    merged_count = 0
+    for rank, doc in enumerate(documents):
+        span = _span(doc)
+        target = None
+        if span is not None:
+            for piece in pieces:
+                piece_doc, piece_span = piece[1], piece[2]
+                if piece_span is None or piece_doc.metadata.get("source") != doc.metadata.get("source") or \
+                        piece_doc.metadata.get("page") != doc.metadata.get("page"):
+                    continue
+                if span[0] <= piece_span[1] + MERGE_GAP_CHARS and piece_span[0] <= span[1] + MERGE_GAP_CHARS:
+                    target = piece
+                    break
+        if target is None:
+            pieces.append([rank, doc, span])
+            continue
+        merged_count += 1
+        piece_doc, piece_span = target[1], target[2]
+        first, second = (piece_doc, doc) if piece_span[0] <= span[0] else (doc, piece_doc)
+        first_span, second_span = _span(first), _span(second)
+        if second_span[1] <= first_span[1]: # ikincisi tamamen birincinin içinde
+            text = first.page_content
+        elif second_span[0] >= first_span[1]: # bitişik
+            text = first.page_content + "\n" + second.page_content
+        else: # örtüşen kısım bir kez
+            text = first.page_content + second.page_content[first_span[1] - second_span[0]:]
+        metadata = dict(first.metadata, start_index=first_span[0])
+        target[1] = Document(id=first.id, page_content=text, metadata=metadata)
+        target[2] = (first_span[0], max(first_span[1], second_span[1]))
+    pieces.sort(key=lambda piece: piece[0])
+    return [piece[1] for piece in pieces], merged_count
+
+
+def drop_near_duplicates(documents, threshold=NEAR_DUPLICATE_SIMILARITY):
+    """Büyük ölçüde daha alakalı bir parçada zaten bulunan parçaları atar. Dönüş: (parçalar, atılan sayısı)"""
+    kept = []
+    kept_shingles = []
+    for doc in documents:
+        shingles = _shingles(doc.page_content)
+        if any(_containment(shingles, other) >= threshold for other in kept_shingles):
+            continue
+        kept.append(doc)
+        kept_shingles.append(shingles)
+    return kept, len(documents) - len(kept)
+
+
+def _truncate_to_budget(text, budget, count_tokens):
+    """
+    Metni, token sayısı bütçeyi aşmayacak şekilde cümle sonundan (yoksa kelime sınırından) kırpar.
+    Metnin başı olduğu gibi korunur; böylece start_index ile sayfadaki konumu geçerli kalır.
+    """
+    for pattern in (_SENTENCE_END, _WHITESPACE):
+        cut_positions = [match.start() for match in pattern.finditer(text)]
+        # Bütçeye sığan en uzun önek (token sayısı önek uzunluğuyla artar, ikili arama yeterli)
+        low, high, best = 0, len(cut_positions) - 1, None
+        while low <= high:
+            middle = (low + high) // 2
+            if count_tokens(text[:cut_positions[middle]]) <= budget:
+                best, low = cut_positions[middle], middle + 1
+            else:
+                high = middle - 1
+        if best:
+            return text[:best]
+    return ""
+
+
+def assemble_context(documents, token_budget=CONTEXT_TOKEN_BUDGET, count_tokens=estimate_tokens):
+    """
+    documents: Alaka sırasına göre retriever çıktısı.
+    Dönüş: (bağlama girecek Document listesi, istatistikler). İstatistikler: retrieved_tokens (tüm adaylar
+    olduğu gibi eklenseydi), baseline_tokens (ilk BASELINE_CONTEXT_CHUNKS aday olduğu gibi eklenseydi),
+    context_tokens, saved_tokens (baseline_tokens - context_tokens), merged, duplicates_dropped, truncated, skipped.
+    """
+    retrieved_tokens = sum(count_tokens(doc.page_content) for doc in documents)
+    baseline_tokens = sum(count_tokens(doc.page_content) for doc in documents[:BASELINE_CONTEXT_CHUNKS])
+    pieces, merged = merge_page_chunks(documents)
+    pieces, duplicates_dropped = drop_near_duplicates(pieces)
+
+    context = []
+    used_tokens = 0
+    truncated = 0
+    skipped = 0
+    for doc in pieces:
+        tokens = count_tokens(doc.page_content)
+        remaining = token_budget - used_tokens
+        if tokens <= remaining:
+            context.append(doc)
+            used_tokens += tokens
+        elif remaining >= MIN_PARTIAL_TOKENS:
+            text = _truncate_to_budget(doc.page_content, remaining, count_tokens)
+            if text:
+                context.append(Document(id=doc.id, page_content=text, metadata=dict(doc.metadata)))
+                used_tokens += count_tokens(text)
+                truncated += 1
+            else:
+                skipped += 1
+        else:
+            skipped += 1 # daha kısa, sonraki bir parça hâlâ sığabilir
+
+    stats = {
+        "retrieved_tokens": retrieved_tokens,
+        "baseline_tokens": baseline_tokens,
+        "context_tokens": used_tokens,
+        "saved_tokens": baseline_tokens - used_tokens,
+        "merged": merged,
+        "duplicates_dropped": duplicates_dropped,
+        "truncated": truncated,
+        "skipped": skipped,
+    }
+    context_usage.record(stats)
+    return context, stats
+
+
+class ContextUsage:
+    """Tüm sorgular boyunca bağlam token'larının toplamı (arayüzde ve raporlarda gösterilir)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.retrieved_tokens = 0
+        self.baseline_tokens = 0
+        self.context_tokens = 0
+
+    def record(self, stats):
+        with self._lock:
+            self.queries += 1
+            self.retrieved_tokens += stats["retrieved_tokens"]
+            self.baseline_tokens += stats["baseline_tokens"]
+            self.context_tokens += stats["context_tokens"]
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "queries": self.queries,
+                "retrieved_tokens": self.retrieved_tokens,
+                "baseline_tokens": self.baseline_tokens,
+                "context_tokens": self.context_tokens,
+                "saved_tokens": self.baseline_tokens - self.context_tokens,
+            }
+
+
+context_usage = ContextUsage()
+
+
+class BudgetedRetriever(BaseRetriever):
+    """Başka bir retriever'ın sonuçlarını assemble_context'ten geçirir (RetrievalQA "stuff" zinciri için)."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    retriever: Any
+    token_budget: int = CONTEXT_TOKEN_BUDGET
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return assemble_context(self.retriever.invoke(query), self.token_budget)[0]
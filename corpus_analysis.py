@@ -0,0 +1,193 @@
+"""
+Derlem analizi: belgelerin tamamı bir kez, chunk grupları halinde modelden geçirilir ve her grup için
+notlar (kısa özet, anahtar terimler, tarihli olaylar, kavram ilişkileri) çıkarılıp önbelleğe yazılır.
+Özet, anahtar kelimeler, konsept haritası ve zaman çizelgesi bu notlar üzerinden ucuz birleştirmelerle (rol ve
+dile uyarlama gerekenlerde notlardan derlenen kısa bir prompt'la) üretilir; aynı metin dört ayrı büyük prompt'ta
+tekrar tekrar işlenmez.
+"""
+import hashlib
+import json
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from ingestion_cache import IngestionCache
+from llm_scheduler import PRIORITY_BACKGROUND
+from resources import LLM_MODEL, get_llm
+
+NOTES_GROUP_CHAR_LIMIT = 6000 # Tek not çıkarma çağrısına giren chunk grubunun uzunluğu
+NOTES_MAX_WORKERS = 2
+# Not formatı veya prompt değişirse artırın; eski notlar yeniden üretilir.
+NOTES_VERSION = 1
+
+_NOTES_PROMPT = """Aşağıdaki metni analiz et ve SADECE şu yapıda geçerli bir JSON nesnesi döndür:
+{{
+  "summary": "metnin ana noktalarının kısa ve nesnel özeti (önemli isim, sayı ve tarihleri koru)",
+  "key_terms": ["en önemli 5-10 terim veya kavram"],
+  "events": [{{"date": "metinde geçtiği şekliyle tarih", "description": "o tarihteki olay veya bilgi"}}],
+  "relations": [{{"source": "kavram", "relation": "kısa ilişki ifadesi", "target": "kavram"}}]
+}}
+Tüm değerleri metnin kendi dilinde yaz. Metinde tarih yoksa "events" boş liste olsun. JSON dışında hiçbir şey yazma.
+
+Metin:
+---
+{text}
+---
+"""
+
+
+def group_texts(texts, char_limit):
+    """Ardışık metinleri, toplam uzunluğu char_limit'i geçmeyecek gruplara ayırır."""
+    groups = []
+    current_group = ""
+    for text in texts:
+        if current_group and len(current_group) + len(text) > char_limit:
+            groups.append(current_group)
+            current_group = ""
+        current_group += text + "\n\n"
+    if current_group.strip():
+        groups.append(current_group)
+    return groups
+
+
+def group_document_chunks(document_chunks, char_limit=NOTES_GROUP_CHAR_LIMIT):
+    """
+    Chunk'ları kaynak dosya sınırlarını aşmadan gruplar. Böylece derleme yeni bir dosya eklendiğinde
+    mevcut dosyaların grupları (ve önbellekteki notları) değişmez.
+    """
+    texts_by_source = {}
+    for chunk_doc in document_chunks:
+        if chunk_doc.page_content.strip():
+            texts_by_source.setdefault(chunk_doc.metadata.get("source", ""), []).append(chunk_doc.page_content)
+    groups = []
+    for texts in texts_by_source.values():
+        groups.extend(group_texts(texts, char_limit))
+    return groups
+
+
+def _parse_notes(response):
+    """Model çıktısındaki JSON nesnesini ayıklar; eksik alanları boş değerlerle tamamlar."""
+    match = re.search(r"\{.*\}", response, re.DOTALL)
+    notes = {}
+    if match:
+        try:
+            notes = json.loads(match.group(0))
+        except ValueError:
+            notes = {}
+    if not isinstance(notes, dict) or not notes:
+        # JSON üretilemediyse çıktıyı en azından özet olarak kullan
+        notes = {"summary": response.strip()}
+    return {
+        "summary": str(notes.get("summary") or "").strip(),
+        "key_terms": [str(term).strip() for term in notes.get("key_terms") or [] if str(term).strip()],
+        "events": [e for e in notes.get("events") or [] if isinstance(e, dict) and e.get("date") and e.get("description")],
+        "relations": [r for r in notes.get("relations") or [] if isinstance(r, dict) and r.get("source") and r.get("target")],
+    }
+
+
+def analyze_group(llm, group_text, cache):
+    """Bir chunk grubunun notlarını döndürür; önbellekte varsa model çağrılmaz."""
+    key = hashlib.sha256(f"{LLM_MODEL}\0{NOTES_VERSION}\0{group_text}".encode("utf-8")).hexdigest()
+    cached = cache.load_note("chunk_notes", key)
+    if cached is not None:
+        return cached
+    try:
+        response = llm.invoke(_NOTES_PROMPT.format(text=group_text.strip()))
+    except Exception as e:
+        print(f"Bölüm notları çıkarılırken hata: {e}")
+        return None
+    notes = _parse_notes(response)
+    cache.save_note("chunk_notes", key, notes)
+    return notes
+
+
+def analyze_corpus(document_chunks, max_workers=NOTES_MAX_WORKERS, priority=PRIORITY_BACKGROUND, owner=None):
+    """
+    Tüm derlemi bir kez işler ve chunk grubu başına notların listesini (belge sırasıyla) döndürür.
+    Notlar grup metninin hash'iyle saklandığı için aynı belge sürümü için tekrar çağrıldığında model çağrılmaz.
+    priority, owner: Not çıkarma çağrılarının LLM zamanlayıcısındaki öncelik sınıfı ve iptal sahibi.
+    """
+    groups = group_document_chunks(document_chunks)
+    if not groups:
+        return []
+    llm = get_llm(priority=priority, owner=owner)
+    cache = IngestionCache()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(groups)))) as executor:
+        return [notes for notes in executor.map(lambda group: analyze_group(llm, group, cache), groups) if notes]
+
+
+# --- Notlar üzerinden birleştirmeler ---
+
+def aggregate_keywords(notes_list, num_keywords=10):
+    """Gruplarda en sık geçen anahtar terimler (yazım farkları büyük/küçük harfe göre birleştirilir)."""
+    counts = Counter()
+    display_forms = {}
+    for notes in notes_list:
+        for term in dict.fromkeys(notes["key_terms"]): # Aynı grupta tekrar eden terim bir kez sayılır
+            normalized = term.casefold()
+            counts[normalized] += 1
+            display_forms.setdefault(normalized, term)
+    return [display_forms[term] for term, _ in counts.most_common(num_keywords)]
+
+
+def _mermaid_label(text):
+    # Mermaid etiketlerinde sorun çıkaran karakterleri temizle
+    return re.sub(r"[\[\]{}()<>\"|#;`]", " ", str(text)).strip()[:60] or "?"
+
+
+def aggregate_relations(notes_list, max_edges=25):
+    """
+    Gruplardaki kavram ilişkilerini birleştirir. Önce sık geçen kavramlar arasındaki, sonra sık tekrarlanan
+    ilişkiler gelir. Dönüş: [(kaynak, ilişki, hedef)] (etiketler Mermaid için temizlenmiş, ilk görülen yazımla).
+    """
+    edge_counts = Counter()
+    concept_counts = Counter()
+    labels = {}
+    for notes in notes_list:
+        for relation in notes["relations"]:
+            source_label, target_label = _mermaid_label(relation["source"]), _mermaid_label(relation["target"])
+            source, target = source_label.casefold(), target_label.casefold()
+            if source == target:
+                continue
+            labels.setdefault(source, source_label)
+            labels.setdefault(target, target_label)
+            edge_counts[(source, _mermaid_label(relation.get("relation", "")), target)] += 1
+            concept_counts[source] += 1
+            concept_counts[target] += 1
+    edges = sorted(edge_counts, key=lambda e: (-(concept_counts[e[0]] + concept_counts[e[2]]), -edge_counts[e]))[:max_edges]
+    return [(labels[source], relation, labels[target]) for source, relation, target in edges]
+
+
+_YEAR_PATTERN = re.compile(r"(1[5-9]\d\d|20\d\d|21\d\d)")
+_NUMERIC_DATE_PATTERN = re.compile(r"(\d{1,4})[./-](\d{1,2})[./-](\d{1,4})")
+
+
+def _date_sort_key(date_text):
+    """Tarih metninden kaba bir sıralama anahtarı üretir; yıl bulunamayan tarihler sona gider."""
+    numeric = _NUMERIC_DATE_PATTERN.search(date_text)
+    if numeric:
+        first, middle, last = numeric.groups()
+        if len(first) == 4: # YYYY-AA-GG
+            return (0, int(first), int(middle), int(last))
+        if len(last) == 4: # GG.AA.YYYY
+            return (0, int(last), int(middle), int(first))
+    year = _YEAR_PATTERN.search(date_text)
+    if year:
+        return (0, int(year.group(1)), 0, 0)
+    return (1, 0, 0, 0)
+
+
+def aggregate_timeline(notes_list):
+    """Tarihli olayları tekilleştirip kronolojik sıralanmış 'Tarih: Açıklama' satırlarına dönüştürür."""
+    seen = set()
+    events = []
+    for notes in notes_list:
+        for event in notes["events"]:
+            date_text, description = str(event["date"]).strip(), str(event["description"]).strip()
+            key = (date_text.casefold(), description.casefold())
+            if key in seen:
+                continue
+            seen.add(key)
+            events.append((date_text, description))
+    events.sort(key=lambda event: _date_sort_key(event[0])) # sıralama kararlıdır; aynı tarihler belge sırasını korur
+    return [f"- **{date_text}**: {description}" for date_text, description in events]
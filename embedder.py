@@ -1,15 +1,217 @@
+import json
 import os
-import faiss
-import pickle
-from langchain_ollama import OllamaEmbeddings # Yeni import
+import threading
+from contextlib import contextmanager
 from langchain_community.vectorstores import FAISS # FAISS importu zaten doğru olmalı
+from embedding_service import EmbeddingService
+from ann_index import DEFAULT_INDEX_TYPE
+from vector_storage import SQLiteDocstore, load_faiss_store, remove_old_generations, save_faiss_store
 
-def embed_and_store(documents, db_path="vectordb/db.faiss"): # chunks parametresini documents olarak değiştirdik
-    embeddings = OllamaEmbeddings(model="qwen2.5:latest")
-    # Document nesneleri listesi için from_documents kullanılır
-    vectorstore = FAISS.from_documents(documents, embedding=embeddings) 
-    vectorstore.save_local(db_path)
+try:
+    import fcntl
+except ImportError: # Windows: süreçler arası kilit yok, tek yazar süreç varsayılır
+    fcntl = None
 
-def load_vectorstore(db_path="vectordb/db.faiss"):
-    embeddings = OllamaEmbeddings(model="qwen2.5:latest") # Bu da yeni importu kullanacak
-    return FAISS.load_local(db_path, embeddings, allow_dangerous_deserialization=True)
+EMBEDDING_MODEL = "qwen2.5:latest"
+MANIFEST_FILE = "manifest.json"
+WRITE_LOCK_FILE = ".write.lock"
+# Arama indeksinde vektör sıkıştırma (None, "float16", "int8") ve PCA hedef boyutu (None: kapalı).
+VECTOR_COMPRESSION = None
+VECTOR_PCA_DIM = None
+
+_shared_embeddings = None
+_shared_embeddings_lock = threading.Lock()
+
+def get_embeddings(**service_options):
+    """
+    Batch'li, paralel ve önbellekli embedding servisini döndürür.
+    Ayar verilmezse süreç genelinde paylaşılan tek örnek döner (HTTP bağlantıları ve SQLite önbellek
+    bağlantısı yeniden kullanılır).
+    service_options: batch_size, max_workers, max_retries gibi EmbeddingService ayarları.
+    """
+    global _shared_embeddings
+    if service_options:
+        return EmbeddingService(model=EMBEDDING_MODEL, **service_options)
+    with _shared_embeddings_lock:
+        if _shared_embeddings is None:
+            _shared_embeddings = EmbeddingService(model=EMBEDDING_MODEL)
+        return _shared_embeddings
+
+def embed_documents(documents, embeddings=None):
+    """
+    Chunk'ların embedding vektörlerini (aynı sırada) döndürür; sonuçlar önbelleğe yazılabilir.
+    embeddings: Ölçümleri (last_stats) okumak için dışarıdan verilebilecek EmbeddingService.
+    """
+    if not documents:
+        return []
+    embeddings = embeddings or get_embeddings()
+    return embeddings.embed_documents([doc.page_content for doc in documents])
+
+def _read_manifest(db_path):
+    with open(os.path.join(db_path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+_write_locks = {} # mutlak yol -> threading.Lock; farklı indekslerin kilitleri iç içe alınabilir
+_write_locks_guard = threading.Lock()
+
+def _get_write_lock(db_path):
+    with _write_locks_guard:
+        return _write_locks.setdefault(os.path.abspath(db_path), threading.Lock())
+
+@contextmanager
+def index_write_lock(db_path="vectordb/db.faiss"):
+    """
+    Aynı indeksi güncelleyen yazarları (thread'ler ve aynı makinedeki süreçler, ör. birden fazla API worker'ı
+    veya Streamlit) sıraya sokar. Okuyucular kilit almaz; manifest atomik yazıldığı için eski ya da yeni nesli görürler.
+    VectorIndexManager kilit alındıktan sonra oluşturulmalıdır ki diğer yazarın değişiklikleri üzerine yazılmasın.
+    """
+    os.makedirs(db_path, exist_ok=True)
+    with _get_write_lock(db_path), open(os.path.join(db_path, WRITE_LOCK_FILE), "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def load_vectorstore(db_path="vectordb/db.faiss", writable=False, search_params=None):
+    """
+    Manifest'te kayıtlı geçerli indeks dosyalarını açar; indeks boşsa veya yoksa None döner.
+    Vektörler mmap ile açılır ve chunk'lar SQLite'tan istendikçe okunur (pickle kullanılmaz).
+    Eski pickle formatındaki veritabanları okunmaz; VectorIndexManager bunları yeniden oluşturur.
+    writable: Artımlı güncelleme için indeksi belleğe kopyalar.
+    search_params: ANN indeksi için {"nprobe": ..., "ef_search": ...} (bkz. ann_index.set_search_params).
+    """
+    try:
+        manifest = _read_manifest(db_path)
+    except FileNotFoundError:
+        return None
+    storage = manifest.get("storage")
+    if not storage:
+        return None
+    return load_faiss_store(db_path, storage, get_embeddings(), writable=writable, search_params=search_params)
+
+
+class VectorIndexManager:
+    """
+    FAISS veritabanını belge bazında artımlı olarak günceller.
+    Her belge (genellikle bir PDF) bir kimlikle (ingestion önbellek anahtarı) eklenir; chunk'ları
+    "<belge_kimliği>:<sıra>" kimlikleriyle saklanır, böylece belge silindiğinde sadece onun vektörleri kaldırılır.
+    Hangi belgelerin, kaynakların ve sayfaların indekste olduğu db_path/manifest.json dosyasında tutulur;
+    yükleme maliyeti böylece tüm derleme değil sadece değişen belgelere bağlı olur.
+    index_type: Arama indeksi ("auto", "flat", "ivf", "hnsw", "ivfpq"; bkz. ann_index). "auto" derlem
+    büyüdükçe kesin aramadan yaklaşık aramaya geçer.
+    compression / pca_dim: Arama indeksinde vektörleri float16/int8 saklama ve PCA ile boyut düşürme;
+    tam vektörler diskte kalır ve ilk adayların yeniden puanlanmasında kullanılır.
+    """
+
+    def __init__(self, db_path="vectordb/db.faiss", index_type=DEFAULT_INDEX_TYPE, compression=VECTOR_COMPRESSION, pca_dim=VECTOR_PCA_DIM):
+        self.db_path = db_path
+        self.index_type = index_type
+        self.compression = compression
+        self.pca_dim = pca_dim
+        self.manifest_path = os.path.join(db_path, MANIFEST_FILE)
+        self.vectorstore = None
+        self.manifest = {"version": 0, "documents": {}, "storage": None}
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.manifest_path):
+            # Manifest yoksa eski (tek seferde oluşturulmuş) veritabanı hangi belgeleri içerdiğini bilmiyoruz;
+            # bu durumda indeks sıfırdan kurulacak.
+            if os.path.exists(os.path.join(self.db_path, "index.faiss")):
+                print(f"{self.db_path} için manifest bulunamadı, indeks yeniden oluşturulacak.")
+            return
+        try:
+            self.manifest = _read_manifest(self.db_path)
+            manifest_chunk_ids = {chunk_id for entry in self.manifest["documents"].values() for chunk_id in entry["chunk_ids"]}
+            if manifest_chunk_ids:
+                self.vectorstore = load_vectorstore(self.db_path, writable=True)
+                if self.vectorstore is None:
+                    raise ValueError("manifest'te indeks dosyaları kayıtlı değil (eski format)")
+                if manifest_chunk_ids != set(self.vectorstore.index_to_docstore_id.values()):
+                    raise ValueError("manifest ile indeks içeriği uyuşmuyor")
+        except Exception as e:
+            print(f"Vektör veritabanı veya manifest okunamadı ({self.db_path}), indeks yeniden oluşturulacak: {e}")
+            self.vectorstore = None
+            self.manifest = {"version": self.manifest.get("version", 0), "documents": {}, "storage": None}
+
+    @property
+    def version(self):
+        """İndeks her değiştiğinde artan sürüm numarası (önbellek geçersizleştirme için kullanılabilir)."""
+        return self.manifest["version"]
+
+    def indexed_document_ids(self):
+        return set(self.manifest["documents"])
+
+    def has_document(self, doc_id):
+        return doc_id in self.manifest["documents"]
+
+    def add_document(self, doc_id, chunks, vectors):
+        """Bir belgenin chunk'larını, önceden hesaplanmış vektörleriyle indekse ekler."""
+        if self.has_document(doc_id):
+            return
+        chunk_ids = [f"{doc_id}:{i}" for i in range(len(chunks))]
+        if chunks:
+            text_embeddings = [(doc.page_content, list(map(float, vector))) for doc, vector in zip(chunks, vectors)]
+            metadatas = [doc.metadata for doc in chunks]
+            if self.vectorstore is None:
+                self.vectorstore = FAISS.from_embeddings(text_embeddings, embedding=get_embeddings(), metadatas=metadatas,
+                                                         ids=chunk_ids, docstore=SQLiteDocstore())
+            else:
+                self.vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=chunk_ids)
+        self.manifest["documents"][doc_id] = {
+            "source": chunks[0].metadata.get("source") if chunks else None,
+            "pages": sorted({doc.metadata.get("page") for doc in chunks if doc.metadata.get("page") is not None}),
+            "chunk_ids": chunk_ids,
+        }
+        self._dirty = True
+
+    def remove_document(self, doc_id):
+        """Bir belgenin tüm vektörlerini ve docstore kayıtlarını indeksten siler."""
+        entry = self.manifest["documents"].pop(doc_id, None)
+        if entry is None:
+            return
+        if entry["chunk_ids"] and self.vectorstore is not None:
+            self.vectorstore.delete(entry["chunk_ids"])
+        self._dirty = True
+
+    def sync(self, loaders):
+        """
+        İndeksi verilen belge kümesine eşitler.
+        loaders: {belge_kimliği: () -> (chunks, vectors)} sözlüğü. Yükleyiciler sadece indekste olmayan
+        belgeler için çağrılır; sözlükte olmayan belgeler indeksten silinir.
+        Dönüş: (eklenen_kimlikler, silinen_kimlikler)
+        """
+        removed = [doc_id for doc_id in self.indexed_document_ids() if doc_id not in loaders]
+        for doc_id in removed:
+            self.remove_document(doc_id)
+        added = []
+        for doc_id, loader in loaders.items():
+            if not self.has_document(doc_id):
+                chunks, vectors = loader()
+                self.add_document(doc_id, chunks, vectors)
+                added.append(doc_id)
+        return added, removed
+
+    def save(self):
+        """Değişiklik varsa indeksi ve manifest'i diske yazar."""
+        if not self._dirty:
+            return
+        self.manifest["version"] += 1
+        os.makedirs(self.db_path, exist_ok=True)
+        if self.vectorstore is not None and self.manifest["documents"]:
+            self.manifest["storage"] = save_faiss_store(self.vectorstore, self.db_path, self.manifest["version"],
+                                                        self.index_type, self.manifest.get("storage"),
+                                                        compression=self.compression, pca_dim=self.pca_dim)
+        else:
+            self.manifest["storage"] = None # Hiç vektör kalmadı
+        # Manifest indeks dosyalarından sonra atomik olarak yazılır; okuyucular ya eski ya yeni nesli görür.
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+        remove_old_generations(self.db_path, self.manifest["version"])
+        self._dirty = False
@@ -0,0 +1,217 @@
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_ollama import OllamaEmbeddings
+
+# Varsayılan ayarlar; batch boyutu ve worker sayısı Ollama sunucusunun paralellik ayarına (OLLAMA_NUM_PARALLEL) göre ayarlanabilir.
+DEFAULT_BATCH_SIZE = 16
+DEFAULT_MAX_WORKERS = 2
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_SECONDS = 1.0
+EMBEDDING_CACHE_PATH = os.path.join("cache", "embeddings.sqlite")
+# Bellekte tutulan soru embedding'i sayısı (768 boyutlu bir vektör ~3 KB)
+QUERY_CACHE_MAX_ENTRIES = 1024
+
+
+def embedding_cache_key(model, text):
+    """Embedding önbelleği anahtarı: hash(model, chunk metni)."""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Chunk embedding'lerinin SQLite tabanlı kalıcı önbelleği.
+    Farklı PDF'lerdeki aynı metinler (ör. tekrar eden yasal uyarılar) ve tekrar yüklenen dosyalar
+    bu sayede bir daha embed edilmez.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Streamlit betiği farklı thread'lerde çalıştırdığı için bağlantı thread'ler arasında paylaşılır; erişim kilitle korunur.
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+
+    def get_many(self, keys):
+        """Önbellekte bulunan anahtarlar için {anahtar: vektör} döndürür."""
+        found = {}
+        with self._lock:
+            # SQLite'ın parametre sınırına takılmamak için parça parça sorgula
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype="float32").tolist()
+        return found
+
+    def put_many(self, items):
+        """items: [(anahtar, vektör), ...]"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype="float32").tobytes()) for key, vector in items],
+            )
+            self._conn.commit()
+
+
+class QueryEmbeddingCache:
+    """
+    Soru embedding'lerinin bellekteki LRU önbelleği; anahtar hash(model, metin).
+    Aynı soru farklı rol veya dilde sorulduğunda, iyileştirildiğinde ya da cevap önbelleği benzerlik araması
+    yaptığında embedding isteği tekrar gönderilmez. Sorular kısa ve çok çeşitli olduğu için diske yazılmaz.
+    """
+
+    def __init__(self, max_entries=QUERY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # anahtar -> vektör (liste)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, key):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return list(vector) # Çağıran listeyi değiştirse de önbellekteki vektör bozulmaz
+
+    def put(self, key, vector):
+        with self._lock:
+            self._entries[key] = list(vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class EmbeddingService(Embeddings):
+    """
+    Ollama embedding çağrıları için servis katmanı.
+    - Metinler ayarlanabilir boyutta batch'lere bölünür ve sınırlı sayıda worker ile paralel gönderilir.
+    - Başarısız istekler üstel bekleme (backoff) ile tekrar denenir.
+    - Sonuçlar hash(model, metin) anahtarıyla diskte saklanır; aynı metin iki kez embed edilmez.
+    - Her embed_documents çağrısından sonra last_stats içinde chunk/saniye gibi ölçümler tutulur (servis paylaşıldığı
+      için eş zamanlı çağrılarda çağrıya özgü ölçümler embed_documents_with_stats ile alınmalıdır).
+    - Soru embedding'leri (embed_query / embed_queries) bellekte LRU olarak saklanır (bkz. QueryEmbeddingCache).
+    LangChain Embeddings arayüzünü uyguladığı için FAISS'e doğrudan verilebilir.
+    """
+
+    def __init__(self, model, batch_size=DEFAULT_BATCH_SIZE, max_workers=DEFAULT_MAX_WORKERS,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff_seconds=DEFAULT_BACKOFF_SECONDS,
+                 cache=None, client=None, query_cache=None):
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self.client = client if client is not None else OllamaEmbeddings(model=model)
+        self.query_cache = query_cache if query_cache is not None else QueryEmbeddingCache()
+        self.last_stats = {}
+
+    def _with_retry(self, func, *args):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return func(*args)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff_seconds * (2 ** attempt) * (1 + random.random() * 0.25)
+                print(f"Embedding isteği başarısız oldu ({e}), {delay:.1f} sn sonra tekrar denenecek ({attempt + 1}/{self.max_retries}).")
+                time.sleep(delay)
+
+    def _embed_batch(self, texts):
+        return self._with_retry(self.client.embed_documents, texts)
+
+    def embed_documents(self, texts):
+        return self.embed_documents_with_stats(texts)[0]
+
+    def embed_documents_with_stats(self, texts):
+        """
+        embed_documents ile aynı; ek olarak bu çağrının ölçümlerini döndürür (last_stats'taki alanlar ve her metin
+        için önbellekten gelip gelmediği: "from_cache" listesi). Dönüş: (vektörler, ölçümler)
+        """
+        started = time.perf_counter()
+        keys = [embedding_cache_key(self.model, text) for text in texts]
+        vectors_by_key = self.cache.get_many(list(set(keys)))
+        cache_hits = sum(1 for key in keys if key in vectors_by_key)
+
+        # Önbellekte olmayan benzersiz metinleri topla (aynı çağrıdaki tekrarlar da bir kez embed edilir)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors_by_key and key not in missing:
+                missing[key] = text
+        missing_keys = list(missing)
+        batches = [missing_keys[i:i + self.batch_size] for i in range(0, len(missing_keys), self.batch_size)]
+
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+                results = executor.map(lambda batch: self._embed_batch([missing[key] for key in batch]), batches)
+                for batch, batch_vectors in zip(batches, results):
+                    new_items = list(zip(batch, batch_vectors))
+                    self.cache.put_many(new_items) # Her batch hemen yazılır; kesinti olursa tamamlanan iş kaybolmaz
+                    vectors_by_key.update(new_items)
+
+        elapsed = time.perf_counter() - started
+        self.last_stats = last_stats = {
+            "chunks": len(texts),
+            "cache_hits": cache_hits,
+            "embedded": len(missing_keys),
+            "batches": len(batches),
+            "batch_size": self.batch_size,
+            "max_workers": self.max_workers,
+            "seconds": elapsed,
+            "chunks_per_sec": len(texts) / elapsed if elapsed > 0 else float("inf"),
+            "embedded_per_sec": len(missing_keys) / elapsed if elapsed > 0 and missing_keys else 0.0,
+        }
+        if missing_keys:
+            print(f"Embedding: {len(texts)} chunk ({cache_hits} önbellekten), {elapsed:.1f} sn, "
+                  f"{last_stats['embedded_per_sec']:.1f} chunk/sn (batch={self.batch_size}, worker={self.max_workers})")
+        call_stats = dict(last_stats, from_cache=[key not in missing for key in keys])
+        return [vectors_by_key[key] for key in keys], call_stats
+
+    def embed_query(self, text):
+        key = embedding_cache_key(self.model, text)
+        vector = self.query_cache.get(key)
+        if vector is None:
+            vector = self._with_retry(self.client.embed_query, text)
+            self.query_cache.put(key, vector)
+        return vector
+
+    def embed_queries(self, texts):
+        """
+        Birden fazla sorunun embedding'leri. Önbellekte olmayan benzersiz sorular batch_size'lık tek istekler
+        halinde embed edilir (Ollama'da soru ve belge embedding'i aynı uç noktadan gelir).
+        """
+        keys = [embedding_cache_key(self.model, text) for text in texts]
+        vectors_by_key = {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in vectors_by_key or key in missing:
+                continue
+            vector = self.query_cache.get(key)
+            if vector is None:
+                missing[key] = text
+            else:
+                vectors_by_key[key] = vector
+        missing_keys = list(missing)
+        for start in range(0, len(missing_keys), self.batch_size):
+            batch = missing_keys[start:start + self.batch_size]
+            for key, vector in zip(batch, self._embed_batch([missing[key] for key in batch])):
+                self.query_cache.put(key, vector)
+                vectors_by_key[key] = vector
+        return [list(vectors_by_key[key]) for key in keys]
@@ -0,0 +1,130 @@
+"""
+Sözcüksel (BM25) ve yoğun (FAISS) aramayı reciprocal-rank fusion (RRF) ile birleştiren retriever.
+Kısa, anahtar kelime tarzı sorgularda (madde numarası, ilaç adı, dosya numarası) BM25 sonuçları sorgunun
+tüm ayırt edici terimlerini içeriyorsa embedding çağrısı hiç yapılmaz.
+Birden fazla sorgu (toplu işler, önerilen soruların önceden cevaplanması) batch_retrieve ile tek embedding
+isteği ve tek FAISS search çağrısıyla aranır.
+"""
+import threading
+from typing import Any
+
+import faiss
+import numpy as np
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict, Field
+
+RETRIEVAL_K = 4 # vectorstore.as_retriever() varsayılanıyla aynı
+CANDIDATES_PER_RETRIEVER = 20
+RRF_K = 60
+KEYWORD_QUERY_MAX_TERMS = 4
+
+
+def reciprocal_rank_fusion(rankings, rrf_k=RRF_K):
+    """rankings: her biri anahtarları en iyiden kötüye sıralanmış listeler. Dönüş: birleşik sıralı anahtarlar."""
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=lambda key: -scores[key])
+
+
+class HybridRetriever(BaseRetriever):
+    """vectorstore.docstore BM25 indeksi içeren (SQLiteDocstore) bir FAISS vectorstore üzerinde hibrit arama."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstore: Any
+    k: int = RETRIEVAL_K
+    fetch_k: int = CANDIDATES_PER_RETRIEVER
+    rrf_k: int = RRF_K
+    keyword_query_max_terms: int = KEYWORD_QUERY_MAX_TERMS
+    # Sorguların kaçının sadece BM25 ile, kaçının birleşik aramayla cevaplandığı
+    stats: dict = Field(default_factory=lambda: {"lexical_only": 0, "fused": 0})
+    stats_lock: Any = Field(default_factory=threading.Lock)
+
+    def _count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def _is_keyword_match(self, lexical_results, required_terms):
+        if not lexical_results or not 0 < required_terms <= self.keyword_query_max_terms:
+            return False
+        _, _, matched_terms = lexical_results[0]
+        return matched_terms >= required_terms
+
+    def _fuse(self, dense_documents, lexical_results):
+        documents = {doc.id: doc for doc in dense_documents}
+        fused_ids = reciprocal_rank_fusion(
+            [[doc.id for doc in dense_documents], [chunk_id for chunk_id, _, _ in lexical_results]], self.rrf_k
+        )[:self.k]
+        docstore = self.vectorstore.docstore
+        return [documents[chunk_id] if chunk_id in documents else docstore.search(chunk_id) for chunk_id in fused_ids]
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        docstore = self.vectorstore.docstore
+        lexical_results, required_terms = docstore.lexical_search(query, self.fetch_k)
+        if self._is_keyword_match(lexical_results, required_terms):
+            self._count("lexical_only")
+            return [docstore.search(chunk_id) for chunk_id, _, _ in lexical_results[:self.k]]
+
+        self._count("fused")
+        return self._fuse(self.vectorstore.similarity_search(query, k=self.fetch_k), lexical_results)
+
+    def retrieve_many(self, queries):
+        """
+        invoke ile aynı sonuçları birden fazla sorgu için üretir; BM25 ile cevaplanamayan sorguların
+        embedding'leri tek istekte alınır ve FAISS'te tek search çağrısıyla aranır.
+        Dönüş: her sorgu için Document listesi (sorgu sırasıyla).
+        """
+        docstore = self.vectorstore.docstore
+        lexical = [docstore.lexical_search(query, self.fetch_k) for query in queries]
+        results = [None] * len(queries)
+        dense_positions = []
+        for position, (lexical_results, required_terms) in enumerate(lexical):
+            if self._is_keyword_match(lexical_results, required_terms):
+                self._count("lexical_only")
+                results[position] = [docstore.search(chunk_id) for chunk_id, _, _ in lexical_results[:self.k]]
+            else:
+                dense_positions.append(position)
+        dense_results = batch_similarity_search(self.vectorstore, [queries[position] for position in dense_positions], self.fetch_k)
+        for position, dense_documents in zip(dense_positions, dense_results):
+            self._count("fused")
+            results[position] = self._fuse(dense_documents, lexical[position][0])
+        return results
+
+
+def batch_similarity_search(vectorstore, queries, k=RETRIEVAL_K):
+    """
+    vectorstore.similarity_search'ün çok sorgulu karşılığı: embedding'ler (varsa embed_queries ile, önbellekten
+    veya tek istekte) alınır ve tüm sorgular tek bir index.search çağrısıyla aranır.
+    """
+    if not queries:
+        return []
+    embeddings = vectorstore.embeddings
+    if hasattr(embeddings, "embed_queries"):
+        vectors = embeddings.embed_queries(queries)
+    else:
+        vectors = [embeddings.embed_query(query) for query in queries]
+    matrix = np.asarray(vectors, dtype="float32")
+    if getattr(vectorstore, "_normalize_L2", False):
+        faiss.normalize_L2(matrix)
+    _, indices = vectorstore.index.search(matrix, k)
+    return [
+        [vectorstore.docstore.search(vectorstore.index_to_docstore_id[int(i)]) for i in row if i != -1]
+        for row in indices
+    ]
+
+
+def batch_retrieve(vectorstore, queries, k=RETRIEVAL_K):
+    """get_retriever(vectorstore, k).invoke(sorgu) sonuçlarını birden fazla sorgu için tek seferde döndürür."""
+    retriever = get_retriever(vectorstore, k)
+    if isinstance(retriever, HybridRetriever):
+        return retriever.retrieve_many(queries)
+    return batch_similarity_search(vectorstore, queries, k)
+
+
+def get_retriever(vectorstore, k=RETRIEVAL_K):
+    """Docstore BM25 indeksi içeriyorsa hibrit retriever, yoksa (eski indeks) sadece yoğun arama."""
+    if getattr(vectorstore.docstore, "has_lexical_index", False):
+        return HybridRetriever(vectorstore=vectorstore, k=k)
+    return vectorstore.as_retriever(search_kwargs={"k": k})
@@ -0,0 +1,267 @@
+import functools
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+from langchain.docstore.document import Document
+
+from pdf_handler import open_page_stream, chunk_pages
+from embedder import embed_documents, get_embeddings
+from chunk_dedup import ChunkDeduplicator, deduplicate_page_chunks
+
+CACHE_DIR = "cache"
+# Önbellek formatı değişirse bu sürümü artırın; eski girdiler otomatik olarak geçersiz olur.
+# 2: chunk'lara sayfa içi başlangıç konumu (start_index), sayfalara kelime geometrisi eklendi.
+CACHE_FORMAT_VERSION = 2
+
+
+def _tmp_path(path, suffix=".tmp"):
+    """
+    Atomik yazma için geçici dosya adı. Önbellek oturumlar ve API worker'ları arasında paylaşıldığından ad süreç ve
+    thread'e özgüdür; aynı dosyayı aynı anda yazan iki yazar birbirinin yarım dosyasını yerine taşımaz.
+    """
+    return f"{path}.{os.getpid()}.{threading.get_ident()}{suffix}"
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def compute_file_hash(file_bytes):
+    """Dosya içeriğinin SHA-256 özetini döndürür (dosya adından bağımsızdır)."""
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+def make_cache_key(file_hash, chunk_settings, embedding_model):
+    """
+    Bir dosyanın önbellek anahtarını üretir.
+    Anahtar; dosya içeriği, chunk ayarları (chunk_size, chunk_overlap vb.) ve embedding modeline bağlıdır,
+    böylece bu ayarlardan biri değiştiğinde eski chunk'lar ve vektörler yeniden kullanılmaz.
+    """
+    key_material = json.dumps({
+        "file_hash": file_hash,
+        "chunk_settings": chunk_settings,
+        "embedding_model": embedding_model,
+        "format_version": CACHE_FORMAT_VERSION,
+    }, sort_keys=True)
+    return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+
+def make_corpus_key(file_keys, *extra):
+    """
+    Birden fazla dosyadan oluşan bir derlem (corpus) için anahtar üretir.
+    extra: Rol, dil gibi türetilmiş içeriği etkileyen ek parametreler.
+    """
+    key_material = json.dumps({"files": sorted(file_keys), "extra": list(extra)}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+
+@functools.lru_cache(maxsize=16)
+def _load_page_geometry(file_dir):
+    pages_path = os.path.join(file_dir, "pages.jsonl")
+    geometry = {}
+    try:
+        with open(pages_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    page_data = json.loads(line)
+                    geometry[page_data["metadata"]["page"]] = page_data.get("words", [])
+    except OSError:
+        pass
+    return geometry
+
+
+def documents_to_records(documents):
+    """LangChain Document listesini JSON'a yazılabilir sözlük listesine çevirir."""
+    return [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents]
+
+
+def records_to_documents(records):
+    """documents_to_records ile yazılmış kayıtları tekrar Document nesnelerine çevirir."""
+    return [Document(page_content=r["page_content"], metadata=r["metadata"]) for r in records]
+
+
+class IngestionCache:
+    """
+    PDF işleme sonuçlarının kalıcı (diskte) önbelleği.
+    Her dosya anahtarı için cache/files/<anahtar>/ altında sayfalar, chunk'lar ve embedding vektörleri;
+    derlem anahtarları için cache/corpus/<anahtar>/ altında örnek sorular, anahtar kelimeler gibi
+    türetilmiş çıktılar saklanır.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _file_dir(self, key):
+        return os.path.join(self.cache_dir, "files", key)
+
+    def _corpus_dir(self, corpus_key):
+        return os.path.join(self.cache_dir, "corpus", corpus_key)
+
+    @staticmethod
+    def _write_json(path, value):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = _tmp_path(path)
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path) # Yarım yazılmış dosya okunmasın diye atomik yer değiştirme
+        except BaseException:
+            _remove_quietly(tmp_path)
+            raise
+
+    @staticmethod
+    def _read_json(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Önbellek dosyası okunamadı ({path}): {e}")
+            return None
+
+    # --- Dosya bazlı girdiler ---
+
+    def has_file(self, key):
+        """Dosyanın chunk'ları ve vektörleri önbellekte tam olarak varsa True döner."""
+        file_dir = self._file_dir(key)
+        return all(os.path.exists(os.path.join(file_dir, name)) for name in ("meta.json", "chunks.json", "vectors.npy"))
+
+    def record_pages(self, key, pages_iter):
+        """
+        Sayfaları pages.jsonl dosyasına yazarken aynen aktaran generator.
+        Sayfalar bellekte toplanmadan chunk'lama aşamasına akmaya devam eder.
+        """
+        file_dir = self._file_dir(key)
+        os.makedirs(file_dir, exist_ok=True)
+        pages_path = os.path.join(file_dir, "pages.jsonl")
+        tmp_path = _tmp_path(pages_path)
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for page_data in pages_iter:
+                    f.write(json.dumps(page_data, ensure_ascii=False) + "\n")
+                    yield page_data
+            os.replace(tmp_path, pages_path)
+        except BaseException: # Hata veya yarıda bırakma (GeneratorExit): geçici dosya kalmasın
+            _remove_quietly(tmp_path)
+            raise
+
+    def save_file_entry(self, key, meta, chunks, vectors):
+        """
+        Bir dosyanın işleme sonuçlarını önbelleğe yazar (sayfalar record_pages ile ayrıca yazılır).
+        meta: {"source": ..., "total_pages": ...} gibi dosya bilgileri.
+        chunks: chunk_pages çıktısı (Document listesi).
+        vectors: chunk'larla aynı sırada embedding vektörleri.
+        """
+        file_dir = self._file_dir(key)
+        os.makedirs(file_dir, exist_ok=True)
+        self._write_json(os.path.join(file_dir, "chunks.json"), documents_to_records(chunks))
+        vectors_tmp_path = _tmp_path(os.path.join(file_dir, "vectors"), ".tmp.npy") # np.save uzantısı .npy olmalı
+        try:
+            np.save(vectors_tmp_path, np.asarray(vectors, dtype="float32"))
+            os.replace(vectors_tmp_path, os.path.join(file_dir, "vectors.npy"))
+        except BaseException:
+            _remove_quietly(vectors_tmp_path)
+            raise
+        # meta.json en son yazılır; has_file kontrolü yarım kalmış girdileri böylece görmez.
+        self._write_json(os.path.join(file_dir, "meta.json"), meta)
+
+    def load_meta(self, key):
+        return self._read_json(os.path.join(self._file_dir(key), "meta.json"))
+
+    def load_page_geometry(self, key):
+        """
+        {sayfa_no: kelime geometrisi} sözlüğünü döndürür (önizleme vurguları için).
+        Aynı dosya için tekrar tekrar diskten okunmaması için sonuçlar bellekte tutulur.
+        """
+        return _load_page_geometry(self._file_dir(key))
+
+    def load_pages(self, key):
+        pages_path = os.path.join(self._file_dir(key), "pages.jsonl")
+        if not os.path.exists(pages_path):
+            return []
+        with open(pages_path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def load_chunks(self, key, source_name=None):
+        """
+        Önbellekteki chunk'ları Document listesi olarak döndürür.
+        source_name: Aynı içerik farklı bir dosya adıyla yüklendiyse metadata'daki kaynak adı güncellenir.
+        """
+        records = self._read_json(os.path.join(self._file_dir(key), "chunks.json")) or []
+        chunks = records_to_documents(records)
+        if source_name:
+            for chunk in chunks:
+                chunk.metadata["source"] = source_name
+        return chunks
+
+    def load_vectors(self, key):
+        try:
+            return np.load(os.path.join(self._file_dir(key), "vectors.npy"))
+        except (OSError, ValueError) as e:
+            print(f"Önbellekteki vektörler okunamadı ({key}): {e}")
+            return None
+
+    # --- Derlem bazlı türetilmiş çıktılar (örnek sorular, anahtar kelimeler vb.) ---
+
+    def load_artifact(self, corpus_key, name):
+        return self._read_json(os.path.join(self._corpus_dir(corpus_key), f"{name}.json"))
+
+    def save_artifact(self, corpus_key, name, value):
+        self._write_json(os.path.join(self._corpus_dir(corpus_key), f"{name}.json"), value)
+
+    # --- Chunk grubu bazlı ara sonuçlar (ör. map-reduce özetlerinin map adımı) ---
+
+    def load_note(self, kind, key):
+        return self._read_json(os.path.join(self.cache_dir, "notes", kind, f"{key}.json"))
+
+    def save_note(self, kind, key, value):
+        self._write_json(os.path.join(self.cache_dir, "notes", kind, f"{key}.json"), value)
+
+
+def load_cached_file(file_key, source_name, cache):
+    """
+    Önbellekte geçerli bir girdi varsa (meta, chunks, vectors, True) döndürür, yoksa None.
+    source_name: Aynı içerik farklı bir dosya adıyla yüklendiyse kaynak adı buna göre güncellenir.
+    """
+    if not cache.has_file(file_key):
+        return None
+    meta = cache.load_meta(file_key)
+    chunks = cache.load_chunks(file_key, source_name=source_name)
+    vectors = cache.load_vectors(file_key)
+    if meta is not None and vectors is not None and len(vectors) == len(chunks):
+        meta["source"] = source_name
+        return meta, chunks, vectors, True
+    print(f"{source_name} için önbellek girdisi tutarsız, dosya yeniden işlenecek.")
+    return None
+
+
+def load_or_process_file(file_path, source_name, file_key, cache):
+    """
+    Bir PDF dosyasının sayfa sayısını, chunk'larını ve vektörlerini döndürür.
+    Önbellekte geçerli bir girdi varsa PDF yeniden okunmaz ve embedding modeli çağrılmaz;
+    yoksa dosya işlenir ve sonuçlar önbelleğe yazılır.
+    Birden fazla dosyayı aşamaları örtüştürerek işlemek için ingestion_pipeline.IngestionPipeline kullanılabilir.
+    Dönüş: (meta, chunks, vectors, from_cache)
+    """
+    cached = load_cached_file(file_key, source_name, cache)
+    if cached is not None:
+        return cached
+
+    # Sayfalar süreç havuzunda çıkarılıp geldikçe chunk'lanır; PDF sayfa sayısı için ayrıca açılmaz.
+    total_pages, pages_iter = open_page_stream(file_path)
+    pages_iter = cache.record_pages(file_key, pages_iter)
+    deduplicator = ChunkDeduplicator()
+    chunks = list(deduplicate_page_chunks(pages_iter, chunk_pages, deduplicator))
+    embeddings = get_embeddings()
+    vectors = embed_documents(chunks, embeddings)
+    meta = {"source": source_name, "total_pages": total_pages, "embedding_stats": embeddings.last_stats,
+            "dedup_stats": deduplicator.stats}
+    cache.save_file_entry(file_key, meta, chunks, vectors)
+    return meta, chunks, np.asarray(vectors, dtype="float32"), False
@@ -0,0 +1,265 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+from pdf_handler import open_page_stream, chunk_pages
+from embedder import get_embeddings
+from ingestion_cache import load_cached_file
+from chunk_dedup import ChunkDeduplicator
+
+# Aşamalar arası kuyruk boyutları; dolu kuyruk üretici aşamayı bekletir, böylece bellek kullanımı sınırlı kalır.
+PAGE_QUEUE_SIZE = 64
+CHUNK_QUEUE_SIZE = 256
+
+_FILE_END = "file_end"
+_FILE_ERROR = "file_error"
+_ITEM = "item"
+_STOP = object()
+
+
+class StageStats:
+    """Bir aşamanın işlediği öğe sayısı ve geçen süre (throughput hesabı için)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.started_at = time.perf_counter()
+
+    def add(self, count=1):
+        with self._lock:
+            self.items += count
+
+    def finish(self):
+        self.finished_at = time.perf_counter()
+
+    def snapshot(self):
+        if self.started_at is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        return {
+            "items": self.items,
+            "seconds": elapsed,
+            "per_sec": self.items / elapsed if elapsed > 0 else 0.0,
+            "done": self.finished_at is not None,
+        }
+
+
+class IngestionPipeline:
+    """
+    PDF işleme hattı: çıkarma -> chunk'lama -> embedding aşamaları ayrı thread'lerde çalışır ve
+    aralarında sınırlı kuyruklar vardır. CPU ağırlıklı PDF ayrıştırma, Ollama'ya giden (G/Ç ağırlıklı)
+    embedding istekleriyle eş zamanlı ilerler; her aşamanın ilerlemesi ve hızı takip edilir.
+    Önbellekte bulunan dosyalar hatta hiç girmez.
+    """
+
+    def __init__(self, cache, embeddings=None, page_queue_size=PAGE_QUEUE_SIZE, chunk_queue_size=CHUNK_QUEUE_SIZE):
+        self.cache = cache
+        self.embeddings = embeddings or get_embeddings()
+        # Embedding aşaması, servisin tüm worker'larını dolduracak kadar chunk'ı tek seferde gönderir.
+        self.embed_batch_size = self.embeddings.batch_size * self.embeddings.max_workers
+        self.page_queue = queue.Queue(maxsize=page_queue_size)
+        self.chunk_queue = queue.Queue(maxsize=chunk_queue_size)
+        self.stats = {name: StageStats(name) for name in ("extract", "chunk", "embed")}
+        self.total_pages = 0
+        self.files_total = 0
+        self.files_done = 0
+        self.results = {}
+        self._metas = {}
+        self._error = None
+        self._cancelled = threading.Event()
+
+    # --- Aşamalar ---
+
+    def _extract_stage(self, files):
+        stats = self.stats["extract"]
+        stats.start()
+        try:
+            for file_path, source_name, file_key in files:
+                if self._cancelled.is_set():
+                    break
+                try:
+                    total_pages, pages_iter = open_page_stream(file_path)
+                    self._metas[file_key] = {"source": source_name, "total_pages": total_pages}
+                    self.total_pages += total_pages
+                    for page_data in self.cache.record_pages(file_key, pages_iter):
+                        if self._cancelled.is_set():
+                            break
+                        page_data["metadata"]["source"] = source_name
+                        self.page_queue.put((_ITEM, file_key, page_data))
+                        stats.add()
+                    self.page_queue.put((_FILE_END, file_key, None))
+                except Exception as e:
+                    self.page_queue.put((_FILE_ERROR, file_key, e))
+        finally:
+            stats.finish()
+            self.page_queue.put(_STOP)
+
+    def _chunk_stage(self):
+        stats = self.stats["chunk"]
+        stats.start()
+        deduplicators = {} # dosya -> ChunkDeduplicator (tekilleştirme dosya bazında)
+        try:
+            while True:
+                message = self.page_queue.get()
+                if message is _STOP:
+                    break
+                kind, file_key, payload = message
+                if kind == _ITEM:
+                    deduplicator = deduplicators.setdefault(file_key, ChunkDeduplicator())
+                    for chunk in deduplicator.add_page(payload, chunk_pages([payload])):
+                        self.chunk_queue.put((_ITEM, file_key, chunk))
+                        stats.add()
+                elif kind == _FILE_END:
+                    deduplicator = deduplicators.pop(file_key, ChunkDeduplicator())
+                    for chunk in deduplicator.flush():
+                        self.chunk_queue.put((_ITEM, file_key, chunk))
+                        stats.add()
+                    self._metas[file_key]["dedup_stats"] = deduplicator.stats
+                    self.chunk_queue.put(message)
+                else:
+                    deduplicators.pop(file_key, None)
+                    self.chunk_queue.put(message)
+        finally:
+            stats.finish()
+            self.chunk_queue.put(_STOP)
+
+    def _embed_stage(self):
+        stats = self.stats["embed"]
+        stats.start()
+        file_chunks = {}
+        file_vectors = {}
+        file_embed_stats = {} # dosya -> {"embedded", "cache_hits", "seconds"} (sadece bu dosyanın chunk'ları)
+        failed_files = {} # dosya -> hata; dosyanın kalan chunk'ları atlanır, diğer dosyalar işlenmeye devam eder
+        pending = [] # [(file_key, chunk)] henüz embed edilmemiş chunk'lar
+
+        def fail_file(file_key, error):
+            failed_files[file_key] = error
+            file_chunks.pop(file_key, None)
+            file_vectors.pop(file_key, None)
+            file_embed_stats.pop(file_key, None)
+            pending[:] = [item for item in pending if item[0] != file_key]
+
+        def flush():
+            if not pending:
+                return
+            batch = list(pending)
+            pending.clear()
+            try:
+                vectors, batch_stats = self.embeddings.embed_documents_with_stats([chunk.page_content for _, chunk in batch])
+            except Exception as e:
+                print(f"Embedding başarısız oldu: {e}")
+                for file_key in dict.fromkeys(file_key for file_key, _ in batch):
+                    fail_file(file_key, e)
+                return
+            # Batch süresi, içindeki dosyalara chunk sayılarına göre paylaştırılır.
+            seconds_per_chunk = batch_stats["seconds"] / len(batch)
+            for (file_key, chunk), vector, from_cache in zip(batch, vectors, batch_stats["from_cache"]):
+                file_chunks.setdefault(file_key, []).append(chunk)
+                file_vectors.setdefault(file_key, []).append(vector)
+                file_stats = file_embed_stats.setdefault(file_key, {"embedded": 0, "cache_hits": 0, "seconds": 0.0})
+                file_stats["cache_hits" if from_cache else "embedded"] += 1
+                file_stats["seconds"] += seconds_per_chunk
+            stats.add(len(batch))
+
+        try:
+            while True:
+                message = self.chunk_queue.get()
+                if message is _STOP:
+                    break
+                kind, file_key, payload = message
+                if kind == _ITEM:
+                    if file_key in failed_files:
+                        continue
+                    pending.append((file_key, payload))
+                    if len(pending) >= self.embed_batch_size:
+                        flush()
+                elif kind == _FILE_END:
+                    flush()
+                    if file_key in failed_files:
+                        self.results[file_key] = failed_files.pop(file_key)
+                        self.files_done += 1
+                        continue
+                    chunks = file_chunks.pop(file_key, [])
+                    vectors = np.asarray(file_vectors.pop(file_key, []), dtype="float32")
+                    file_stats = file_embed_stats.pop(file_key, {"embedded": 0, "cache_hits": 0, "seconds": 0.0})
+                    meta = dict(self._metas[file_key], embedding_stats={
+                        "embedded": file_stats["embedded"],
+                        "cache_hits": file_stats["cache_hits"],
+                        "embedded_per_sec": file_stats["embedded"] / file_stats["seconds"] if file_stats["seconds"] > 0 else 0.0,
+                    })
+                    try:
+                        self.cache.save_file_entry(file_key, meta, chunks, vectors)
+                        self.results[file_key] = (meta, chunks, vectors, False)
+                    except Exception as e:
+                        self.results[file_key] = e
+                    self.files_done += 1
+                else: # _FILE_ERROR
+                    fail_file(file_key, payload)
+                    self.results[file_key] = failed_files.pop(file_key)
+                    self.files_done += 1
+        except Exception as e:
+            self._error = e
+            self._cancelled.set()
+            # Üst aşamalar dolu kuyrukta takılı kalmasın diye kuyrukları boşalt
+            while self.chunk_queue.get() is not _STOP:
+                pass
+        finally:
+            stats.finish()
+
+    # --- Çalıştırma ---
+
+    def progress(self):
+        """Arayüzde gösterilecek anlık ilerleme bilgisi."""
+        return {
+            "files_total": self.files_total,
+            "files_done": self.files_done,
+            "total_pages": self.total_pages,
+            "stages": {name: stage.snapshot() for name, stage in self.stats.items()},
+        }
+
+    def run(self, files, on_progress=None, poll_interval=0.25):
+        """
+        files: [(file_path, source_name, file_key), ...]
+        on_progress: progress() sonucunu alan fonksiyon; çağıran thread'de (ör. Streamlit betiği) çalışır.
+        Dönüş: {file_key: (meta, chunks, vectors, from_cache) veya dosyaya özgü hata (Exception)}
+        Bir dosyanın hatası diğer dosyaların (önbellekten gelen veya tamamlanmış) sonuçlarını etkilemez.
+        """
+        to_process = []
+        for file_path, source_name, file_key in files:
+            cached = load_cached_file(file_key, source_name, self.cache)
+            if cached is not None:
+                self.results[file_key] = cached
+            else:
+                to_process.append((file_path, source_name, file_key))
+        self.files_total = len(to_process)
+
+        if to_process:
+            threads = [
+                threading.Thread(target=self._extract_stage, args=(to_process,), daemon=True),
+                threading.Thread(target=self._chunk_stage, daemon=True),
+                threading.Thread(target=self._embed_stage, daemon=True),
+            ]
+            for thread in threads:
+                thread.start()
+            while any(thread.is_alive() for thread in threads):
+                if on_progress:
+                    on_progress(self.progress())
+                threads[-1].join(poll_interval)
+            for thread in threads:
+                thread.join()
+            if on_progress:
+                on_progress(self.progress())
+            if self._error is not None:
+                # Hat beklenmedik şekilde durduysa tamamlanamayan dosyalar bu hatayla işaretlenir.
+                print(f"PDF işleme hattı durdu: {self._error}")
+                for _, _, file_key in to_process:
+                    self.results.setdefault(file_key, self._error)
+        return self.results
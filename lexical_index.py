@@ -0,0 +1,112 @@
+"""
+Chunk'lar için BM25 ters indeksi.
+Madde numaraları, ilaç adları, dosya/vaka numaraları gibi birebir geçen terimler yoğun (embedding) aramada
+sıklıkla kaçırılır. Terim -> chunk eşlemeleri (postings) docstore SQLite dosyasının içinde tutulur; böylece
+indeks FAISS ile aynı nesilde, aynı artımlı güncellemeyle yazılır ve ayrı bir senkronizasyon gerekmez.
+Sorgu sırasında sadece sorgudaki terimlerin satırları okunur.
+"""
+import math
+import re
+import unicodedata
+from collections import Counter
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Chunk'ların bu oranından fazlasında geçen terimler (ör. "ve", "the") sorguda başka terim varsa atlanır.
+COMMON_TERM_DF_RATIO = 0.5
+MAX_TOKEN_LENGTH = 64
+
+_TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+_PART_SEPARATORS = re.compile(r"[-./]")
+
+LEXICAL_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL, PRIMARY KEY (term, chunk_id)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS chunk_lengths (chunk_id TEXT PRIMARY KEY, length INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL)",
+)
+
+
+def tokenize(text):
+    """
+    Büyük/küçük harf duyarsız terimler. "2023/45", "A-12" gibi birleşik ifadeler hem bütün olarak hem de
+    parçalarıyla indekslenir; böylece "madde 12" ve "12.3" aramaları da eşleşir.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold().replace("i̇", "i") # Türkçe "İ" casefold sonrası
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(text):
+        if len(token) > MAX_TOKEN_LENGTH:
+            continue
+        tokens.append(token)
+        parts = _PART_SEPARATORS.split(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+def index_chunks(conn, chunks):
+    """chunks: [(chunk_id, metin), ...] postings ve uzunluk tablolarına eklenir."""
+    postings = []
+    lengths = []
+    for chunk_id, text in chunks:
+        counts = Counter(tokenize(text))
+        lengths.append((chunk_id, sum(counts.values())))
+        postings.extend((term, chunk_id, tf) for term, tf in counts.items())
+    conn.executemany("INSERT OR REPLACE INTO postings VALUES (?, ?, ?)", postings)
+    conn.executemany("INSERT OR REPLACE INTO chunk_lengths VALUES (?, ?)", lengths)
+
+
+def copy_chunks(conn, source_schema, kept_ids_table):
+    """Başka bir (ATTACH edilmiş) dosyadaki, kept_ids_table'da kimliği olan chunk'ların postings kayıtlarını kopyalar."""
+    conn.execute(f"INSERT OR REPLACE INTO postings SELECT p.* FROM {source_schema}.postings p JOIN {kept_ids_table} k ON k.id = p.chunk_id")
+    conn.execute(f"INSERT OR REPLACE INTO chunk_lengths SELECT l.* FROM {source_schema}.chunk_lengths l JOIN {kept_ids_table} k ON k.id = l.chunk_id")
+
+
+def finalize(conn):
+    """Belge frekanslarını postings tablosundan yeniden hesaplar (yazma işleminin sonunda bir kez)."""
+    conn.execute("DELETE FROM terms")
+    conn.execute("INSERT INTO terms SELECT term, COUNT(*) FROM postings GROUP BY term")
+
+
+class BM25Searcher:
+    """
+    Salt okunur bir docstore dosyası üzerinde BM25 araması.
+    read: (sorgu, parametreler) -> satırlar; docstore'un kilitli okuma fonksiyonu.
+    """
+
+    def __init__(self, read):
+        self._read = read
+        count, total = read("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunk_lengths")[0]
+        self.num_chunks = count
+        self.avg_length = total / count if count else 0.0
+
+    def search(self, query, k=10):
+        """
+        Dönüş: ([(chunk_id, skor, eşleşen_terim_sayısı), ...] skora göre azalan, aranan terim sayısı).
+        Aranan terim sayısı, atlanan yaygın terimleri saymaz ama derlemde hiç geçmeyen terimleri sayar;
+        bir chunk bu sayıya ulaşıyorsa sorgunun tüm ayırt edici terimlerini içeriyordur.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.num_chunks:
+            return [], len(terms)
+        placeholders = ",".join("?" * len(terms))
+        document_frequencies = dict(self._read(f"SELECT term, df FROM terms WHERE term IN ({placeholders})", terms))
+        searchable = [term for term in terms if term in document_frequencies]
+        rare = [term for term in searchable if document_frequencies[term] <= COMMON_TERM_DF_RATIO * self.num_chunks]
+        missing_count = len(terms) - len(searchable)
+        searchable = rare or searchable
+
+        scores = Counter()
+        matched_terms = Counter()
+        for term in searchable:
+            df = document_frequencies[term]
+            idf = math.log(1 + (self.num_chunks - df + 0.5) / (df + 0.5))
+            rows = self._read(
+                "SELECT p.chunk_id, p.tf, l.length FROM postings p JOIN chunk_lengths l ON l.chunk_id = p.chunk_id WHERE p.term = ?",
+                (term,),
+            )
+            for chunk_id, tf, length in rows:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / self.avg_length)
+                scores[chunk_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+                matched_terms[chunk_id] += 1
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [(chunk_id, score, matched_terms[chunk_id]) for chunk_id, score in ranked], len(searchable) + missing_count
@@ -0,0 +1,216 @@
+"""
+Tüm LLM çağrılarının geçtiği süreç genelindeki zamanlayıcı.
+Tek Ollama sunucusu aynı anda sınırlı sayıda isteği verimli işleyebildiği için model başına eş zamanlı
+çağrı sayısı sınırlanır; sırada bekleyen çağrılar öncelik sınıfına göre (aynı sınıf içinde geliş sırasıyla)
+başlatılır. Böylece yükleme sonrası başlayan arka plan analizleri kullanıcının sorusunun önüne geçmez.
+
+Öncelik sınıfları (küçük değer önce çalışır):
+    PRIORITY_INTERACTIVE - soru-cevap
+    PRIORITY_REFINE      - kullanıcının başlattığı ikincil işler: cevap iyileştirme, özet, konsept haritası, zaman çizelgesi
+    PRIORITY_BACKGROUND  - yükleme sonrası analizler: önerilen sorular, anahtar kelimeler, derlem notları
+    PRIORITY_IDLE        - spekülatif işler (önerilen soruların önceden cevaplanması); sadece boşta çalışır ve
+                           gelen etkileşimli istekler için en az IDLE_RESERVED_SLOTS yeri boş bırakır
+
+Sıra çok uzadığında yeni istekler SchedulerBusyError ile hemen reddedilir (düşük öncelikli sınıflar daha
+erken); bir sahibin (ör. oturum veya HTTP isteği) bekleyen çağrıları cancel ile iptal edilebilir.
+"""
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+from typing import Any, Optional
+
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_REFINE = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_IDLE = 3
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_REFINE: "refine",
+    PRIORITY_BACKGROUND: "background",
+    PRIORITY_IDLE: "idle",
+}
+
+# Model başına aynı anda çalışan çağrı sayısı; Ollama sunucusunun paralellik ayarına (OLLAMA_NUM_PARALLEL) göre ayarlanabilir.
+DEFAULT_MAX_IN_FLIGHT = 2
+MAX_IN_FLIGHT_PER_MODEL = {} # model -> sınır (DEFAULT_MAX_IN_FLIGHT'tan farklıysa)
+# Boşta çalışan istekler başladıktan sonra da bu kadar yer diğer sınıflara açık kalır (sınır 1 ise uygulanmaz).
+IDLE_RESERVED_SLOTS = 1
+# Sıradaki toplam istek sayısı bu sınıra ulaşmışsa o sınıftan yeni istek kabul edilmez.
+QUEUE_DEPTH_LIMITS = {
+    PRIORITY_INTERACTIVE: 32,
+    PRIORITY_REFINE: 16,
+    PRIORITY_BACKGROUND: 8,
+    PRIORITY_IDLE: 4,
+}
+
+
+class SchedulerBusyError(RuntimeError):
+    """Model sırası dolu; istek daha sonra tekrar denenmelidir."""
+
+
+class RequestCancelledError(RuntimeError):
+    """İstek, sahibi iptal edildiği için çalıştırılmadı veya yarıda bırakıldı."""
+
+
+class _Ticket:
+    """Bir LLM çağrısının sıradaki / çalışan kaydı."""
+
+    def __init__(self, model, priority, owner):
+        self.model = model
+        self.priority = priority
+        self.owner = owner
+        self.granted = False
+        self.cancelled = False
+
+
+class LLMScheduler:
+    """Model başına eş zamanlılık sınırı, öncelikli sıra, sıra derinliği sınırı ve sahip bazında iptal."""
+
+    def __init__(self, default_max_in_flight=DEFAULT_MAX_IN_FLIGHT, max_in_flight=None, queue_limits=None):
+        self.default_max_in_flight = default_max_in_flight
+        self.max_in_flight = dict(MAX_IN_FLIGHT_PER_MODEL if max_in_flight is None else max_in_flight)
+        self.queue_limits = dict(QUEUE_DEPTH_LIMITS if queue_limits is None else queue_limits)
+        self._condition = threading.Condition()
+        self._waiting = {}   # model -> [(öncelik, sıra no, _Ticket)] (heap)
+        self._in_flight = {} # model -> set(_Ticket)
+        self._sequence = itertools.count()
+
+    def _limit(self, model):
+        return self.max_in_flight.get(model, self.default_max_in_flight)
+
+    def _check(self, model, priority):
+        in_flight = len(self._in_flight.get(model, ()))
+        waiting = len(self._waiting.get(model, ()))
+        if in_flight >= self._limit(model) and waiting >= self.queue_limits.get(priority, 0):
+            raise SchedulerBusyError(
+                f"LLM sırası dolu ({model}, {PRIORITY_NAMES.get(priority, priority)}: {waiting} istek bekliyor)"
+            )
+
+    def check(self, model, priority=PRIORITY_INTERACTIVE):
+        """Bu sınıftan yeni bir istek şu an kabul edilmeyecekse SchedulerBusyError fırlatır (ör. akış başlamadan önce)."""
+        with self._condition:
+            self._check(model, priority)
+
+    def _grant(self, model):
+        waiting = self._waiting.get(model)
+        in_flight = self._in_flight.setdefault(model, set())
+        limit = self._limit(model)
+        idle_limit = max(1, limit - IDLE_RESERVED_SLOTS)
+        while waiting and len(in_flight) < limit:
+            if waiting[0][0] >= PRIORITY_IDLE and len(in_flight) >= idle_limit:
+                break # Sırada sadece boşta çalışacak istekler var; ayrılan yerler boş kalır
+            ticket = heapq.heappop(waiting)[2]
+            ticket.granted = True
+            in_flight.add(ticket)
+        self._condition.notify_all()
+
+    def acquire(self, model, priority=PRIORITY_INTERACTIVE, owner=None):
+        """
+        Çağrı için yer açılana kadar bekler ve kaydı döndürür; iş bitince release çağrılmalıdır.
+        Sıra doluysa SchedulerBusyError, beklerken sahibi iptal edilirse RequestCancelledError fırlatır.
+        """
+        ticket = _Ticket(model, priority, owner)
+        with self._condition:
+            self._check(model, priority)
+            heapq.heappush(self._waiting.setdefault(model, []), (priority, next(self._sequence), ticket))
+            self._grant(model)
+            while not ticket.granted and not ticket.cancelled:
+                self._condition.wait()
+            if not ticket.granted:
+                raise RequestCancelledError("LLM isteği iptal edildi")
+        return ticket
+
+    def release(self, ticket):
+        with self._condition:
+            self._in_flight.get(ticket.model, set()).discard(ticket)
+            self._grant(ticket.model)
+
+    @contextmanager
+    def slot(self, model, priority=PRIORITY_INTERACTIVE, owner=None):
+        ticket = self.acquire(model, priority, owner)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def cancel(self, owner):
+        """
+        Sahibin sıradaki isteklerini iptal eder ve çalışan akışlarını bir sonraki token'da durdurur.
+        Dönüş: iptal edilen (sıradaki + çalışan) istek sayısı.
+        """
+        if owner is None:
+            return 0
+        cancelled = 0
+        with self._condition:
+            for model, waiting in self._waiting.items():
+                kept = [entry for entry in waiting if entry[2].owner != owner]
+                for _, _, ticket in waiting:
+                    if ticket.owner == owner:
+                        ticket.cancelled = True
+                        cancelled += 1
+                heapq.heapify(kept)
+                self._waiting[model] = kept
+            for in_flight in self._in_flight.values():
+                for ticket in in_flight:
+                    if ticket.owner == owner:
+                        ticket.cancelled = True
+                        cancelled += 1
+            self._condition.notify_all()
+        return cancelled
+
+    def stats(self):
+        """Model başına çalışan ve sınıf bazında sırada bekleyen istek sayıları."""
+        with self._condition:
+            return {
+                model: {
+                    "in_flight": len(self._in_flight.get(model, ())),
+                    "max_in_flight": self._limit(model),
+                    "waiting": {
+                        name: sum(1 for entry in self._waiting.get(model, ()) if entry[0] == priority)
+                        for priority, name in PRIORITY_NAMES.items()
+                    },
+                }
+                for model in set(self._waiting) | set(self._in_flight)
+            }
+
+
+scheduler = LLMScheduler()
+
+
+class ScheduledLLM(LLM):
+    """
+    Paylaşılan model istemcisini zamanlayıcı üzerinden çağıran LLM. LangChain zincirlerinde (RetrievalQA)
+    ve doğrudan invoke/stream ile diğer LLM'ler gibi kullanılır; her çağrı önce sırada yer bekler.
+    """
+
+    client: Any
+    model: str
+    priority: int = PRIORITY_INTERACTIVE
+    owner: Optional[str] = None
+
+    @property
+    def _llm_type(self):
+        return "scheduled"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        with scheduler.slot(self.model, self.priority, self.owner) as ticket:
+            response = self.client.invoke(prompt, stop=stop, **kwargs)
+        # Çağrı sürerken sahibi iptal edildiyse sonuç kullanılmaz (ör. eski belgelerin bölüm özetleri / notları)
+        if ticket.cancelled:
+            raise RequestCancelledError("LLM isteği iptal edildi")
+        return response
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        # Yer akış başlarken alınır ve akış bitene (veya tüketici bırakana) kadar tutulur.
+        with scheduler.slot(self.model, self.priority, self.owner) as ticket:
+            for token in self.client.stream(prompt, stop=stop, **kwargs):
+                if ticket.cancelled:
+                    raise RequestCancelledError("LLM isteği iptal edildi")
+                chunk = GenerationChunk(text=token)
+                if run_manager:
+                    run_manager.on_llm_new_token(token, chunk=chunk)
+                yield chunk
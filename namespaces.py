@@ -0,0 +1,317 @@
+"""
+İsim alanları (namespace): oturum, kullanıcı veya adlandırılmış koleksiyon başına ayrı belge kümeleri.
+Bir isim alanı sadece hangi belgeleri içerdiğini ve bunların hangi derlem indeksinde olduğunu tutar:
+    vectordb/namespaces/<isim>.json      {"corpus": derlem_anahtarı, "documents": {belge_kimliği: kaynak_adı}}
+    vectordb/corpora/<derlem_anahtarı>/  VectorIndexManager indeksi (manifest + nesil dosyaları)
+    data/<belge_kimliği>.pdf             yüklenen dosyalar (içerik adresli, isim alanları arasında ortak)
+Derlem indeksleri belge kümesiyle (belgelerin içerik anahtarlarıyla; dosya adları anahtara girmez) adreslenir ve
+kurulduktan sonra değişmez. Aynı belgeleri (hangi adla yüklenmiş olursa olsun) içeren isim alanları
+aynı indeksi diskte ve bellekte (resources üzerinden, referans sayımıyla) paylaşır; bir kullanıcının yüklemesi
+yeni bir derlem kurar ve sadece o isim alanının manifest'ini atomik olarak değiştirir, diğer kullanıcıların
+aramaları etkilenmez. Yeni derlem, isim alanının önceki derleminden başlatılır (nesil dosyaları hard link ile
+paylaşılır); sadece eklenen/çıkarılan belgeler işlenir, embedding ingestion önbelleğinden gelir.
+"""
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+from langchain.docstore.document import Document
+
+from embedder import MANIFEST_FILE, VectorIndexManager, index_write_lock
+from ingestion_cache import IngestionCache, make_corpus_key
+from resources import get_vectorstore, invalidate_index
+from vector_storage import storage_files
+
+NAMESPACE_DIR = "vectordb/namespaces"
+CORPUS_DIR = "vectordb/corpora"
+DOCUMENTS_DIR = "data"
+DEFAULT_NAMESPACE = "default"
+# Streamlit oturumlarının isim alanları bu önekle başlar ve bu kadar süre güncellenmezse silinir.
+SESSION_NAMESPACE_PREFIX = "session-"
+SESSION_NAMESPACE_TTL_SECONDS = 24 * 60 * 60
+# Hiçbir isim alanının göstermediği derlemler bu süreden eskiyse silinir (yeni kurulup henüz atanmamış
+# bir derlemin silinmemesi için).
+UNUSED_CORPUS_GRACE_SECONDS = 60 * 60
+GARBAGE_COLLECTION_INTERVAL_SECONDS = 10 * 60
+
+_NAME_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]{0,63}")
+_LOCK_DIR = os.path.join(NAMESPACE_DIR, ".locks")
+_gc_lock = threading.Lock()
+_last_gc = 0.0
+
+
+def validate_namespace(namespace):
+    """İsim alanı adı dosya adı olarak kullanıldığı için sadece harf, rakam, '_', '.', '-' içerebilir."""
+    if not isinstance(namespace, str) or not _NAME_PATTERN.fullmatch(namespace):
+        raise ValueError(f"Geçersiz isim alanı: {namespace!r} (harf, rakam, '_', '.', '-'; en fazla 64 karakter)")
+    return namespace
+
+
+def corpus_db_path(corpus_key):
+    return os.path.join(CORPUS_DIR, corpus_key)
+
+
+def document_file_path(document_id):
+    """Yüklenen dosyanın yolu. Dosyalar içerikleriyle adreslenir; aynı adlı farklı dosyalar birbirini ezmez."""
+    return os.path.join(DOCUMENTS_DIR, f"{document_id}.pdf")
+
+
+def save_document_file(document_id, file_bytes):
+    """Dosyayı (yoksa) atomik olarak kaydeder ve yolunu döndürür."""
+    path = document_file_path(document_id)
+    if not os.path.exists(path):
+        os.makedirs(DOCUMENTS_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(file_bytes)
+        os.replace(tmp_path, path)
+    return path
+
+
+def relabel_sources(documents, namespace_documents):
+    """
+    Derlem indeksi aynı belgeleri farklı adlarla yükleyen isim alanları arasında paylaşıldığından chunk'lardaki
+    kaynak adı derlemi ilk kuranın verdiği addır. Chunk kimliklerinden ("<belge_kimliği>:<sıra>") belgeyi bulup
+    kaynak adını isim alanındaki adla değiştirir (gerekirse kopyalayarak).
+    namespace_documents: read_namespace(...)["documents"]
+    """
+    relabeled = []
+    for doc in documents:
+        source = namespace_documents.get((doc.id or "").rsplit(":", 1)[0])
+        if source and doc.metadata.get("source") != source:
+            doc = Document(id=doc.id, page_content=doc.page_content, metadata=dict(doc.metadata, source=source))
+        relabeled.append(doc)
+    return relabeled
+
+
+def _namespace_path(namespace):
+    return os.path.join(NAMESPACE_DIR, f"{validate_namespace(namespace)}.json")
+
+
+def read_namespace(namespace):
+    """Dönüş: {"corpus": derlem_anahtarı veya None, "documents": {belge_kimliği: kaynak_adı}}"""
+    try:
+        with open(_namespace_path(namespace), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"corpus": None, "documents": {}}
+
+
+def latest_session_namespace():
+    """
+    En son güncellenen Streamlit oturumu isim alanının adı; yoksa None. Komut satırı araçlarının (batch_qa,
+    ann_index) uygulamada yüklenen belgeleri kullanabilmesi içindir.
+    """
+    if not os.path.isdir(NAMESPACE_DIR):
+        return None
+    latest, latest_mtime = None, None
+    for file_name in os.listdir(NAMESPACE_DIR):
+        if not (file_name.startswith(SESSION_NAMESPACE_PREFIX) and file_name.endswith(".json")):
+            continue
+        try:
+            mtime = os.path.getmtime(os.path.join(NAMESPACE_DIR, file_name))
+        except OSError:
+            continue
+        if latest_mtime is None or mtime > latest_mtime:
+            latest, latest_mtime = file_name[:-len(".json")], mtime
+    return latest
+
+
+def _write_namespace(namespace, manifest):
+    path = _namespace_path(namespace)
+    os.makedirs(NAMESPACE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path) # Okuyucular ya eski ya yeni derlemi görür
+
+
+class CorpusReferences:
+    """
+    Bu süreçte hangi isim alanının hangi derlemi kullandığı. Aynı derlemi kullanan isim alanları tek bir
+    vectorstore'u paylaşır; bir derlemi kullanan son isim alanı başka bir derleme geçtiğinde bellekteki
+    vectorstore ve zincirler bırakılır.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._namespaces = {} # isim alanı -> derlem anahtarı
+        self._counts = {} # derlem anahtarı -> isim alanı sayısı
+
+    def bind(self, namespace, corpus_key):
+        released = None
+        with self._lock:
+            previous = self._namespaces.get(namespace)
+            if previous == corpus_key:
+                return
+            if corpus_key is None:
+                self._namespaces.pop(namespace, None)
+            else:
+                self._namespaces[namespace] = corpus_key
+                self._counts[corpus_key] = self._counts.get(corpus_key, 0) + 1
+            if previous is not None:
+                self._counts[previous] -= 1
+                if not self._counts[previous]:
+                    del self._counts[previous]
+                    released = previous
+        if released is not None:
+            invalidate_index(corpus_db_path(released))
+
+    def count(self, corpus_key):
+        with self._lock:
+            return self._counts.get(corpus_key, 0)
+
+
+corpus_references = CorpusReferences()
+
+
+def get_namespace_index(namespace):
+    """İsim alanının güncel derlem indeksinin yolu; isim alanı boşsa None."""
+    corpus_key = read_namespace(namespace)["corpus"]
+    corpus_references.bind(namespace, corpus_key)
+    return corpus_db_path(corpus_key) if corpus_key else None
+
+
+def get_namespace_vectorstore(namespace):
+    """İsim alanının vectorstore'u (aynı derlemi kullanan isim alanlarıyla paylaşılır); boşsa None."""
+    db_path = get_namespace_index(namespace)
+    return get_vectorstore(db_path) if db_path else None
+
+
+def _link_or_copy(source, target):
+    # Nesil dosyaları yazıldıktan sonra değişmez (yeni nesil yeni dosyalara yazılır); hard link güvenlidir.
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def _seed_corpus(db_path, seed_path):
+    """Boş bir derlem dizinini başka bir derlemin güncel nesliyle başlatır."""
+    try:
+        with open(os.path.join(seed_path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        for file_name in storage_files(manifest["storage"]) if manifest.get("storage") else []:
+            _link_or_copy(os.path.join(seed_path, file_name), os.path.join(db_path, file_name))
+    except (OSError, ValueError, KeyError) as e: # Seed derlem bu arada silinmiş olabilir; sıfırdan kurulur
+        print(f"Derlem {seed_path} üzerinden başlatılamadı, sıfırdan kurulacak: {e}")
+        return
+    with open(os.path.join(db_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+
+def _build_corpus(corpus_key, documents, loaders, seed_key=None):
+    """Derlem indeksini (yoksa) kurar. Aynı derlemi aynı anda kurmak isteyen diğer isim alanları/süreçler bekler."""
+    db_path = corpus_db_path(corpus_key)
+    with index_write_lock(db_path):
+        if not os.path.exists(os.path.join(db_path, MANIFEST_FILE)) and seed_key and seed_key != corpus_key:
+            _seed_corpus(db_path, corpus_db_path(seed_key))
+        index_manager = VectorIndexManager(db_path)
+        if index_manager.indexed_document_ids() == set(documents):
+            return # Başka bir isim alanı aynı belge kümesini zaten kurmuş
+        index_manager.sync(loaders)
+        index_manager.save()
+
+
+def _cached_loaders(documents, cache):
+    return {
+        doc_id: (lambda doc_id=doc_id, source=source: (cache.load_chunks(doc_id, source), cache.load_vectors(doc_id)))
+        for doc_id, source in documents.items()
+    }
+
+
+def assign_documents(namespace, documents, loaders=None, cache=None, merge=False):
+    """
+    İsim alanının belge kümesini belirler ve gerekirse derlem indeksini kurar.
+    documents: {belge_kimliği: kaynak_adı}
+    loaders: {belge_kimliği: () -> (chunks, vectors)}; verilmeyen belgeler ingestion önbelleğinden okunur.
+    merge: True ise belgeler isim alanındaki mevcut belgelere eklenir (aynı isim alanına eş zamanlı
+    yüklemeler birbirinin belgelerini silmez).
+    Dönüş: (eklenen_kimlikler, çıkarılan_kimlikler)
+    """
+    validate_namespace(namespace)
+    with index_write_lock(os.path.join(_LOCK_DIR, namespace)):
+        previous = read_namespace(namespace)
+        if merge:
+            documents = dict(previous["documents"], **documents)
+        corpus_key = None
+        if documents:
+            corpus_key = make_corpus_key(sorted(documents))
+            all_loaders = _cached_loaders(documents, cache or IngestionCache())
+            all_loaders.update({doc_id: loader for doc_id, loader in (loaders or {}).items() if doc_id in documents})
+            _build_corpus(corpus_key, documents, all_loaders, seed_key=previous["corpus"])
+        if corpus_key != previous["corpus"] or documents != previous["documents"]:
+            _write_namespace(namespace, {"corpus": corpus_key, "documents": documents, "updated_at": time.time()})
+        else:
+            os.utime(_namespace_path(namespace)) # Oturum isim alanının süresi dolmasın
+    corpus_references.bind(namespace, corpus_key)
+    collect_garbage()
+    added = [doc_id for doc_id in documents if doc_id not in previous["documents"]]
+    removed = [doc_id for doc_id in previous["documents"] if doc_id not in documents]
+    return added, removed
+
+
+def remove_namespace(namespace):
+    with index_write_lock(os.path.join(_LOCK_DIR, validate_namespace(namespace))):
+        try:
+            os.remove(_namespace_path(namespace))
+        except FileNotFoundError:
+            pass
+    corpus_references.bind(namespace, None)
+
+
+def collect_garbage(force=False):
+    """
+    Süresi dolmuş oturum isim alanlarını ve hiçbir isim alanının göstermediği eski derlemleri siler.
+    En fazla GARBAGE_COLLECTION_INTERVAL_SECONDS'ta bir çalışır (force ile hemen).
+    """
+    global _last_gc
+    now = time.time()
+    with _gc_lock:
+        if not force and now - _last_gc < GARBAGE_COLLECTION_INTERVAL_SECONDS:
+            return
+        _last_gc = now
+    if not os.path.isdir(NAMESPACE_DIR):
+        return
+
+    referenced = set()
+    for file_name in os.listdir(NAMESPACE_DIR):
+        if not file_name.endswith(".json"):
+            continue
+        namespace = file_name[:-len(".json")]
+        path = os.path.join(NAMESPACE_DIR, file_name)
+        try:
+            if namespace.startswith(SESSION_NAMESPACE_PREFIX) and now - os.path.getmtime(path) > SESSION_NAMESPACE_TTL_SECONDS:
+                remove_namespace(namespace)
+                continue
+            corpus_key = read_namespace(namespace)["corpus"]
+        except (OSError, ValueError) as e:
+            print(f"İsim alanı okunamadı ({namespace}): {e}")
+            return # Yanlışlıkla kullanılan bir derlemi silmemek için temizlik atlanır
+        if corpus_key:
+            referenced.add(corpus_key)
+
+    if not os.path.isdir(CORPUS_DIR):
+        return
+    for corpus_key in os.listdir(CORPUS_DIR):
+        db_path = corpus_db_path(corpus_key)
+        if corpus_key in referenced or corpus_references.count(corpus_key) or _is_recent(db_path, now):
+            continue
+        with index_write_lock(db_path):
+            if _is_recent(db_path, time.time()): # Kilit beklenirken kurulmuş olabilir
+                continue
+            shutil.rmtree(db_path, ignore_errors=True) # Açık mmap'ler silinen dosyaları okumaya devam eder
+        invalidate_index(db_path)
+
+
+def _is_recent(db_path, now):
+    """Derlem (veya henüz manifest'i yazılmamış, kurulmakta olan dizin) yakın zamanda değiştiyse True."""
+    manifest_path = os.path.join(db_path, MANIFEST_FILE)
+    try:
+        modified = os.path.getmtime(manifest_path if os.path.exists(manifest_path) else db_path)
+    except OSError:
+        return False
+    return now - modified < UNUSED_CORPUS_GRACE_SECONDS
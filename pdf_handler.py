@@ -2,46 +2,375 @@ import fitz
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.docstore.document import Document
 import os
-from io import BytesIO # BytesIO'yu ekliyoruz
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-def extract_pages_from_pdf(pdf_path):
-    """PDF'ten sayfaları metin ve sayfa numarası olarak çıkarır."""
-    doc = fitz.open(pdf_path)
+from chunk_dedup import get_dedup_settings
+
+# Chunk ayarları; ingestion önbelleğinin anahtarı da bu ayarlara bağlıdır.
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 150
+
+def get_chunk_settings():
+    """Önbellek anahtarında kullanılmak üzere aktif chunk ayarlarını döndürür."""
+    return {"chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP, "splitter": "RecursiveCharacterTextSplitter",
+            "dedup": get_dedup_settings()}
+
+# Paralel çıkarma ayarları: sayfalar bu büyüklükte aralıklar halinde worker süreçlere dağıtılır.
+# Küçük PDF'lerde süreç havuzu kurmanın maliyeti kazançtan fazla olduğu için seri çıkarma kullanılır.
+EXTRACTION_PAGES_PER_TASK = 16
+PARALLEL_EXTRACTION_MIN_PAGES = 64
+
+_worker_doc = None # Her worker sürecinin kendi açık fitz belgesi
+
+def _init_extraction_worker(pdf_path):
+    global _worker_doc
+    _worker_doc = fitz.open(pdf_path)
+
+def _word_geometry(page, text):
+    """
+    Sayfadaki her kelimenin sayfa metnindeki karakter aralığını ve kutusunu kaydeder:
+    [başlangıç, bitiş, x0, y0, x1, y1, satır_kimliği]. Önizlemede vurgular bu tablodan hesaplanır,
+    render sırasında tam metin araması yapılmaz.
+    """
+    geometry = []
+    position = 0
+    for x0, y0, x1, y1, word, block_no, line_no, _ in page.get_text("words"):
+        start = text.find(word, position)
+        if start == -1:
+            continue
+        position = start + len(word)
+        geometry.append([start, position, round(x0, 1), round(y0, 1), round(x1, 1), round(y1, 1), block_no * 10000 + line_no])
+    return geometry
+
+def _page_record(page, page_num, source):
+    text = page.get_text()
+    if text.strip(): # Sadece metin içeren sayfaları ekle
+        return {"page_content": text, "metadata": {"source": source, "page": page_num + 1}, "words": _word_geometry(page, text)}
+    return None
+
+def _extract_page_range(start, end, source):
+    """Worker süreçte çalışır: [start, end) aralığındaki sayfaların metnini çıkarır."""
     pages_data = []
-    for page_num, page in enumerate(doc):
-        text = page.get_text()
-        if text.strip(): # Sadece metin içeren sayfaları ekle
-            pages_data.append({"page_content": text, "metadata": {"source": os.path.basename(pdf_path), "page": page_num + 1}})
+    for page_num in range(start, end):
+        record = _page_record(_worker_doc.load_page(page_num), page_num, source)
+        if record:
+            pages_data.append(record)
     return pages_data
 
-def chunk_pages(pages_data_list):
+def open_page_stream(pdf_path, max_workers=None, pages_per_task=EXTRACTION_PAGES_PER_TASK, max_pending_tasks=None):
+    """
+    PDF'in sayfa sayısını ve sayfaları hazır oldukça üreten bir generator döndürür: (total_pages, pages_iter).
+    Büyük PDF'lerde sayfa aralıkları bir süreç havuzuna dağıtılır (her worker belgeyi bir kez açar);
+    sayfalar yine de sıralı üretilir. Aynı anda en fazla max_pending_tasks aralık işlendiği için
+    bellek kullanımı dosya boyutuna değil bu pencereye bağlıdır.
+    """
+    doc = fitz.open(pdf_path)
+    total_pages = doc.page_count
+    source = os.path.basename(pdf_path)
+    max_workers = max_workers or os.cpu_count() or 1
+
+    if max_workers == 1 or total_pages < PARALLEL_EXTRACTION_MIN_PAGES:
+        return total_pages, _iter_pages_serial(doc, source)
+    doc.close()
+    max_pending_tasks = max_pending_tasks or max_workers * 2
+    return total_pages, _iter_pages_parallel(pdf_path, total_pages, source, max_workers, pages_per_task, max_pending_tasks)
+
+def _iter_pages_serial(doc, source):
+    try:
+        for page_num, page in enumerate(doc):
+            record = _page_record(page, page_num, source)
+            if record:
+                yield record
+    finally:
+        doc.close()
+
+def _iter_pages_parallel(pdf_path, total_pages, source, max_workers, pages_per_task, max_pending_tasks):
+    ranges = [(start, min(start + pages_per_task, total_pages)) for start in range(0, total_pages, pages_per_task)]
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_extraction_worker, initargs=(pdf_path,)) as executor:
+        pending = deque()
+        next_range = 0
+        try:
+            while pending or next_range < len(ranges):
+                # Pencereyi doldur, sonra en eski aralığın sonucunu bekle (sayfa sırası korunur)
+                while next_range < len(ranges) and len(pending) < max_pending_tasks:
+                    start, end = ranges[next_range]
+                    pending.append(executor.submit(_extract_page_range, start, end, source))
+                    next_range += 1
+                for record in pending.popleft().result():
+                    yield record
+        finally:
+            # Tüketici erken durursa bekleyen işleri iptal et
+            for future in pending:
+                future.cancel()
+
+def iter_pages_from_pdf(pdf_path, max_workers=None):
+    """PDF'ten sayfaları hazır oldukça üretir; chunk_pages'e doğrudan verilebilir."""
+    _, pages_iter = open_page_stream(pdf_path, max_workers=max_workers)
+    return pages_iter
+
+def extract_pages_from_pdf(pdf_path, max_workers=None):
+    """PDF'ten sayfaları metin ve sayfa numarası olarak çıkarır."""
+    return list(iter_pages_from_pdf(pdf_path, max_workers=max_workers))
+
+def chunk_pages(pages_data_list, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
     """
     Sayfa verilerini alır, metinleri chunk'lar ve LangChain Document nesneleri oluşturur.
-    pages_data_list: extract_pages_from_pdf'ten dönen [{page_content: str, metadata: dict}, ...] listesi.
+    pages_data_list: extract_pages_from_pdf'ten dönen [{page_content: str, metadata: dict}, ...] listesi
+    veya iter_pages_from_pdf generator'ı (sayfalar geldikçe chunk'lanır).
     """
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=150)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
     
     all_chunks = []
     for page_data in pages_data_list:
         # Sayfa metnini chunk'la
-        chunks_from_page = text_splitter.split_text(page_data["page_content"])
+        page_text = page_data["page_content"]
+        chunks_from_page = text_splitter.split_text(page_text)
         
         # Her chunk için Document nesnesi oluştur ve metadata'yı koru/güncelle
+        search_from = 0
         for chunk_content in chunks_from_page:
-            # Orijinal metadata'yı kopyala ve chunk'ın içeriğini ekle
-            # Eğer chunk'a özel bir metadata eklemek isterseniz burada yapabilirsiniz.
-            # Şimdilik sayfa bazlı metadata yeterli.
-            doc = Document(page_content=chunk_content, metadata=page_data["metadata"].copy())
+            # Orijinal metadata'yı kopyala ve chunk'ın sayfa metnindeki başlangıç konumunu ekle
+            # (önizlemede vurgulanacak kelimeler bu konumdan bulunur).
+            metadata = page_data["metadata"].copy()
+            start_index = page_text.find(chunk_content, search_from)
+            if start_index != -1:
+                metadata["start_index"] = start_index
+                search_from = start_index + 1
+            doc = Document(page_content=chunk_content, metadata=metadata)
             all_chunks.append(doc)
             
     return all_chunks
 
-def get_pdf_page_image_bytes(pdf_path, page_number, highlight_texts=None):
+def get_highlight_rects(page_words, spans):
+    """
+    Çıkarma sırasında kaydedilen kelime geometrisinden, verilen karakter aralıklarını kapsayan dikdörtgenleri
+    döndürür. Aynı satırdaki ardışık kelimeler tek dikdörtgende birleştirilir.
+    page_words: _word_geometry çıktısı. spans: [(başlangıç, bitiş), ...]
+    """
+    rects = []
+    current = None # [x0, y0, x1, y1, satır_kimliği]
+    for start, end, x0, y0, x1, y1, line_id in page_words:
+        if not any(start < span_end and end > span_start for span_start, span_end in spans):
+            if current:
+                rects.append(tuple(current[:4]))
+                current = None
+            continue
+        if current and current[4] == line_id:
+            current[0], current[1] = min(current[0], x0), min(current[1], y0)
+            current[2], current[3] = max(current[2], x1), max(current[3], y1)
+        else:
+            if current:
+                rects.append(tuple(current[:4]))
+            current = [x0, y0, x1, y1, line_id]
+    if current:
+        rects.append(tuple(current[:4]))
+    return rects
+
+
+RENDER_CACHE_DIR = os.path.join("cache", "renders")
+RENDER_CACHE_MAX_BYTES = 64 * 1024 * 1024 # Bellekte tutulacak PNG'lerin toplam boyutu
+# Diskteki PNG'lerin toplam boyutu ve en uzun ömrü; aşılınca en uzun süredir kullanılmayanlar silinir.
+RENDER_DISK_MAX_BYTES = 512 * 1024 * 1024
+RENDER_DISK_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+# Yazımı süren geçici dosyalara dokunulmaz; bu süreden eski olanlar çöken bir yazardan kalmıştır ve silinir.
+RENDER_TMP_GRACE_SECONDS = 60 * 60
+
+class PageRenderCache:
+    """
+    Render edilmiş sayfa PNG'leri için bellek (LRU, boyut sınırlı) + disk önbelleği.
+    Anahtar (dosya hash'i/önbellek anahtarı, sayfa, zoom, vurgu kümesi) şeklindedir; aynı sayfa Streamlit'in her
+    yeniden çalıştırmasında tekrar rasterize edilmez.
+    Vurgulu görüntüler her alıntıya özgü olduğundan sadece bellekte tutulur; diske vurgusuz sayfalar yazılır.
+    Disk önbelleği de boyut (disk_max_bytes) ve yaş (disk_max_age_seconds) ile sınırlıdır; okunan dosyanın
+    değiştirilme zamanı güncellenir, böylece silme en uzun süredir kullanılmayandan başlar.
+    """
+
+    def __init__(self, cache_dir=RENDER_CACHE_DIR, max_bytes=RENDER_CACHE_MAX_BYTES,
+                 disk_max_bytes=RENDER_DISK_MAX_BYTES, disk_max_age_seconds=RENDER_DISK_MAX_AGE_SECONDS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_max_age_seconds = disk_max_age_seconds
+        self._items = OrderedDict()
+        self._size = 0
+        self._disk_size = None # İlk yazmada diskten hesaplanır; sonra yazılanlarla artırılır
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+
+    @staticmethod
+    def _on_disk(key):
+        return key[3] == "none"
+
+    def _path(self, key):
+        doc_key, page_number, zoom, highlight_key = key
+        return os.path.join(self.cache_dir, doc_key, f"{page_number}_{zoom}_{highlight_key}.png")
+
+    def contains(self, key):
+        with self._lock:
+            if key in self._items:
+                return True
+        return self._on_disk(key) and os.path.exists(self._path(key))
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                return data
+        if not self._on_disk(key):
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        self._remember(key, data)
+        return data
+
+    def put(self, key, data):
+        if self._on_disk(key):
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp" # Aynı sayfayı yazan diğer thread/süreçlerle çakışmaz
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                self._account_disk(len(data))
+            except OSError as e:
+                print(f"Sayfa görüntüsü diske yazılamadı ({path}): {e}")
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+        self._remember(key, data)
+
+    def _account_disk(self, added_bytes):
+        with self._disk_lock:
+            if self._disk_size is None:
+                self._disk_size = self.prune_disk()
+            else:
+                self._disk_size += added_bytes
+                if self._disk_size > self.disk_max_bytes:
+                    self._disk_size = self.prune_disk()
+
+    def prune_disk(self):
+        """
+        Süresi dolmuş PNG'leri, ardından toplam boyut sınırın %90'ına inene kadar en uzun süredir kullanılmayanları siler.
+        Diğer süreçlerin yazdıkları da hesaba katılır; yazımı süren .tmp dosyaları atlanır.
+        Dönüş: kalan toplam boyut.
+        """
+        files = []
+        now = time.time()
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                    if name.endswith(".tmp"):
+                        if now - stat.st_mtime > RENDER_TMP_GRACE_SECONDS:
+                            os.remove(path)
+                        continue
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        files.sort() # en eski önce
+        for mtime, size, path in files:
+            if now - mtime <= self.disk_max_age_seconds and total <= self.disk_max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        return total
+
+    def _remember(self, key, data):
+        with self._lock:
+            if key in self._items:
+                self._size -= len(self._items.pop(key))
+            self._items[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+page_render_cache = PageRenderCache()
+
+# Önizleme çözünürlük kademeleri: önce küçük önizleme, istenirse tam çözünürlük.
+THUMBNAIL_ZOOM = 0.6
+FULL_ZOOM = 2.0
+# MuPDF aynı anda birden fazla thread'den kullanılmayı desteklemez; tüm render işlemleri bu kilitle sıralanır.
+# Bu yüzden arka plan havuzunda da tek worker yeterlidir, asıl kazanç işin kullanıcı istemeden önce yapılmasıdır.
+PRERENDER_WORKERS = 1
+_fitz_render_lock = threading.Lock()
+
+class PagePrerenderer:
+    """
+    Sayfaları arka planda render edip render önbelleğine yazar (komşu sayfalar, cevapta kaynak gösterilen sayfalar).
+    Aynı sayfa için bekleyen ikinci bir iş oluşturulmaz; önbellekte olan sayfalar atlanır.
+    """
+
+    def __init__(self, max_workers=PRERENDER_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pdf-prerender")
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def schedule(self, pdf_path, cache_key, page_number, zoom=THUMBNAIL_ZOOM, highlight_rects=None, highlight_texts=None):
+        """page_number 0'dan başlar. İş kuyruğa alındıysa True döner."""
+        render_key = make_render_key(cache_key, page_number, zoom, highlight_rects, highlight_texts)
+        with self._lock:
+            if render_key in self._pending or page_render_cache.contains(render_key):
+                return False
+            self._pending.add(render_key)
+        self._executor.submit(self._render, render_key, pdf_path, cache_key, page_number, zoom, highlight_rects, highlight_texts)
+        return True
+
+    def _render(self, render_key, pdf_path, cache_key, page_number, zoom, highlight_rects, highlight_texts):
+        try:
+            get_pdf_page_image_bytes(pdf_path, page_number, highlight_texts=highlight_texts,
+                                     highlight_rects=highlight_rects, zoom=zoom, cache_key=cache_key)
+        finally:
+            with self._lock:
+                self._pending.discard(render_key)
+
+page_prerenderer = PagePrerenderer()
+
+def make_render_key(doc_key, page_number, zoom=1.0, highlight_rects=None, highlight_texts=None):
+    """Render önbelleği anahtarı; vurgu kümesi sıradan bağımsız bir hash ile temsil edilir."""
+    highlight_material = repr((sorted(highlight_rects or []), sorted(highlight_texts or [])))
+    highlight_key = hashlib.sha256(highlight_material.encode("utf-8")).hexdigest()[:16] if (highlight_rects or highlight_texts) else "none"
+    return (doc_key, page_number, zoom, highlight_key)
+
+def get_pdf_page_image_bytes(pdf_path, page_number, highlight_texts=None, highlight_rects=None, zoom=1.0, cache_key=None):
     """
     Verilen PDF dosyasının belirtilen sayfasının PNG görüntüsünü byte olarak döndürür.
     Sayfa numaraları 0'dan başlar (fitz için).
-    highlight_texts: Vurgulanacak metinlerin listesi. Örn: ["metin1", "metin2"]
+    highlight_texts: Vurgulanacak metinlerin listesi. Örn: ["metin1", "metin2"] (sayfada metin araması yapılır)
+    highlight_rects: Vurgulanacak dikdörtgenler (get_highlight_rects çıktısı); verilirse metin araması yapılmaz.
+    zoom: Render ölçeği (1.0 = 72 DPI).
+    cache_key: Dosyanın içerik hash'i veya önbellek anahtarı; verilirse sonuç render önbelleğinde saklanır.
     """
+    render_key = make_render_key(cache_key, page_number, zoom, highlight_rects, highlight_texts) if cache_key else None
+    if render_key:
+        cached = page_render_cache.get(render_key)
+        if cached is not None:
+            return cached
+
+    with _fitz_render_lock:
+        image_data = _render_page_png(pdf_path, page_number, highlight_texts, highlight_rects, zoom)
+    if render_key and image_data is not None:
+        page_render_cache.put(render_key, image_data)
+    return image_data
+
+def _render_page_png(pdf_path, page_number, highlight_texts, highlight_rects, zoom):
     doc = None # doc değişkenini try bloğundan önce tanımla
     try:
         doc = fitz.open(pdf_path)
@@ -50,15 +379,16 @@ def get_pdf_page_image_bytes(pdf_path, page_number, highlight_texts=None):
             return None
 
         page = doc.load_page(page_number)
-        
-        if highlight_texts:
+
+        if highlight_rects:
+            for rect in highlight_rects:
+                page.add_highlight_annot(fitz.Rect(rect))
+        elif highlight_texts:
             for text_to_highlight in highlight_texts:
                 # search_for metodu, metnin geçtiği yerlerin koordinatlarını (Rect listesi) döndürür.
                 # Her bir Rect için bir highlight annotasyonu ekleyebiliriz.
-                # Not: Çok uzun veya çok sık geçen metinler için performans etkilenebilir.
-                # Daha hassas eşleştirme için text_splitter'ın chunk'larını doğrudan kullanmak ve
-                # bu chunk'ların orijinal PDF'teki yerlerini daha kesin belirlemek gerekebilir.
-                # Şimdilik basit metin araması yapıyoruz.
+                # Not: Çok uzun veya çok sık geçen metinler için performans etkilenebilir; kelime geometrisi
+                # kaydedilmiş belgelerde highlight_rects kullanılmalıdır.
                 try:
                     # quads=True daha kesin sonuçlar verebilir ama daha yavaş olabilir.
                     # text_instances = page.search_for(text_to_highlight, hit_max=10) # Çok fazla eşleşmeyi önlemek için hit_max
@@ -73,21 +403,13 @@ def get_pdf_page_image_bytes(pdf_path, page_number, highlight_texts=None):
                     print(f"Metin aranırken hata '{text_to_highlight}': {search_error}")
 
 
-        pix = page.get_pixmap()
-        img_bytes = BytesIO()
-        pix.save(img_bytes, "png")
-        img_bytes.seek(0)
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+        image_data = pix.tobytes("png")
         doc.close()
-        return img_bytes.getvalue()
+        return image_data
         
     except Exception as e:
         print(f"Sayfa görüntüsü ({pdf_path}, sayfa {page_number}) alınırken hata: {e}")
         if doc:
             doc.close()
         return None
-    except Exception as e:
-        print(f"Sayfa görüntüsü alınırken hata: {e}")
-        if 'doc' in locals() and doc:
-            doc.close()
-        return None
-    # finally bloğu kaldırıldı çünkü doc.close() artık try/except içinde yönetiliyor.
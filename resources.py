@@ -0,0 +1,121 @@
+"""
+Uzun ömürlü nesnelerin (LLM istemcileri, vectorstore'lar, prompt'lar ve cevap önbelleği) süreç genelindeki kaydı.
+Streamlit betiği her etkileşimde yeniden çalışsa da bu nesneler oturumlar arasında paylaşılır;
+soru başına maliyet sadece retrieval ve cevap üretiminden oluşur. Embedding istemcisi embedder.get_embeddings
+tarafından aynı şekilde paylaşılır.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import httpx
+from langchain_ollama import OllamaLLM
+
+from answer_cache import AnswerCache
+from embedder import MANIFEST_FILE, get_embeddings, load_vectorstore
+from llm_scheduler import PRIORITY_INTERACTIVE, ScheduledLLM
+from prompts import get_prompt_template
+
+LLM_MODEL = "qwen2.5:latest"
+# Aynı model istemcisi tüm oturumlarca paylaşıldığı için bağlantı havuzu eş zamanlı istek sayısına göre ayarlanır.
+HTTP_POOL_LIMITS = httpx.Limits(max_connections=16, max_keepalive_connections=8)
+# Benzer (farklı ifade edilmiş) soruların önbellekten cevaplanması. Eşik bu embedding modeli için yanlış isabetlere
+# karşı ölçülmediğinden varsayılan olarak kapalıdır; kapalıyken sadece normalize edilmiş tam eşleşme kullanılır.
+ANSWER_CACHE_SEMANTIC_MATCH = False
+# Bellekte açık tutulan en fazla indeks (isim alanları farklı derlemler kullanabilir); en uzun süre kullanılmayan düşer.
+MAX_CACHED_VECTORSTORES = 16
+
+# Streamlit her oturumu ve her yeniden çalıştırmayı ayrı thread'lerde yürütür; önbelleklere erişim kilitle korunur.
+_lock = threading.RLock()
+_llms = {}          # model -> OllamaLLM
+_scheduled_llms = {} # (model, priority) -> ScheduledLLM
+_vectorstores = OrderedDict() # db_path -> (index_signature, FAISS), en son kullanılan sonda
+_prompts = {}       # (role, language_code) -> PromptTemplate
+_answer_cache = None
+
+
+def get_llm(model=LLM_MODEL, priority=PRIORITY_INTERACTIVE, owner=None):
+    """
+    Model başına tek bir OllamaLLM üzerinden çalışan, zamanlayıcıya bağlı LLM döndürür (bkz. llm_scheduler).
+    İstemci içindeki HTTP bağlantı havuzu böylece tüm çağrılar arasında yeniden kullanılır.
+    priority: Çağrının öncelik sınıfı. owner: Verilirse çağrılar llm_scheduler.scheduler.cancel(owner) ile iptal edilebilir.
+    """
+    with _lock:
+        client = _llms.get(model)
+        if client is None:
+            client = OllamaLLM(model=model, client_kwargs={"limits": HTTP_POOL_LIMITS})
+            _llms[model] = client
+        if owner is not None:
+            return ScheduledLLM(client=client, model=model, priority=priority, owner=owner)
+        llm = _scheduled_llms.get((model, priority))
+        if llm is None:
+            llm = ScheduledLLM(client=client, model=model, priority=priority)
+            _scheduled_llms[(model, priority)] = llm
+        return llm
+
+
+def get_index_signature(db_path="vectordb/db.faiss"):
+    """
+    İndeksin diskteki sürümünü temsil eden ucuz bir imza (manifest dosyasının değişiklik zamanı ve boyutu).
+    VectorIndexManager.save her değişiklikte manifest'i yeniden yazdığı için imza indeksle birlikte değişir.
+    """
+    try:
+        stat = os.stat(os.path.join(db_path, MANIFEST_FILE))
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _get_vectorstore_with_signature(db_path):
+    signature = get_index_signature(db_path)
+    if signature is None:
+        return None, None
+    with _lock:
+        cached = _vectorstores.get(db_path)
+        if cached is not None and cached[0] == signature:
+            _vectorstores.move_to_end(db_path)
+            return cached
+        vectorstore = load_vectorstore(db_path)
+        _vectorstores[db_path] = (signature, vectorstore)
+        _vectorstores.move_to_end(db_path)
+        while len(_vectorstores) > MAX_CACHED_VECTORSTORES:
+            _vectorstores.popitem(last=False)
+        return signature, vectorstore
+
+
+def get_vectorstore(db_path="vectordb/db.faiss"):
+    """
+    İndeks başına bellekte tek bir vectorstore tutar; diskten sadece indeks değiştiğinde yeniden açılır.
+    Vektörler mmap ile açıldığından aynı indeksi kullanan süreçler de bellekteki tek kopyayı paylaşır.
+    İndeks yoksa veya boşsa None döner.
+    """
+    return _get_vectorstore_with_signature(db_path)[1]
+
+
+def get_prompt(role, language_code="tr"):
+    """(rol, dil) başına bir kez oluşturulan prompt şablonu."""
+    key = (role, language_code)
+    with _lock:
+        prompt = _prompts.get(key)
+        if prompt is None:
+            prompt = get_prompt_template(role, language_code)
+            _prompts[key] = prompt
+        return prompt
+
+
+def invalidate_index(db_path="vectordb/db.faiss"):
+    """Bir indeksin bellekteki vectorstore'unu düşürür (ör. indeks dışarıdan silindiyse)."""
+    with _lock:
+        _vectorstores.pop(db_path, None)
+
+
+def get_answer_cache():
+    """
+    Tüm oturumların paylaştığı cevap önbelleği. ANSWER_CACHE_SEMANTIC_MATCH açıksa benzer soru araması için
+    embedding servisini kullanır.
+    """
+    global _answer_cache
+    with _lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache(embeddings=get_embeddings() if ANSWER_CACHE_SEMANTIC_MATCH else None)
+        return _answer_cache
@@ -0,0 +1,103 @@
+"""
+Önerilen soruların önceden (spekülatif) cevaplanması. İsteğe bağlıdır; açıkken örnek sorular üretilir üretilmez
+cevapları LLM zamanlayıcısında boşta (PRIORITY_IDLE) hesaplanır ve kaynaklarıyla birlikte bellekte saklanır.
+Kullanıcı bir öneriye tıkladığında cevap beklemeden gösterilir ve normal cevap önbelleğine taşınır.
+Tıklanmayan cevaplar girdi sınırı (en eski önce) ve TTL ile atılır; böylece spekülatif cevaplar, gerçekten
+sorulmuş soruların cevaplarını önbellekten çıkarmaz.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from answer_cache import normalize_question
+from background_jobs import JobRegistry
+from chatbot import answer_from_context, retrieve_contexts
+from llm_scheduler import PRIORITY_IDLE, RequestCancelledError
+
+SPECULATIVE_MAX_ANSWERS = 32
+SPECULATIVE_TTL_SECONDS = 30 * 60
+# Önceden cevaplama işleri sırayla çalışır; arka plan analiz işlerinin thread'lerini meşgul etmez.
+SPECULATIVE_WORKERS = 1
+
+
+class SpeculativeAnswers:
+    """
+    (indeks sürümü, rol, dil, normalize edilmiş soru) anahtarlı, boyut ve süre sınırlı önceden hesaplanmış cevaplar.
+    take ile alınan cevap depodan çıkar; stats tıklanma oranını izlemek içindir.
+    """
+
+    def __init__(self, max_entries=SPECULATIVE_MAX_ANSWERS, ttl_seconds=SPECULATIVE_TTL_SECONDS, max_workers=SPECULATIVE_WORKERS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict() # anahtar -> {"question", "answer", "sources", "created_at"}
+        self._lock = threading.Lock()
+        self._jobs = JobRegistry(max_workers=max_workers)
+        self.stats = {"generated": 0, "used": 0, "discarded": 0}
+
+    @staticmethod
+    def _make_key(index_version, role, language_code, question):
+        return (index_version, role, language_code, normalize_question(question))
+
+    def _evict(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry["created_at"] > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+        discarded = len(expired)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            discarded += 1
+        self.stats["discarded"] += discarded
+
+    def put(self, index_version, role, language_code, question, answer, sources):
+        key = self._make_key(index_version, role, language_code, question)
+        with self._lock:
+            self._entries[key] = {"question": question, "answer": answer, "sources": list(sources), "created_at": time.time()}
+            self._entries.move_to_end(key)
+            self.stats["generated"] += 1
+            self._evict(time.time())
+
+    def take(self, index_version, role, language_code, question):
+        """Önceden hesaplanmış cevabı {"question", "answer", "sources"} olarak döndürüp depodan çıkarır; yoksa None."""
+        key = self._make_key(index_version, role, language_code, question)
+        with self._lock:
+            self._evict(time.time())
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.stats["used"] += 1
+            return entry
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def _answer_questions(self, vectorstore, index_version, questions, role, language_code, owner):
+        # Retrieval tüm sorular için tek seferde yapılır; cevaplar sırayla boşta üretilir.
+        for question, (source_documents, _) in zip(questions, retrieve_contexts(vectorstore, questions)):
+            # Hata olursa (sıra dolu, model hatası) cevap saklanmaz; soru tıklanınca normal yoldan cevaplanır.
+            try:
+                answer = answer_from_context(source_documents, question, role, language_code, priority=PRIORITY_IDLE, owner=owner)
+            except RequestCancelledError:
+                return
+            except Exception as e:
+                print(f"Önerilen soru önceden cevaplanamadı: {e}")
+                continue
+            if answer:
+                self.put(index_version, role, language_code, question, answer, source_documents)
+
+    def schedule(self, vectorstore, index_version, questions, role, language_code="tr", waiter=None):
+        """
+        Henüz cevabı olmayan soruları boşta cevaplamak üzere tek bir arka plan işine ekler.
+        waiter: İşi isteyen oturum; aynı soruları isteyen oturumlar işi paylaşır (bkz. detach).
+        """
+        pending = [question for question in questions if self._make_key(index_version, role, language_code, question) not in self]
+        if not pending:
+            return
+        job_key = ("speculative", index_version, role, language_code) + tuple(normalize_question(question) for question in pending)
+        self._jobs.submit(job_key, self._answer_questions, vectorstore, index_version, pending, role, language_code, waiter=waiter)
+
+    def detach(self, waiter):
+        """Oturumun beklediği önceden cevaplama işlerinden ayrılır; başka bekleyeni olmayanlar iptal edilir."""
+        return self._jobs.detach(waiter)
+
+
+speculative_answers = SpeculativeAnswers()
@@ -0,0 +1,93 @@
+import faiss
+import numpy as np
+import pytest
+
+from ann_index import (
+    ANN_MIN_VECTORS,
+    PQ_MIN_TRAIN_VECTORS,
+    PQ_MIN_VECTORS,
+    build_ann_index,
+    choose_index_type,
+    measure_recall,
+    with_rescoring,
+)
+
+DIMENSION = 16
+
+
+def make_exact_index(num_vectors, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((num_vectors, DIMENSION)).astype("float32")
+    index = faiss.IndexFlatL2(DIMENSION)
+    index.add(vectors)
+    return index
+
+
+def make_low_rank_index(num_vectors, rank=6, seed=0):
+    # Embedding'ler gibi az sayıda yönde yoğunlaşan vektörler; PCA bunları az kayıpla sıkıştırabilir.
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((num_vectors, rank)) @ rng.standard_normal((rank, DIMENSION))
+    vectors += 0.05 * rng.standard_normal((num_vectors, DIMENSION))
+    index = faiss.IndexFlatL2(DIMENSION)
+    index.add(vectors.astype("float32"))
+    return index
+
+
+def test_reused_template_reports_its_own_layout():
+    _, template, info = build_ann_index(make_exact_index(3000), "ivf")
+    assert info["description"] == "IVF76,Flat"
+
+    # 3100 vektör için yeni eğitim IVF79 olurdu; şablon yeniden kullanıldığından IVF76 kalır.
+    trained = {"family": info["family"], "trained_on": info["trained_on"], "index": template}
+    index, _, reused_info = build_ann_index(make_exact_index(3100, seed=1), "ivf", trained)
+    assert reused_info["trained_on"] == 3000
+    assert reused_info["description"] == "IVF76,Flat"
+    assert faiss.extract_index_ivf(index).nlist == 76
+
+
+@pytest.mark.parametrize("num_vectors, index_type, expected", [
+    (ANN_MIN_VECTORS - 1, "auto", "flat"),
+    (ANN_MIN_VECTORS, "auto", "ivf"),
+    (PQ_MIN_VECTORS - 1, "auto", "ivf"),
+    (PQ_MIN_VECTORS, "auto", "ivfpq"),
+    (PQ_MIN_TRAIN_VECTORS - 1, "ivfpq", "ivf"), # PQ eğitimi için yetersiz
+    (PQ_MIN_TRAIN_VECTORS, "ivfpq", "ivfpq"),
+    (10, "hnsw", "hnsw"),
+])
+def test_choose_index_type_at_thresholds(num_vectors, index_type, expected):
+    assert choose_index_type(num_vectors, index_type) == expected
+
+
+def test_choose_index_type_rejects_unknown_type():
+    with pytest.raises(ValueError):
+        choose_index_type(10, "lsh")
+
+
+@pytest.mark.parametrize("index_type, floor", [("ivf", 0.8), ("hnsw", 0.95)])
+def test_ann_recall_against_flat_index(index_type, floor):
+    exact_index = make_exact_index(5000)
+    index, _, info = build_ann_index(exact_index, index_type)
+    assert info["type"] == index_type and not info["rescore"]
+    assert info["recall"]["recall"] >= floor
+    assert measure_recall(exact_index, index)["recall"] == info["recall"]["recall"]
+
+
+def test_auto_keeps_small_corpus_on_exact_search():
+    index, template, info = build_ann_index(make_exact_index(100), "auto")
+    assert index is None and template is None
+    assert info["type"] == "flat"
+
+
+@pytest.mark.parametrize("index_type, compression, pca_dim, description", [
+    ("flat", "float16", None, "SQfp16"),
+    ("flat", "int8", None, "SQ8"),
+    ("flat", "int8", 8, "PCA8,SQ8"),
+    ("ivf", "int8", 8, "PCA8,IVF76,SQ8"),
+])
+def test_rescored_recall_of_compressed_index(index_type, compression, pca_dim, description):
+    exact_index = make_low_rank_index(3000)
+    index, _, info = build_ann_index(exact_index, index_type, compression=compression, pca_dim=pca_dim)
+    assert info["description"] == description and info["rescore"]
+    assert info["nbytes"] < info["exact_nbytes"]
+    rescored = measure_recall(exact_index, with_rescoring(index, exact_index))["recall"]
+    assert rescored >= 0.98
+    assert rescored >= measure_recall(exact_index, index)["recall"]
@@ -0,0 +1,116 @@
+import numpy as np
+
+from answer_cache import AnswerCache
+from chatbot import _stream_llm
+from llm_scheduler import SchedulerBusyError
+
+INDEX = ("vectordb", "sig-1")
+ROLE = "Genel Asistan"
+
+
+class FakeEmbeddings:
+    """Normalize edilmiş soruyu sabit bir vektöre eşler; tanımsız sorular için sıfırdan farklı rastgele vektör."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        if text in self.vectors:
+            return self.vectors[text]
+        return np.random.default_rng(abs(hash(text)) % 2**32).normal(size=4).tolist()
+
+
+class FailingLLM:
+    def __init__(self, tokens, error):
+        self.tokens = tokens
+        self.error = error
+
+    def stream(self, prompt_text):
+        yield from self.tokens
+        raise self.error
+
+
+def test_exact_match_ignores_case_and_punctuation():
+    cache = AnswerCache()
+    cache.put(INDEX, ROLE, "tr", "Sözleşme ne zaman bitiyor?", "31 Aralık", ["kaynak"])
+    hit = cache.get(INDEX, ROLE, "tr", "  sözleşme NE zaman bitiyor ")
+    assert hit["answer"] == "31 Aralık"
+    assert hit["match"] == "exact"
+    assert cache.get(INDEX, ROLE, "en", "Sözleşme ne zaman bitiyor?") is None
+    assert cache.get(("vectordb", "sig-2"), ROLE, "tr", "Sözleşme ne zaman bitiyor?") is None
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("answer_cache.time.time", lambda: now[0])
+    cache = AnswerCache(ttl_seconds=60)
+    cache.put(INDEX, ROLE, "tr", "soru", "cevap", [])
+    now[0] += 59
+    assert cache.get(INDEX, ROLE, "tr", "soru") is not None
+    now[0] += 2
+    assert cache.get(INDEX, ROLE, "tr", "soru") is None
+    assert len(cache) == 0
+
+
+def test_lru_eviction_keeps_recently_used():
+    cache = AnswerCache(max_entries=2)
+    cache.put(INDEX, ROLE, "tr", "bir", "1", [])
+    cache.put(INDEX, ROLE, "tr", "iki", "2", [])
+    cache.get(INDEX, ROLE, "tr", "bir")
+    cache.put(INDEX, ROLE, "tr", "üç", "3", [])
+    assert cache.get(INDEX, ROLE, "tr", "iki") is None
+    assert cache.get(INDEX, ROLE, "tr", "bir")["answer"] == "1"
+
+
+def test_without_embeddings_paraphrases_miss():
+    cache = AnswerCache(embeddings=None)
+    cache.put(INDEX, ROLE, "tr", "sözleşme ne zaman bitiyor", "31 Aralık", [])
+    assert cache.get(INDEX, ROLE, "tr", "sözleşmenin bitiş tarihi nedir") is None
+
+
+def test_semantic_hit_only_above_threshold():
+    embeddings = FakeEmbeddings({
+        "sözleşme ne zaman bitiyor": [1.0, 0.0, 0.0, 0.0],
+        "sözleşmenin bitiş tarihi nedir": [0.99, 0.1, 0.0, 0.0],
+        # Aynı belge hakkında farklı bir soru: yakın ama eşiğin altında
+        "sözleşmenin tarafları kimler": [0.9, 0.43, 0.0, 0.0],
+    })
+    cache = AnswerCache(embeddings=embeddings, similarity_threshold=0.95)
+    cache.put(INDEX, ROLE, "tr", "Sözleşme ne zaman bitiyor?", "31 Aralık", [])
+
+    hit = cache.get(INDEX, ROLE, "tr", "Sözleşmenin bitiş tarihi nedir?")
+    assert hit["match"] == "semantic" and hit["answer"] == "31 Aralık"
+    assert cache.get(INDEX, ROLE, "tr", "Sözleşmenin tarafları kimler?") is None
+    # Başka rol için saklanan cevap benzerlik aramasında da kullanılmaz
+    assert cache.get(INDEX, "Avukat", "tr", "Sözleşmenin bitiş tarihi nedir?") is None
+    assert cache.stats["semantic_hits"] == 1
+
+
+def test_stream_status_reports_model_error():
+    status = {}
+    tokens = list(_stream_llm(FailingLLM(["Kısmi ", "cevap"], RuntimeError("bağlantı koptu")), "prompt", "HATA", "test", status))
+    assert tokens == ["Kısmi ", "cevap", "HATA"]
+    assert status["completed"] is False
+    assert isinstance(status["error"], RuntimeError)
+
+
+def test_stream_status_reports_scheduler_rejection():
+    status = {}
+    assert list(_stream_llm(FailingLLM([], SchedulerBusyError("dolu")), "prompt", "HATA", "test", status)) == ["HATA"]
+    assert status["completed"] is False
+    assert isinstance(status["error"], SchedulerBusyError)
+
+
+def test_stream_status_completed_only_after_full_stream():
+    class OkLLM:
+        def stream(self, prompt_text):
+            yield from ["a", "b"]
+
+    status = {}
+    stream = _stream_llm(OkLLM(), "prompt", "HATA", "test", status)
+    next(stream)
+    assert status["completed"] is False # Yarıda bırakılan akış eksiksiz sayılmaz
+    list(stream)
+    assert status["completed"] is True
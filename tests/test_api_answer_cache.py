@@ -0,0 +1,70 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain.docstore.document import Document
+
+import api
+from answer_cache import AnswerCache
+from llm_scheduler import SchedulerBusyError
+
+SOURCES = [Document(page_content="kaynak", metadata={"source": "a.pdf", "page": 0})]
+
+
+@pytest.fixture
+def answer_cache(monkeypatch):
+    cache = AnswerCache()
+    monkeypatch.setattr(api, "get_answer_cache", lambda: cache)
+    monkeypatch.setattr(api, "get_namespace_index", lambda namespace: "index")
+    monkeypatch.setattr(api, "read_namespace", lambda namespace: {"corpus": "corpus", "documents": {}})
+    monkeypatch.setattr(api, "get_vectorstore", lambda index_path: object())
+    monkeypatch.setattr(api, "get_index_signature", lambda index_path: "v1")
+    return cache
+
+
+def fake_stream_answer(tokens, error=None):
+    def stream_answer(vectorstore, question, role, language_code, context_report=None, owner=None, status=None):
+        def generate():
+            status["completed"] = False
+            yield from tokens
+            if error is not None:
+                status["error"] = error
+                yield "Cevap üretilirken bir hata oluştu."
+                return
+            status["completed"] = True
+        return SOURCES, generate()
+    return stream_answer
+
+
+def ask(stream=False):
+    client = TestClient(api.app) # lifespan (model ısıtma) çalıştırılmaz
+    return client.post("/ask", json={"question": "Süre ne kadar?", "role": "Avukat", "stream": stream})
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_completed_answer_is_cached(monkeypatch, answer_cache, stream):
+    monkeypatch.setattr(api, "stream_answer", fake_stream_answer(["İki ", "yıl."]))
+    assert ask(stream).status_code == 200
+    assert answer_cache.get(("index", "v1"), "Avukat", "tr", "Süre ne kadar?")["answer"] == "İki yıl."
+
+
+@pytest.mark.parametrize("stream, status_code", [(False, 500), (True, 200)])
+def test_failed_answer_is_not_cached(monkeypatch, answer_cache, stream, status_code):
+    monkeypatch.setattr(api, "stream_answer", fake_stream_answer(["İki "], error=RuntimeError("bağlantı koptu")))
+    response = ask(stream)
+    assert response.status_code == status_code # Akışta başlık zaten gönderildiği için hata metni akışın sonunda gelir
+    assert answer_cache.get(("index", "v1"), "Avukat", "tr", "Süre ne kadar?") is None
+
+
+def test_busy_scheduler_returns_503_and_is_not_cached(monkeypatch, answer_cache):
+    monkeypatch.setattr(api, "stream_answer", fake_stream_answer([], error=SchedulerBusyError("qwen")))
+    response = ask()
+    assert response.status_code == 503
+    assert answer_cache.get(("index", "v1"), "Avukat", "tr", "Süre ne kadar?") is None
+
+
+def test_streamed_cached_answer_is_replayed(monkeypatch, answer_cache):
+    answer_cache.put(("index", "v1"), "Avukat", "tr", "Süre ne kadar?", "İki yıl.", SOURCES)
+    lines = [json.loads(line) for line in ask(stream=True).text.splitlines()]
+    assert lines[0]["from_cache"] is True
+    assert lines[1] == {"token": "İki yıl."}
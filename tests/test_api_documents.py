@@ -0,0 +1,49 @@
+import pytest
+from fastapi.testclient import TestClient
+from langchain.docstore.document import Document
+
+import api
+from llm_scheduler import SchedulerBusyError
+
+CHUNKS = [Document(page_content="kira sözleşmesi", metadata={"source": "a.pdf", "page": 1})]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(api, "_load_document_chunks", lambda namespace, document_ids: (["doc1"], CHUNKS))
+    return TestClient(api.app) # lifespan (model ısıtma) çalıştırılmaz
+
+
+def fake_summarize(error=None):
+    def summarize_documents(chunks, role, language_code="tr", stream=False, owner=None, status=None):
+        if error is not None:
+            status.update(completed=False, error=error)
+            return "Belge özeti üretilirken bir sorun oluştu."
+        status["completed"] = True
+        return "özet"
+    return summarize_documents
+
+
+@pytest.mark.parametrize("error, status_code", [(None, 200), (SchedulerBusyError("qwen"), 503), (RuntimeError("model"), 500)])
+def test_summary_failures_are_not_returned_as_success(monkeypatch, client, error, status_code):
+    monkeypatch.setattr(api, "summarize_documents", fake_summarize(error))
+    response = client.post("/summarize", json={"role": "Avukat"})
+    assert response.status_code == status_code
+    if error is None:
+        assert response.json() == {"summary": "özet"}
+
+
+def test_keyword_cache_depends_on_keyword_count(monkeypatch, client, tmp_path):
+    monkeypatch.setattr(api.ingestion_cache, "cache_dir", str(tmp_path))
+    calls = []
+
+    def extract(chunks, role, language_code, num_keywords, priority=None):
+        calls.append(num_keywords)
+        return [f"kelime{i}" for i in range(num_keywords)]
+
+    monkeypatch.setattr(api, "extract_keywords_from_documents", extract)
+    assert len(client.post("/keywords", json={"role": "Avukat", "num_keywords": 3}).json()["keywords"]) == 3
+    assert len(client.post("/keywords", json={"role": "Avukat", "num_keywords": 5}).json()["keywords"]) == 5
+    assert len(client.post("/keywords", json={"role": "Avukat", "num_keywords": 3}).json()["keywords"]) == 3
+    assert len(client.post("/keywords", json={"role": "Avukat"}).json()["keywords"]) == api.NUM_KEYWORDS
+    assert calls == [3, 5, api.NUM_KEYWORDS]
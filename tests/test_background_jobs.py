@@ -0,0 +1,54 @@
+import threading
+
+import background_jobs
+from background_jobs import JobRegistry
+
+
+def blocking_job(started, release, owners, owner=None):
+    owners.append(owner)
+    started.set()
+    release.wait(5)
+    return owner
+
+
+def test_shared_job_is_cancelled_only_when_last_waiter_detaches(monkeypatch):
+    cancelled = []
+    monkeypatch.setattr(background_jobs.scheduler, "cancel", cancelled.append)
+    registry = JobRegistry(max_workers=1)
+    started, release, owners = threading.Event(), threading.Event(), []
+
+    first = registry.submit("corpus:keywords", blocking_job, started, release, owners, waiter="session-a")
+    second = registry.submit("corpus:keywords", blocking_job, started, release, owners, waiter="session-b")
+    assert first is second
+    assert started.wait(5)
+    job_owner = owners[0]
+    assert job_owner not in ("session-a", "session-b") # LLM çağrıları oturum adına yapılmaz
+
+    assert registry.detach("session-a") == 0
+    assert cancelled == []
+    assert registry.is_running("corpus:keywords")
+
+    assert registry.detach("session-b") == 1
+    assert cancelled == [job_owner]
+    assert not registry.is_running("corpus:keywords")
+
+    # İptal edilen iş bitmeden aynı anahtar tekrar istenirse yeni bir iş (yeni sahiple) başlar
+    restarted = registry.submit("corpus:keywords", lambda owner=None: owner, waiter="session-c")
+    release.set()
+    assert first.result(5) == job_owner
+    assert restarted.result(5) not in (None, job_owner)
+    assert not registry.is_running("corpus:keywords")
+
+
+def test_jobs_without_waiters_are_not_detached(monkeypatch):
+    cancelled = []
+    monkeypatch.setattr(background_jobs.scheduler, "cancel", cancelled.append)
+    registry = JobRegistry(max_workers=1)
+    started, release, owners = threading.Event(), threading.Event(), []
+    future = registry.submit("job", blocking_job, started, release, owners)
+    assert started.wait(5)
+    assert registry.detach("session-a") == 0
+    assert registry.is_running("job")
+    release.set()
+    future.result(5)
+    assert cancelled == []
@@ -0,0 +1,74 @@
+import json
+import time
+
+import batch_qa
+from batch_qa import BatchRunner, read_completed_ids
+
+
+def make_questions(count):
+    return [{"id": f"q{i}", "question": f"soru {i}", "role": "Avukat", "language": "tr"} for i in range(count)]
+
+
+def written_ids(path):
+    if not path.exists():
+        return []
+    return [json.loads(line)["id"] for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def fake_answers(monkeypatch, retrieve):
+    monkeypatch.setattr(batch_qa, "retrieve_contexts", retrieve)
+    monkeypatch.setattr(batch_qa, "answer_from_context", lambda sources, question, role, language: f"cevap: {question}")
+
+
+def test_answers_are_written_while_later_windows_are_retrieved(monkeypatch, tmp_path):
+    output_path = tmp_path / "cevaplar.jsonl"
+    seen_during_retrieval = []
+
+    def retrieve(vectorstore, questions):
+        if questions[0] != "soru 0": # İlk pencerenin cevapları sonraki retrieval'lar bitmeden yazılmış olmalı
+            seen_during_retrieval.append(wait_for(lambda: {"q0", "q1"} <= set(written_ids(output_path))))
+        return [([], {}) for _ in questions]
+
+    fake_answers(monkeypatch, retrieve)
+    report = BatchRunner(None, str(output_path), concurrency=2, retrieval_batch_size=2).run(make_questions(6))
+    assert seen_during_retrieval == [True, True]
+    assert sorted(written_ids(output_path)) == [f"q{i}" for i in range(6)]
+    assert report["answered"] == 6
+
+
+def test_interrupt_keeps_finished_answers(monkeypatch, tmp_path):
+    output_path = tmp_path / "cevaplar.jsonl"
+    runner = BatchRunner(None, str(output_path), concurrency=2, retrieval_batch_size=2)
+
+    def retrieve(vectorstore, questions):
+        if questions[0] != "soru 0":
+            wait_for(lambda: len(runner.latencies) == 2)
+            raise KeyboardInterrupt
+        return [([], {}) for _ in questions]
+
+    fake_answers(monkeypatch, retrieve)
+    runner.run(make_questions(6))
+    assert sorted(written_ids(output_path)) == ["q0", "q1"]
+    assert read_completed_ids(str(output_path)) == {"q0", "q1"}
+
+
+def test_failed_answers_are_not_written(monkeypatch, tmp_path):
+    output_path = tmp_path / "cevaplar.jsonl"
+
+    def answer(sources, question, role, language):
+        if question == "soru 1":
+            raise RuntimeError("model hatası")
+        return "cevap"
+
+    monkeypatch.setattr(batch_qa, "retrieve_contexts", lambda vectorstore, questions: [([], {}) for _ in questions])
+    monkeypatch.setattr(batch_qa, "answer_from_context", answer)
+    report = BatchRunner(None, str(output_path), concurrency=1).run(make_questions(3))
+    assert sorted(written_ids(output_path)) == ["q0", "q2"]
+    assert (report["answered"], report["failed"]) == (2, 1)
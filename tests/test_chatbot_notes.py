@@ -0,0 +1,49 @@
+import chatbot
+
+NOTES = [
+    {"summary": "", "key_terms": ["kira"], "relations": [],
+     "events": [{"date": "2021", "description": "sözleşme imzalandı"}, {"date": "2019", "description": "taşınmaz satın alındı"}]},
+]
+
+
+class RecordingLLM:
+    def __init__(self, response="- **2019**: property purchased"):
+        self.response = response
+        self.prompts = []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        return self.response
+
+    def stream(self, prompt):
+        self.prompts.append(prompt)
+        yield self.response
+
+
+def use_notes(monkeypatch, notes_list):
+    llm = RecordingLLM()
+    monkeypatch.setattr(chatbot, "analyze_corpus", lambda document_chunks, priority=None, owner=None: notes_list)
+    monkeypatch.setattr(chatbot, "get_llm", lambda priority=None, owner=None: llm)
+    return llm
+
+
+def test_notes_timeline_is_adapted_to_role_and_language(monkeypatch):
+    llm = use_notes(monkeypatch, NOTES)
+    timeline = chatbot.extract_timeline_from_documents([], "Avukat", "en")
+    assert timeline == llm.response
+    prompt = llm.prompts[0]
+    assert "As a 'Avukat'" in prompt and "English" in prompt
+    # Olaylar kronolojik sırayla ve notlardaki haliyle modele gider
+    assert prompt.index("**2019**: taşınmaz satın alındı") < prompt.index("**2021**: sözleşme imzalandı")
+
+
+def test_notes_timeline_streams_through_the_model(monkeypatch):
+    llm = use_notes(monkeypatch, NOTES)
+    assert "".join(chatbot.extract_timeline_from_documents([], "Doktor", "tr", stream=True)) == llm.response
+    assert "Bir 'Doktor' olarak" in llm.prompts[0] and "Türkçe" in llm.prompts[0]
+
+
+def test_notes_without_events_skip_the_model(monkeypatch):
+    llm = use_notes(monkeypatch, [dict(NOTES[0], events=[])])
+    assert chatbot.extract_timeline_from_documents([], "Avukat", "en") == "No clear timeline was found in the documents."
+    assert llm.prompts == []
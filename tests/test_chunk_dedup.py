@@ -0,0 +1,92 @@
+from langchain.docstore.document import Document
+
+from chunk_dedup import (
+    FURNITURE_WARMUP_PAGES,
+    ChunkDeduplicator,
+    deduplicate_page_chunks,
+    minhash_signature,
+)
+
+DISCLAIMER = (
+    "Bu belgede yer alan bilgiler yalnızca genel bilgilendirme amaçlıdır ve hukuki tavsiye niteliği taşımaz; "
+    "yazılı izin olmadan çoğaltılamaz, dağıtılamaz veya üçüncü kişilerle paylaşılamaz."
+)
+
+
+def make_page(page, body, header="ACME Ltd. Gizli Rapor", footer=None):
+    footer = footer or f"Sayfa {page + 1} / 20"
+    text = "\n".join([header, *body, footer])
+    return {"page_content": text, "metadata": {"source": "a.pdf", "page": page}}
+
+
+def page_body(page):
+    return [f"Bölüm {page} satır {line}: " + " ".join(f"p{page}l{line}w{i}" for i in range(8)) for line in range(4)]
+
+
+def one_chunk_per_page(pages):
+    return [Document(page_content=p["page_content"], metadata=dict(p["metadata"], start_index=0)) for p in pages]
+
+
+def test_signature_ignores_spacing_and_punctuation():
+    reformatted = DISCLAIMER.replace(";", "\n").replace(",", " ,  ")
+    assert (minhash_signature(DISCLAIMER) == minhash_signature(reformatted)).all()
+    assert (minhash_signature(DISCLAIMER) != minhash_signature("tamamen farklı bir metin " * 5)).any()
+
+
+def test_repeated_header_and_page_numbers_are_trimmed():
+    pages = [make_page(page, page_body(page)) for page in range(FURNITURE_WARMUP_PAGES)]
+    deduplicator = ChunkDeduplicator()
+    chunks = list(deduplicate_page_chunks(pages, one_chunk_per_page, deduplicator))
+    assert len(chunks) == len(pages)
+    for page, chunk in enumerate(chunks):
+        assert chunk.page_content.startswith(f"Bölüm {page} satır 0")
+        assert "ACME" not in chunk.page_content and "Sayfa" not in chunk.page_content
+        # start_index kırpılan başlık kadar ilerler
+        assert chunk.metadata["start_index"] == len("ACME Ltd. Gizli Rapor\n")
+    assert deduplicator.stats["furniture_trimmed"] == len(pages)
+
+
+def test_chunk_made_only_of_furniture_is_dropped():
+    deduplicator = ChunkDeduplicator()
+    pages = [make_page(page, page_body(page)) for page in range(FURNITURE_WARMUP_PAGES)]
+    chunks = []
+    for page_data in pages:
+        header_only = Document(page_content="ACME Ltd. Gizli Rapor", metadata=dict(page_data["metadata"]))
+        chunks.extend(deduplicator.add_page(page_data, [header_only]))
+    chunks.extend(deduplicator.flush())
+    assert chunks == []
+    assert deduplicator.stats["furniture_dropped"] == len(pages)
+
+
+def test_body_lines_repeated_within_a_page_are_not_furniture():
+    # Her sayfada tekrar eden ama sayfa içinde de birden çok kez geçen satır (tablo başlığı gibi) korunur
+    pages = [make_page(page, ["Tablo", *page_body(page), "Tablo"], header="Tablo", footer="Tablo") for page in range(4)]
+    chunks = list(deduplicate_page_chunks(pages, one_chunk_per_page))
+    assert all(chunk.page_content.startswith("Tablo") for chunk in chunks)
+
+
+def test_near_duplicate_chunks_collapse_into_one_with_pages():
+    deduplicator = ChunkDeduplicator()
+    chunks = []
+    for page in range(3):
+        page_data = {"page_content": "kısa", "metadata": {"page": page}}
+        page_chunks = [
+            Document(page_content=" ".join(page_body(page)), metadata={"page": page}),
+            Document(page_content=DISCLAIMER, metadata={"page": page}),
+        ]
+        chunks.extend(deduplicator.add_page(page_data, page_chunks))
+    chunks.extend(deduplicator.flush())
+    disclaimers = [chunk for chunk in chunks if chunk.page_content == DISCLAIMER]
+    assert len(chunks) == 4
+    assert len(disclaimers) == 1
+    assert disclaimers[0].metadata["pages"] == [0, 1, 2]
+    assert deduplicator.stats["near_duplicates"] == 2
+
+
+def test_deduplication_is_per_file():
+    first, second = ChunkDeduplicator(), ChunkDeduplicator()
+    page_data = {"page_content": "kısa", "metadata": {"page": 0}}
+    first.add_page(page_data, [Document(page_content=DISCLAIMER, metadata={"page": 0})])
+    second.add_page(page_data, [Document(page_content=DISCLAIMER, metadata={"page": 0})])
+    assert len(first.flush()) == 1
+    assert len(second.flush()) == 1
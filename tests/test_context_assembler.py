@@ -0,0 +1,96 @@
+from langchain.docstore.document import Document
+
+from context_assembler import (
+    BASELINE_CONTEXT_CHUNKS,
+    MIN_PARTIAL_TOKENS,
+    assemble_context,
+    drop_near_duplicates,
+    estimate_tokens,
+    merge_page_chunks,
+)
+
+
+def word_count(text):
+    return len(text.split())
+
+
+def distinct_words(prefix, count):
+    return " ".join(f"{prefix}{i}" for i in range(count))
+
+
+def make_doc(text, page=0, start_index=None, source="a.pdf"):
+    metadata = {"source": source, "page": page}
+    if start_index is not None:
+        metadata["start_index"] = start_index
+    return Document(page_content=text, metadata=metadata)
+
+
+def test_estimate_tokens_counts_word_pieces_and_punctuation():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("a b") == 2
+    assert estimate_tokens("sözleşme.") == 3 # 8 karakter -> 2 parça, nokta 1
+
+
+def test_overlapping_chunks_on_same_page_are_merged_once():
+    page_text = "Birinci cümle burada. İkinci cümle de burada. Üçüncü cümle sonda."
+    first = make_doc(page_text[:40], start_index=0)
+    second = make_doc(page_text[25:], start_index=25)
+    pieces, merged = merge_page_chunks([second, first])
+    assert merged == 1
+    assert [piece.page_content for piece in pieces] == [page_text]
+    assert pieces[0].metadata["start_index"] == 0
+
+
+def test_chunks_on_other_pages_are_not_merged():
+    pieces, merged = merge_page_chunks([make_doc("abc", page=0, start_index=0), make_doc("def", page=1, start_index=3)])
+    assert merged == 0
+    assert len(pieces) == 2
+
+
+def test_contained_repeat_is_dropped():
+    long_text = "Bu sözleşme taraflar arasında imzalanmış olup iki yıl süreyle geçerlidir ve yenilenebilir."
+    pieces, dropped = drop_near_duplicates([make_doc(long_text), make_doc("taraflar arasında imzalanmış olup iki yıl süreyle")])
+    assert dropped == 1
+    assert pieces[0].page_content == long_text
+
+
+def test_budget_is_filled_in_relevance_order_and_truncated_at_sentence():
+    documents = [
+        make_doc(" ".join(distinct_words(f"s{page}c{n}k", 20) + "." for n in range(5)), page=page) for page in range(3)
+    ]
+    budget = 100 + MIN_PARTIAL_TOKENS + 6 # ilk parça tam, ikincisi kırpılarak sığar
+    context, stats = assemble_context(documents, token_budget=budget, count_tokens=word_count)
+    assert stats["context_tokens"] <= budget
+    assert stats["context_tokens"] == sum(word_count(doc.page_content) for doc in context)
+    assert context[0].page_content == documents[0].page_content
+    assert context[1].page_content.endswith(".") # cümle sonundan kırpıldı
+    assert stats["truncated"] == 1
+    assert stats["skipped"] == 1
+
+
+def test_piece_smaller_than_remaining_budget_is_still_added():
+    big = make_doc(distinct_words("uzun", 100), page=0)
+    small = make_doc("kısa parça", page=1)
+    context, stats = assemble_context([big, small], token_budget=100 + MIN_PARTIAL_TOKENS - 1, count_tokens=word_count)
+    assert [doc.page_content for doc in context] == [big.page_content, small.page_content]
+
+
+def test_saved_tokens_are_measured_against_baseline_chunks():
+    documents = [make_doc(distinct_words(f"p{page}k", 10), page=page) for page in range(BASELINE_CONTEXT_CHUNKS + 2)]
+    _, stats = assemble_context(documents, token_budget=1000, count_tokens=word_count)
+    # Tüm adaylar bütçeye sığar: bağlam eski k=4 bağlamından büyüktür, tasarruf negatiftir.
+    assert stats["retrieved_tokens"] == 10 * len(documents)
+    assert stats["baseline_tokens"] == 10 * BASELINE_CONTEXT_CHUNKS
+    assert stats["context_tokens"] == stats["retrieved_tokens"]
+    assert stats["saved_tokens"] == stats["baseline_tokens"] - stats["context_tokens"] < 0
+
+
+def test_chunk_ids_are_kept_through_merging_and_truncation():
+    page_text = "Birinci cümle burada. İkinci cümle de burada. Üçüncü cümle sonda."
+    first = Document(id="doc:0", page_content=page_text[:40], metadata={"source": "a.pdf", "page": 0, "start_index": 0})
+    second = Document(id="doc:1", page_content=page_text[25:], metadata={"source": "a.pdf", "page": 0, "start_index": 25})
+    pieces, _ = merge_page_chunks([second, first])
+    assert pieces[0].id == "doc:0"
+    big = Document(id="doc:2", page_content=distinct_words("uzun", 100) + ".", metadata={"page": 1})
+    context, stats = assemble_context([big], token_budget=MIN_PARTIAL_TOKENS + 5, count_tokens=word_count)
+    assert stats["truncated"] == 1 and context[0].id == "doc:2"
@@ -0,0 +1,98 @@
+import sqlite3
+
+from langchain.docstore.document import Document
+
+from hybrid_retriever import HybridRetriever, reciprocal_rank_fusion
+from lexical_index import LEXICAL_SCHEMA, BM25Searcher, finalize, index_chunks, tokenize
+
+CHUNKS = {
+    "c1": "Madde 12.3 uyarınca kira bedeli her yıl artırılır.",
+    "c2": "Kiracı, kira bedelini her ayın beşinci gününe kadar öder.",
+    "c3": "Dosya no 2023/45 ile açılan davada bilirkişi raporu alındı.",
+    "c4": "Taraflar arasındaki sözleşme iki yıl süreyle geçerlidir.",
+    "c5": "Sözleşmenin feshi halinde kiracı taşınmazı boşaltır.",
+}
+
+
+def make_searcher(chunks=CHUNKS):
+    conn = sqlite3.connect(":memory:")
+    for statement in LEXICAL_SCHEMA:
+        conn.execute(statement)
+    index_chunks(conn, chunks.items())
+    finalize(conn)
+    return BM25Searcher(lambda query, params=(): conn.execute(query, params).fetchall())
+
+
+def test_tokenize_keeps_compound_terms_and_their_parts():
+    assert tokenize("Dosya 2023/45, Madde 12.3") == ["dosya", "2023/45", "2023", "45", "madde", "12.3", "12", "3"]
+    assert tokenize("İSTANBUL") == ["istanbul"]
+
+
+def test_bm25_ranks_exact_term_matches():
+    results, required_terms = make_searcher().search("2023/45")
+    assert results[0][0] == "c3"
+    assert required_terms == 3 and results[0][2] == 3 # bütün ifade ve parçaları
+
+
+def test_bm25_prefers_chunks_matching_more_rare_terms():
+    results, _ = make_searcher().search("kira bedeli artırılır")
+    assert [chunk_id for chunk_id, _, _ in results][:2] == ["c1", "c2"]
+    assert results[0][1] > results[1][1]
+
+
+def test_bm25_counts_missing_terms_as_required():
+    results, required_terms = make_searcher().search("sözleşme olmayanterim")
+    assert required_terms == 2
+    assert all(matched < required_terms for _, _, matched in results)
+
+
+def test_bm25_on_empty_index():
+    assert make_searcher({}).search("kira") == ([], 1)
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["b", "d", "a"]]) == ["b", "a", "d", "c"]
+    assert reciprocal_rank_fusion([]) == []
+
+
+class FakeDocstore:
+    has_lexical_index = True
+
+    def __init__(self):
+        self.searcher = make_searcher()
+
+    def lexical_search(self, query, k):
+        return self.searcher.search(query, k)
+
+    def search(self, chunk_id):
+        return Document(id=chunk_id, page_content=CHUNKS[chunk_id])
+
+
+class FakeVectorstore:
+    def __init__(self, dense_ids):
+        self.docstore = FakeDocstore()
+        self.dense_ids = dense_ids
+        self.dense_queries = []
+
+    def similarity_search(self, query, k=4):
+        self.dense_queries.append(query)
+        return [self.docstore.search(chunk_id) for chunk_id in self.dense_ids[:k]]
+
+
+def test_keyword_query_is_answered_without_embedding():
+    vectorstore = FakeVectorstore(["c4", "c5"])
+    retriever = HybridRetriever(vectorstore=vectorstore, k=2)
+    documents = retriever.invoke("2023/45")
+    assert documents[0].id == "c3"
+    assert vectorstore.dense_queries == []
+    assert retriever.stats == {"lexical_only": 1, "fused": 0}
+
+
+def test_other_queries_fuse_dense_and_lexical_results():
+    vectorstore = FakeVectorstore(["c4", "c2", "c5"])
+    retriever = HybridRetriever(vectorstore=vectorstore, k=3)
+    documents = retriever.invoke("kiracı kira bedelini ne zaman ödemeli")
+    assert vectorstore.dense_queries == ["kiracı kira bedelini ne zaman ödemeli"]
+    assert documents[0].id == "c2" # iki listede de üst sıralarda
+    assert len(documents) == 3
+    assert retriever.stats == {"lexical_only": 0, "fused": 1}
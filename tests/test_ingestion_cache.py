@@ -0,0 +1,52 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+
+from ingestion_cache import IngestionCache, load_cached_file
+
+
+def leftover_tmp_files(root):
+    return [name for _, _, names in os.walk(root) for name in names if ".tmp" in name]
+
+
+def test_concurrent_writers_of_same_entry_leave_valid_files(tmp_path):
+    cache = IngestionCache(str(tmp_path))
+    chunks = [Document(page_content=f"chunk {i}", metadata={"page": i}) for i in range(50)]
+    vectors = np.ones((50, 8), dtype="float32")
+    errors = []
+
+    def write():
+        try:
+            for _ in range(20):
+                cache.save_file_entry("key", {"source": "a.pdf", "total_pages": 50}, chunks, vectors)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    meta, loaded_chunks, loaded_vectors, from_cache = load_cached_file("key", "a.pdf", cache)
+    assert len(loaded_chunks) == len(loaded_vectors) == 50 and from_cache
+    assert leftover_tmp_files(tmp_path) == []
+
+
+def test_interrupted_page_recording_leaves_no_files(tmp_path):
+    cache = IngestionCache(str(tmp_path))
+
+    def pages():
+        yield {"page_content": "bir", "metadata": {"page": 0}}
+        raise RuntimeError("PDF okunamadı")
+
+    with pytest.raises(RuntimeError):
+        list(cache.record_pages("key", pages()))
+    recorder = cache.record_pages("key", iter([{"page_content": "bir", "metadata": {"page": 0}}] * 3))
+    next(recorder)
+    recorder.close() # Tüketici yarıda bıraktı (ör. iptal)
+    assert cache.load_pages("key") == []
+    assert leftover_tmp_files(tmp_path) == []
@@ -0,0 +1,70 @@
+import ingestion_pipeline
+from ingestion_cache import IngestionCache
+from ingestion_pipeline import IngestionPipeline
+
+
+class FakeEmbeddings:
+    """İçinde "BOZUK" geçen bir batch'te hata veren, daha önce gördüğü metinleri önbellekten sayan sahte servis."""
+
+    batch_size = 2
+    max_workers = 1
+
+    def __init__(self):
+        self.seen = set()
+        self.embedded_texts = []
+
+    def embed_documents_with_stats(self, texts):
+        if any("BOZUK" in text for text in texts):
+            raise RuntimeError("embedding sunucusu hata verdi")
+        from_cache = [text in self.seen for text in texts]
+        self.seen.update(texts)
+        self.embedded_texts.extend(text for text, cached in zip(texts, from_cache) if not cached)
+        return [[float(len(text)), 1.0] for text in texts], {"seconds": 0.01 * len(texts), "from_cache": from_cache}
+
+
+def fake_pdfs(monkeypatch, pages_by_path):
+    def open_page_stream(file_path):
+        pages = [{"page_content": text, "metadata": {"page": page}} for page, text in enumerate(pages_by_path[file_path])]
+        return len(pages), iter(pages)
+
+    monkeypatch.setattr(ingestion_pipeline, "open_page_stream", open_page_stream)
+
+
+def test_failed_embedding_batch_only_fails_its_file(monkeypatch, tmp_path):
+    fake_pdfs(monkeypatch, {
+        "bad.pdf": ["iyi sayfa bir", "BOZUK sayfa", "iyi sayfa iki", "iyi sayfa üç", "iyi sayfa dört"],
+        "good.pdf": ["sağlam sayfa bir", "sağlam sayfa iki", "sağlam sayfa üç"],
+    })
+    embeddings = FakeEmbeddings()
+    cache = IngestionCache(str(tmp_path))
+    pipeline = IngestionPipeline(cache, embeddings=embeddings)
+    results = pipeline.run([("bad.pdf", "bad.pdf", "bad"), ("good.pdf", "good.pdf", "good")])
+
+    assert isinstance(results["bad"], RuntimeError)
+    meta, chunks, vectors, from_cache = results["good"]
+    assert [chunk.page_content for chunk in chunks] == ["sağlam sayfa bir", "sağlam sayfa iki", "sağlam sayfa üç"]
+    assert len(vectors) == 3 and not from_cache
+    assert meta["embedding_stats"]["embedded"] == 3
+    # Başarısız dosyanın hatadan sonra kalan chunk'ları embed edilmez, önbelleğe sadece sağlam dosya yazılır
+    assert not any(text.startswith("iyi sayfa") for text in embeddings.embedded_texts)
+    assert cache.has_file("good") and not cache.has_file("bad")
+    assert pipeline.files_done == 2
+
+
+def test_embedding_stats_are_per_file_and_count_cache_hits(monkeypatch, tmp_path):
+    fake_pdfs(monkeypatch, {"a.pdf": ["ortak metin", "a metni"], "b.pdf": ["ortak metin", "b metni", "b ikinci"]})
+    pipeline = IngestionPipeline(IngestionCache(str(tmp_path)), embeddings=FakeEmbeddings())
+    results = pipeline.run([("a.pdf", "a.pdf", "a"), ("b.pdf", "b.pdf", "b")])
+    a_stats, b_stats = results["a"][0]["embedding_stats"], results["b"][0]["embedding_stats"]
+    assert (a_stats["embedded"], a_stats["cache_hits"]) == (2, 0)
+    assert (b_stats["embedded"], b_stats["cache_hits"]) == (2, 1)
+    assert a_stats["embedded_per_sec"] > 0 and b_stats["embedded_per_sec"] > 0
+
+
+def test_cached_file_is_kept_when_another_file_fails_to_open(monkeypatch, tmp_path):
+    fake_pdfs(monkeypatch, {"a.pdf": ["a metni"]})
+    cache = IngestionCache(str(tmp_path))
+    IngestionPipeline(cache, embeddings=FakeEmbeddings()).run([("a.pdf", "a.pdf", "a")])
+    results = IngestionPipeline(cache, embeddings=FakeEmbeddings()).run([("a.pdf", "a.pdf", "a"), ("missing.pdf", "missing.pdf", "m")])
+    assert results["a"][3] is True # önbellekten
+    assert isinstance(results["m"], KeyError)
@@ -0,0 +1,182 @@
+import threading
+import time
+
+import pytest
+
+from llm_scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_IDLE,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_REFINE,
+    LLMScheduler,
+    RequestCancelledError,
+    ScheduledLLM,
+    SchedulerBusyError,
+    scheduler,
+)
+
+MODEL = "test-model"
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("koşul zamanında sağlanmadı")
+        time.sleep(0.01)
+
+
+def waiting_count(llm_scheduler, model=MODEL):
+    return sum(llm_scheduler.stats().get(model, {}).get("waiting", {}).values())
+
+
+def start_waiter(llm_scheduler, priority, order, owner=None, errors=None):
+    def run():
+        try:
+            with llm_scheduler.slot(MODEL, priority, owner):
+                order.append(priority)
+        except Exception as e:
+            if errors is None:
+                raise
+            errors.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_waiting_calls_start_by_priority_then_arrival():
+    llm_scheduler = LLMScheduler(default_max_in_flight=1)
+    blocker = llm_scheduler.acquire(MODEL)
+    order = []
+    threads = []
+    for priority in (PRIORITY_BACKGROUND, PRIORITY_REFINE, PRIORITY_INTERACTIVE, PRIORITY_REFINE):
+        threads.append(start_waiter(llm_scheduler, priority, order))
+        wait_until(lambda: waiting_count(llm_scheduler) == len(threads))
+    llm_scheduler.release(blocker)
+    for thread in threads:
+        thread.join(5)
+    assert order == [PRIORITY_INTERACTIVE, PRIORITY_REFINE, PRIORITY_REFINE, PRIORITY_BACKGROUND]
+
+
+def test_idle_calls_leave_reserved_slot_free():
+    llm_scheduler = LLMScheduler(default_max_in_flight=2)
+    first = llm_scheduler.acquire(MODEL, PRIORITY_IDLE)
+    order = []
+    idle_thread = start_waiter(llm_scheduler, PRIORITY_IDLE, order)
+    wait_until(lambda: waiting_count(llm_scheduler) == 1)
+    time.sleep(0.05)
+    assert order == [] # İkinci yer etkileşimli istekler için boş tutulur
+    interactive = llm_scheduler.acquire(MODEL, PRIORITY_INTERACTIVE)
+    llm_scheduler.release(interactive)
+    llm_scheduler.release(first)
+    idle_thread.join(5)
+    assert order == [PRIORITY_IDLE]
+
+
+def test_full_queue_rejects_lower_priorities_first():
+    llm_scheduler = LLMScheduler(default_max_in_flight=1, queue_limits={
+        PRIORITY_INTERACTIVE: 3, PRIORITY_REFINE: 2, PRIORITY_BACKGROUND: 1, PRIORITY_IDLE: 0,
+    })
+    blocker = llm_scheduler.acquire(MODEL)
+    order = []
+    threads = [start_waiter(llm_scheduler, PRIORITY_INTERACTIVE, order) for _ in range(2)]
+    wait_until(lambda: waiting_count(llm_scheduler) == 2)
+
+    with pytest.raises(SchedulerBusyError):
+        llm_scheduler.check(MODEL, PRIORITY_BACKGROUND)
+    with pytest.raises(SchedulerBusyError):
+        llm_scheduler.acquire(MODEL, PRIORITY_REFINE)
+    llm_scheduler.check(MODEL, PRIORITY_INTERACTIVE) # Etkileşimli sınıf için hâlâ yer var
+
+    llm_scheduler.release(blocker)
+    for thread in threads:
+        thread.join(5)
+    llm_scheduler.check(MODEL, PRIORITY_IDLE) # Boşta hiçbir istek reddedilmez
+
+
+def test_cancel_removes_only_the_owners_queued_calls():
+    llm_scheduler = LLMScheduler(default_max_in_flight=1)
+    blocker = llm_scheduler.acquire(MODEL)
+    order, errors = [], []
+    cancelled_thread = start_waiter(llm_scheduler, PRIORITY_INTERACTIVE, order, owner="a", errors=errors)
+    other_thread = start_waiter(llm_scheduler, PRIORITY_BACKGROUND, order, owner="b", errors=errors)
+    wait_until(lambda: waiting_count(llm_scheduler) == 2)
+
+    assert llm_scheduler.cancel("a") == 1
+    cancelled_thread.join(5)
+    assert len(errors) == 1 and isinstance(errors[0], RequestCancelledError)
+    assert llm_scheduler.cancel(None) == 0
+
+    llm_scheduler.release(blocker)
+    other_thread.join(5)
+    assert order == [PRIORITY_BACKGROUND]
+
+
+class BlockingClient:
+    """invoke/stream çağrıldığında release olayı gelene kadar bekleyen sahte model istemcisi."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def invoke(self, prompt, stop=None, **kwargs):
+        self.started.set()
+        self.release.wait(5)
+        return "cevap"
+
+    def stream(self, prompt, stop=None, **kwargs):
+        yield "ilk "
+        self.started.set()
+        self.release.wait(5)
+        yield "ikinci"
+
+
+def run_in_thread(fn, results):
+    def run():
+        try:
+            results.append(fn())
+        except Exception as e:
+            results.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_invoke_cancelled_while_running_discards_result():
+    client = BlockingClient()
+    llm = ScheduledLLM(client=client, model="test-invoke-cancel", owner="session")
+    results = []
+    thread = run_in_thread(lambda: llm.invoke("soru"), results)
+    assert client.started.wait(5)
+    assert scheduler.cancel("session") == 1
+    client.release.set()
+    thread.join(5)
+    assert len(results) == 1 and isinstance(results[0], RequestCancelledError)
+    assert scheduler.stats()["test-invoke-cancel"]["in_flight"] == 0
+
+
+def test_invoke_without_cancel_returns_result():
+    client = BlockingClient()
+    client.release.set()
+    assert ScheduledLLM(client=client, model="test-invoke-ok", owner="session").invoke("soru") == "cevap"
+
+
+def test_stream_cancelled_while_running_stops():
+    client = BlockingClient()
+    llm = ScheduledLLM(client=client, model="test-stream-cancel", owner="session")
+    tokens = []
+
+    def consume():
+        for token in llm.stream("soru"):
+            tokens.append(token)
+
+    results = []
+    thread = run_in_thread(consume, results)
+    assert client.started.wait(5)
+    scheduler.cancel("session")
+    client.release.set()
+    thread.join(5)
+    assert tokens == ["ilk "]
+    assert isinstance(results[0], RequestCancelledError)
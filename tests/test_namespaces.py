@@ -0,0 +1,49 @@
+import os
+
+from langchain.docstore.document import Document
+
+import namespaces
+from namespaces import assign_documents, read_namespace, relabel_sources
+
+
+def use_tmp_dirs(monkeypatch, tmp_path):
+    monkeypatch.setattr(namespaces, "NAMESPACE_DIR", str(tmp_path / "namespaces"))
+    monkeypatch.setattr(namespaces, "CORPUS_DIR", str(tmp_path / "corpora"))
+    monkeypatch.setattr(namespaces, "_LOCK_DIR", str(tmp_path / "namespaces" / ".locks"))
+    built = []
+    monkeypatch.setattr(namespaces, "_build_corpus", lambda corpus_key, documents, loaders, seed_key=None: built.append(corpus_key))
+    return built
+
+
+def test_same_documents_under_other_names_share_a_corpus(monkeypatch, tmp_path):
+    use_tmp_dirs(monkeypatch, tmp_path)
+    assign_documents("session-a", {"doc1": "sozlesme.pdf", "doc2": "ek.pdf"})
+    assign_documents("session-b", {"doc2": "Ek-1.pdf", "doc1": "kira sözleşmesi.pdf"})
+    assign_documents("session-c", {"doc1": "sozlesme.pdf"})
+    a, b, c = (read_namespace(name) for name in ("session-a", "session-b", "session-c"))
+    assert a["corpus"] == b["corpus"] != c["corpus"]
+    assert b["documents"] == {"doc2": "Ek-1.pdf", "doc1": "kira sözleşmesi.pdf"}
+    assert os.path.isdir(tmp_path / "namespaces")
+
+
+def test_sources_are_relabelled_with_the_namespace_names():
+    documents = [
+        Document(id="doc1:0", page_content="bir", metadata={"source": "sozlesme.pdf", "page": 1}),
+        Document(id="doc2:3", page_content="iki", metadata={"source": "ek.pdf", "page": 2}),
+        Document(page_content="kimliksiz", metadata={"source": "eski.pdf"}),
+    ]
+    relabeled = relabel_sources(documents, {"doc1": "kira sözleşmesi.pdf", "doc2": "ek.pdf"})
+    assert [doc.metadata["source"] for doc in relabeled] == ["kira sözleşmesi.pdf", "ek.pdf", "eski.pdf"]
+    assert relabeled[0].metadata["page"] == 1 and relabeled[0].id == "doc1:0"
+    assert documents[0].metadata["source"] == "sozlesme.pdf" # paylaşılan chunk değiştirilmez
+    assert relabeled[1] is documents[1]
+
+
+def test_latest_session_namespace_is_the_most_recently_updated(monkeypatch, tmp_path):
+    use_tmp_dirs(monkeypatch, tmp_path)
+    assert namespaces.latest_session_namespace() is None
+    for age, name in ((30, "session-old"), (10, "session-new"), (0, "koleksiyon")):
+        assign_documents(name, {"doc1": "a.pdf"})
+        path = os.path.join(namespaces.NAMESPACE_DIR, f"{name}.json")
+        os.utime(path, (os.path.getmtime(path) - age, os.path.getmtime(path) - age))
+    assert namespaces.latest_session_namespace() == "session-new"
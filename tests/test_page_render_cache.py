@@ -0,0 +1,50 @@
+import os
+import time
+
+from pdf_handler import RENDER_TMP_GRACE_SECONDS, PageRenderCache
+
+
+def png_files(root):
+    return sorted(name for _, _, names in os.walk(root) for name in names)
+
+
+def test_highlighted_renders_stay_in_memory(tmp_path):
+    cache = PageRenderCache(cache_dir=str(tmp_path))
+    cache.put(("doc", 0, 1.0, "none"), b"plain")
+    cache.put(("doc", 0, 1.0, "abc123"), b"highlighted")
+    assert png_files(tmp_path) == ["0_1.0_none.png"]
+    assert cache.get(("doc", 0, 1.0, "abc123")) == b"highlighted"
+    assert PageRenderCache(cache_dir=str(tmp_path)).get(("doc", 0, 1.0, "none")) == b"plain"
+
+
+def test_disk_is_pruned_least_recently_used_first(tmp_path):
+    cache = PageRenderCache(cache_dir=str(tmp_path), disk_max_bytes=300)
+    for page in range(3):
+        cache.put(("doc", page, 1.0, "none"), b"x" * 100)
+        path = cache._path(("doc", page, 1.0, "none"))
+        os.utime(path, (time.time() - 100 + page, time.time() - 100 + page))
+    PageRenderCache(cache_dir=str(tmp_path)).get(("doc", 0, 1.0, "none")) # okunan sayfa en yeni olur
+    cache.put(("doc", 3, 1.0, "none"), b"x" * 100)
+    assert png_files(tmp_path) == ["0_1.0_none.png", "3_1.0_none.png"]
+
+
+def test_expired_renders_are_removed(tmp_path):
+    cache = PageRenderCache(cache_dir=str(tmp_path), disk_max_age_seconds=60)
+    cache.put(("doc", 0, 1.0, "none"), b"eski")
+    old = time.time() - 120
+    os.utime(cache._path(("doc", 0, 1.0, "none")), (old, old))
+    assert cache.prune_disk() == 0
+    assert png_files(tmp_path) == []
+
+
+def test_prune_skips_temp_files_being_written(tmp_path):
+    cache = PageRenderCache(cache_dir=str(tmp_path), disk_max_bytes=100, disk_max_age_seconds=60)
+    os.makedirs(tmp_path / "doc")
+    writing = tmp_path / "doc" / "0_1.0_none.png.123.456.tmp"
+    abandoned = tmp_path / "doc" / "1_1.0_none.png.123.789.tmp"
+    writing.write_bytes(b"x" * 200)
+    abandoned.write_bytes(b"x" * 200)
+    old = time.time() - 2 * RENDER_TMP_GRACE_SECONDS
+    os.utime(abandoned, (old, old))
+    assert cache.prune_disk() == 0
+    assert png_files(tmp_path) == ["0_1.0_none.png.123.456.tmp"]
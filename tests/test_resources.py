@@ -0,0 +1,22 @@
+import resources
+
+
+def test_vectorstore_cache_evicts_least_recently_used(monkeypatch):
+    loaded = []
+
+    def load_vectorstore(db_path):
+        loaded.append(db_path)
+        return object()
+
+    monkeypatch.setattr(resources, "MAX_CACHED_VECTORSTORES", 2)
+    monkeypatch.setattr(resources, "_vectorstores", resources.OrderedDict())
+    monkeypatch.setattr(resources, "get_index_signature", lambda db_path: (1, 1))
+    monkeypatch.setattr(resources, "load_vectorstore", load_vectorstore)
+
+    first = resources.get_vectorstore("a")
+    resources.get_vectorstore("b")
+    assert resources.get_vectorstore("a") is first # "a" yeniden kullanıldı, en eski artık "b"
+    resources.get_vectorstore("c")
+    assert list(resources._vectorstores) == ["a", "c"]
+    resources.get_vectorstore("b")
+    assert loaded == ["a", "b", "c", "b"]
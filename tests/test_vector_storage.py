@@ -0,0 +1,126 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+
+import embedder
+from embedder import VectorIndexManager, load_vectorstore
+from vector_storage import SQLiteDocstore, load_faiss_store
+
+DIMENSION = 8
+
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return [0.0] * DIMENSION
+
+
+@pytest.fixture(autouse=True)
+def fake_embeddings(monkeypatch):
+    monkeypatch.setattr(embedder, "get_embeddings", lambda **options: FakeEmbeddings())
+
+
+def make_chunks(source, count):
+    return [Document(page_content=f"{source} parça {i}", metadata={"source": source, "page": i}) for i in range(count)]
+
+
+def make_vectors(count, seed):
+    return np.random.default_rng(seed).standard_normal((count, DIMENSION)).astype("float32")
+
+
+def make_low_rank_vectors(count, seed):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, 3)) @ np.random.default_rng(0).standard_normal((3, DIMENSION))
+    return (vectors + 0.01 * rng.standard_normal((count, DIMENSION))).astype("float32")
+
+
+def read_manifest(db_path):
+    with open(os.path.join(db_path, embedder.MANIFEST_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def nearest_content(vectorstore, vector):
+    return vectorstore.similarity_search_by_vector(list(map(float, vector)), k=1)[0].page_content
+
+
+def test_manifest_switches_generation_and_old_generation_stays_readable(tmp_path):
+    db_path = str(tmp_path / "db")
+    first_vectors = make_vectors(3, seed=0)
+    manager = VectorIndexManager(db_path, index_type="flat")
+    manager.add_document("a", make_chunks("a.pdf", 3), first_vectors)
+    manager.save()
+    first_storage = read_manifest(db_path)["storage"]
+    reader = load_vectorstore(db_path)
+
+    manager = VectorIndexManager(db_path, index_type="flat")
+    second_vectors = make_vectors(2, seed=1)
+    manager.add_document("b", make_chunks("b.pdf", 2), second_vectors)
+    manager.save()
+    manifest = read_manifest(db_path)
+    assert manifest["version"] == 2
+    assert manifest["storage"]["index"] == "index.2.faiss"
+
+    # Eski nesli açmış okuyucu ve eski manifest'i okumuş bir süreç hâlâ eski dosyaları kullanabilir.
+    assert reader.index.ntotal == 3
+    assert nearest_content(reader, first_vectors[1]) == "a.pdf parça 1"
+    old = load_faiss_store(db_path, first_storage, FakeEmbeddings())
+    assert old.index.ntotal == 3
+    assert nearest_content(load_vectorstore(db_path), second_vectors[0]) == "b.pdf parça 0"
+
+    manager = VectorIndexManager(db_path, index_type="flat")
+    manager.remove_document("b")
+    manager.save()
+    files = os.listdir(db_path)
+    assert "index.1.faiss" not in files and "docstore.1.sqlite" not in files
+    assert "index.2.faiss" in files # KEEP_PREVIOUS_GENERATIONS kadar eski nesil tutulur
+
+
+def test_sqlite_docstore_keeps_file_unchanged_until_written(tmp_path):
+    path = str(tmp_path / "docstore.1.sqlite")
+    SQLiteDocstore().write(path, {})
+    docstore = SQLiteDocstore()
+    docstore.add({"a:0": Document(page_content="kira sözleşmesi", metadata={"page": 0}),
+                  "a:1": Document(page_content="teslim tarihi", metadata={"page": 1})})
+    docstore.write(path, {0: "a:0", 1: "a:1"})
+
+    reopened = SQLiteDocstore(path)
+    assert reopened.search("a:1").page_content == "teslim tarihi"
+    assert dict(reopened.index_map().items()) == {0: "a:0", 1: "a:1"}
+    assert reopened.has_lexical_index
+    assert [hit[0] for hit in reopened.lexical_search("teslim")[0]] == ["a:1"]
+
+    reopened.delete(["a:0"])
+    reopened.add({"b:0": Document(page_content="ek protokol", metadata={})})
+    assert isinstance(reopened.search("a:0"), str)
+    assert SQLiteDocstore(path).search("a:0").page_content == "kira sözleşmesi"
+
+    new_path = str(tmp_path / "docstore.2.sqlite")
+    reopened.write(new_path, {0: "a:1", 1: "b:0"})
+    written = SQLiteDocstore(new_path)
+    assert dict(written.index_map().items()) == {0: "a:1", 1: "b:0"}
+    assert written.search("b:0").page_content == "ek protokol"
+    assert [hit[0] for hit in written.lexical_search("teslim")[0]] == ["a:1"]
+
+
+def test_incremental_add_to_compressed_pca_index_reuses_template(tmp_path):
+    db_path = str(tmp_path / "db")
+    manager = VectorIndexManager(db_path, index_type="flat", compression="int8", pca_dim=4)
+    manager.add_document("a", make_chunks("a.pdf", 400), make_low_rank_vectors(400, seed=1))
+    manager.save()
+    first_ann = read_manifest(db_path)["storage"]["ann"]
+    assert first_ann["description"] == "PCA4,SQ8" and first_ann["rescore"]
+
+    added_vectors = make_low_rank_vectors(20, seed=2)
+    manager = VectorIndexManager(db_path, index_type="flat", compression="int8", pca_dim=4)
+    manager.add_document("b", make_chunks("b.pdf", 20), added_vectors)
+    manager.save()
+    ann = read_manifest(db_path)["storage"]["ann"]
+    assert ann["file"] == "ann.2.faiss"
+    assert ann["vectors"] == 420 and ann["trained_on"] == 400 # Şablon yeniden eğitilmeden kullanıldı
+
+    reader = load_vectorstore(db_path)
+    assert reader.index.ntotal == 420
+    for i in (0, 7, 19):
+        assert nearest_content(reader, added_vectors[i]) == f"b.pdf parça {i}"
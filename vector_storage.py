@@ -0,0 +1,266 @@
+"""
+FAISS vektör veritabanının disk formatı.
+Vektörler FAISS'in kendi dosyasında tutulur ve okuma için bellek eşlemeli (mmap) açılır; chunk metinleri ve
+metadata'ları pickle yerine SQLite tablosunda, indeks konumuyla birlikte saklanır ve sadece arama sonucu
+dönen chunk'lar okunur. Böylece yükleme süresi derlem boyutundan neredeyse bağımsızdır, aynı dosyayı açan
+süreçler işletim sisteminin sayfa önbelleğindeki tek kopyayı paylaşır ve pickle açma riski ortadan kalkar.
+
+Her kayıt yeni bir "nesil" dosya çifti (index.<n>.faiss, docstore.<n>.sqlite) ve gerekirse ANN indeksini
+(ann.<n>.faiss, bkz. ann_index) yazar; docstore dosyası BM25 ters indeksini de içerir (bkz. lexical_index); hangi neslin geçerli olduğu manifest'te tutulur. Yazılmış dosyalar bir daha değiştirilmez, bu yüzden okuyucular kayıt sırasında
+tutarsız veri görmez.
+"""
+import json
+import os
+import pathlib
+import re
+import sqlite3
+import threading
+from collections.abc import Mapping
+
+import faiss
+from langchain.docstore.document import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+
+import lexical_index
+from ann_index import DEFAULT_INDEX_TYPE, build_ann_index, set_search_params, with_rescoring
+
+# Geçerli nesille birlikte silinmeden tutulan eski nesil sayısı; eski manifest'i okumuş bir süreç
+# dosyaları açana kadar bu dosyalar yerinde kalır.
+KEEP_PREVIOUS_GENERATIONS = 1
+
+_GENERATION_FILE = re.compile(r"^(?:index|docstore|ann|ann_template)\.(\d+)\.(?:faiss|sqlite)$")
+_SCHEMA = "CREATE TABLE IF NOT EXISTS chunks (position INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, content TEXT NOT NULL, metadata TEXT NOT NULL)"
+
+
+def storage_file_names(generation):
+    return {"index": f"index.{generation}.faiss", "docstore": f"docstore.{generation}.sqlite"}
+
+
+def storage_files(storage):
+    """Bir nesli oluşturan dosyaların adları (indeks, docstore ve varsa ANN indeksi ile şablonu)."""
+    files = [storage["index"], storage["docstore"]]
+    ann = storage.get("ann")
+    if ann:
+        files.extend(name for name in (ann["file"], ann.get("template")) if name)
+    return files
+
+
+def _write_index(index, path):
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def _open_read_only(path):
+    uri = pathlib.Path(path).absolute().as_uri() + "?mode=ro"
+    # Streamlit oturumları aynı vectorstore'u farklı thread'lerden kullanır; erişim kilitle korunur.
+    return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+    Chunk'ları salt okunur bir SQLite dosyasından okuyan docstore.
+    Dosya hiç değiştirilmez: add/delete değişiklikleri bellekte tutulur ve write() ile yeni bir dosyaya
+    yazılır. path verilmezse boş bir docstore olarak başlar.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._conn = _open_read_only(path) if path else None
+        self._lock = threading.Lock()
+        self._added = {}     # id -> Document (henüz yazılmamış)
+        self._deleted = set() # dosyada olup silinmiş id'ler
+        self._bm25 = None
+        if self._conn is not None and self._has_table(self._conn, "main", "terms"):
+            self._bm25 = lexical_index.BM25Searcher(self._read)
+
+    @staticmethod
+    def _has_table(conn, schema, table):
+        return conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+    def _read(self, query, params=()):
+        if self._conn is None:
+            return []
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    def search(self, search):
+        if search in self._added:
+            return self._added[search]
+        if search not in self._deleted:
+            rows = self._read("SELECT content, metadata FROM chunks WHERE id = ?", (search,))
+            if rows:
+                return Document(id=search, page_content=rows[0][0], metadata=json.loads(rows[0][1]))
+        return f"ID {search} not found."
+
+    def add(self, texts):
+        overlapping = [doc_id for doc_id in texts if not isinstance(self.search(doc_id), str)]
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self._added.update(texts)
+
+    def delete(self, ids):
+        for doc_id in ids:
+            if self._added.pop(doc_id, None) is None:
+                self._deleted.add(doc_id)
+
+    @property
+    def has_lexical_index(self):
+        return self._bm25 is not None
+
+    def lexical_search(self, query, k=10):
+        """Dosyaya yazılmış chunk'larda BM25 araması; bkz. lexical_index.BM25Searcher.search."""
+        if self._bm25 is None:
+            return [], 0
+        return self._bm25.search(query, k)
+
+    def index_map(self):
+        """Dosyadaki indeks konumu -> chunk id eşlemesi (FAISS.index_to_docstore_id yerine kullanılır)."""
+        return SQLiteIndexMap(self)
+
+    def write(self, path, index_to_docstore_id):
+        """
+        index_to_docstore_id'deki chunk'ları yeni bir SQLite dosyasına yazar.
+        Değişmeyen chunk'lar (ve BM25 kayıtları) mevcut dosyadan SQL ile kopyalanır, Python'a hiç okunmaz.
+        """
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute(_SCHEMA)
+            for statement in lexical_index.LEXICAL_SCHEMA:
+                conn.execute(statement)
+            conn.execute("CREATE TEMP TABLE positions (position INTEGER PRIMARY KEY, id TEXT NOT NULL)")
+            conn.executemany("INSERT INTO positions VALUES (?, ?)", [(int(position), doc_id) for position, doc_id in index_to_docstore_id.items()])
+            if self.path:
+                conn.execute("ATTACH DATABASE ? AS old", (self.path,))
+                conn.execute("INSERT INTO chunks SELECT p.position, p.id, o.content, o.metadata FROM positions p JOIN old.chunks o ON o.id = p.id")
+                if self._has_table(conn, "old", "postings"):
+                    lexical_index.copy_chunks(conn, "old", "positions")
+                else: # BM25 indeksi olmadan yazılmış eski dosya
+                    lexical_index.index_chunks(conn, conn.execute("SELECT id, content FROM chunks").fetchall())
+                conn.commit()
+                conn.execute("DETACH DATABASE old")
+            positions = {doc_id: position for position, doc_id in index_to_docstore_id.items()}
+            added = [(doc_id, doc) for doc_id, doc in self._added.items() if doc_id in positions]
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?)",
+                [(int(positions[doc_id]), doc_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False)) for doc_id, doc in added],
+            )
+            lexical_index.index_chunks(conn, [(doc_id, doc.page_content) for doc_id, doc in added])
+            lexical_index.finalize(conn)
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, path)
+
+
+class SQLiteIndexMap(Mapping):
+    """FAISS indeks konumundan chunk id'sine, SQLite üzerinden tembel eşleme."""
+
+    def __init__(self, docstore):
+        self._docstore = docstore
+
+    def __getitem__(self, position):
+        rows = self._docstore._read("SELECT id FROM chunks WHERE position = ?", (int(position),))
+        if not rows:
+            raise KeyError(position)
+        return rows[0][0]
+
+    def __iter__(self):
+        return iter(row[0] for row in self._docstore._read("SELECT position FROM chunks ORDER BY position"))
+
+    def __len__(self):
+        return self._docstore._read("SELECT COUNT(*) FROM chunks")[0][0]
+
+    def items(self):
+        # Mapping'in varsayılanı her öğe için ayrı sorgu yapar
+        return self._docstore._read("SELECT position, id FROM chunks ORDER BY position")
+
+    def values(self):
+        return [doc_id for _, doc_id in self.items()]
+
+
+def _load_trained_template(db_path, previous_storage):
+    ann = (previous_storage or {}).get("ann")
+    if not ann or not ann.get("template"):
+        return None
+    try:
+        index = faiss.read_index(os.path.join(db_path, ann["template"]))
+    except RuntimeError:
+        return None
+    return {"family": ann.get("family"), "trained_on": ann["trained_on"], "index": index}
+
+
+def save_faiss_store(vectorstore, db_path, generation, index_type=DEFAULT_INDEX_TYPE, previous_storage=None,
+                     compression=None, pca_dim=None):
+    """
+    Vectorstore'u verilen nesil numarasıyla db_path'e yazar ve manifest'e konacak depolama bilgisini döndürür.
+    index_type "flat" dışında bir değer (veya "auto" ile büyük derlem) ya da compression/pca_dim verilmişse
+    ayrı bir arama indeksi de üretilir; önceki nesildeki eğitilmiş şablon mümkünse yeniden kullanılır.
+    """
+    storage = storage_file_names(generation)
+    os.makedirs(db_path, exist_ok=True)
+    docstore = vectorstore.docstore
+    if not isinstance(docstore, SQLiteDocstore):
+        raise TypeError("vectorstore SQLiteDocstore ile oluşturulmalı")
+    docstore.write(os.path.join(db_path, storage["docstore"]), vectorstore.index_to_docstore_id)
+    _write_index(vectorstore.index, os.path.join(db_path, storage["index"]))
+
+    ann_index, template, info = build_ann_index(vectorstore.index, index_type, _load_trained_template(db_path, previous_storage),
+                                                compression=compression, pca_dim=pca_dim)
+    storage["ann"] = None
+    if ann_index is not None:
+        storage["ann"] = dict(info, file=f"ann.{generation}.faiss", template=None)
+        _write_index(ann_index, os.path.join(db_path, storage["ann"]["file"]))
+        if template is not None:
+            storage["ann"]["template"] = f"ann_template.{generation}.faiss"
+            _write_index(template, os.path.join(db_path, storage["ann"]["template"]))
+        recall = info.get("recall")
+        if recall:
+            print(f"{info['description']} indeksi: {info['vectors']} vektör, {info['nbytes'] / 2**20:.1f} MB "
+                  f"(kesin: {info['exact_nbytes'] / 2**20:.1f} MB), recall@{recall['k']}={recall['recall']:.3f}, "
+                  f"sorgu {recall['ann_ms']:.2f} ms (kesin: {recall['exact_ms']:.2f} ms)")
+    return storage
+
+
+def load_faiss_store(db_path, storage, embeddings, writable=False, search_params=None):
+    """
+    Manifest'teki dosya adlarından vectorstore'u açar.
+    Okuma için (writable=False) vektörler mmap ile, chunk eşlemesi SQLite'tan tembel olarak okunur; ANN indeksi
+    varsa aramalar onun üzerinden yapılır; kayıplı (sıkıştırılmış) indekste adaylar tam vektörlerle yeniden
+    puanlanır. search_params: set_search_params'a verilecek nprobe/ef_search/k_factor.
+    writable=True ise kesin indeks belleğe kopyalanır ve eşleme sözlüğe alınır (artımlı güncelleme için).
+    """
+    docstore = SQLiteDocstore(os.path.join(db_path, storage["docstore"]))
+    if writable:
+        index = faiss.read_index(os.path.join(db_path, storage["index"]))
+        index_to_docstore_id = dict(docstore.index_map().items())
+    else:
+        ann = storage.get("ann")
+        index_file = ann["file"] if ann else storage["index"]
+        # IVF ters listeleri IO_FLAG_MMAP ile, flat kodlar (flat ve HNSW depolaması) IO_FLAG_MMAP_IFC ile eşlenir.
+        mmap_flag = faiss.IO_FLAG_MMAP if ann and ann["type"] in ("ivf", "ivfpq") else faiss.IO_FLAG_MMAP_IFC
+        index = faiss.read_index(os.path.join(db_path, index_file), mmap_flag | faiss.IO_FLAG_READ_ONLY)
+        if ann and ann.get("rescore"):
+            exact_index = faiss.read_index(os.path.join(db_path, storage["index"]), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+            index = with_rescoring(index, exact_index)
+        set_search_params(index, **(search_params or {}))
+        index_to_docstore_id = docstore.index_map()
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def remove_old_generations(db_path, current_generation, keep=KEEP_PREVIOUS_GENERATIONS):
+    """Geçerli nesilden keep'ten fazla eski nesillerin dosyalarını ve eski pickle formatı dosyalarını siler."""
+    if not os.path.isdir(db_path):
+        return
+    for file_name in os.listdir(db_path):
+        match = _GENERATION_FILE.match(file_name)
+        if match and int(match.group(1)) >= current_generation - keep:
+            continue
+        if match or file_name in ("index.faiss", "index.pkl"):
+            try:
+                os.remove(os.path.join(db_path, file_name))
+            except OSError as e: # Dosya başka bir süreçte açık olabilir (Windows)
+                print(f"Eski indeks dosyası silinemedi ({file_name}): {e}")